@@ -0,0 +1,10 @@
+# gunicorn 設定：worker 啟動後先載入 Chroma 集合，第一則訊息不需等待索引載入
+
+
+def post_worker_init(worker):
+    import main
+
+    try:
+        main.retriever.warm_up()
+    except Exception as e:
+        worker.log.error(f"retriever warm-up failed: {e}")
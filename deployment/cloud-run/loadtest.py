@@ -0,0 +1,254 @@
+# 壓力測試：以模擬的上游 API（DeepInfra / OpenAI / LINE / Chroma）比較 Flask 與 ASGI 版本的吞吐量
+#
+# 用法：
+#   python loadtest.py --app flask --requests 400 --concurrency 100
+#   python loadtest.py --app asgi --requests 400 --concurrency 100
+#
+# 伺服器在子程序中啟動，上游呼叫以 sleep 模擬延遲，因此結果只反映服務本身能同時等待多少請求。
+
+import os
+import sys
+import time
+import json
+import uuid
+import hmac
+import base64
+import random
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import subprocess
+from types import SimpleNamespace
+
+CHANNEL_SECRET = 'loadtest-secret'
+EMBEDDING_DIM = 1024
+
+
+def fake_embedding():
+    return [random.random() for _ in range(EMBEDDING_DIM)]
+
+
+class FakeCollection:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def query(self, query_embeddings, n_results, include):
+        time.sleep(self.latency)
+        return {
+            "documents": [[f"背景資訊 {i}" for i in range(n_results)]],
+            "metadatas": [[{"video_id": f"video{i}"} for i in range(n_results)]],
+        }
+
+
+class FakeRetriever:
+    def __init__(self, latency):
+        self.collection = FakeCollection(latency)
+
+    def get_collection(self):
+        return self.collection
+
+    def warm_up(self):
+        pass
+
+
+def _completion(text):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+def patch_flask(main, args):
+    def embed(text):
+        time.sleep(args.embed_latency)
+        return fake_embedding()
+
+    def create(**kwargs):
+        time.sleep(args.llm_latency)
+        return _completion("模擬回答")
+
+    class FakeLineBotApi:
+        def reply_message(self, reply_token, message):
+            time.sleep(args.line_latency)
+
+        def push_message(self, to, message):
+            time.sleep(args.line_latency)
+
+    main.embedding_cache.embed_fn = embed
+    main.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    main.line_bot_api = FakeLineBotApi()
+    main.retriever = FakeRetriever(args.retriever_latency)
+
+
+def patch_asgi(main_asgi, args):
+    async def embed(text):
+        await asyncio.sleep(args.embed_latency)
+        return fake_embedding()
+
+    async def create(**kwargs):
+        await asyncio.sleep(args.llm_latency)
+        return _completion("模擬回答")
+
+    class FakeApiClient:
+        def __init__(self, configuration):
+            pass
+
+        async def close(self):
+            pass
+
+    class FakeMessagingApi:
+        def __init__(self, api_client):
+            pass
+
+        async def reply_message(self, reply_message_request):
+            await asyncio.sleep(args.line_latency)
+
+    # lifespan 啟動時才建立 LINE 客戶端，因此替換模組上的類別
+    main_asgi.AsyncApiClient = FakeApiClient
+    main_asgi.AsyncMessagingApi = FakeMessagingApi
+    main_asgi.embedding_cache.async_embed_fn = embed
+    main_asgi.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    main_asgi.retriever = FakeRetriever(args.retriever_latency)
+
+
+def serve(args):
+    """子程序：匯入服務、替換上游 API 後啟動伺服器"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    if args.app == 'flask':
+        from gunicorn.app.base import BaseApplication
+        import main
+
+        patch_flask(main, args)
+
+        class StandaloneApplication(BaseApplication):
+            def load_config(self):
+                # 與 Dockerfile 相同的設定
+                self.cfg.set('bind', f'127.0.0.1:{args.port}')
+                self.cfg.set('workers', 1)
+                self.cfg.set('threads', 8)
+                self.cfg.set('timeout', 0)
+                self.cfg.set('loglevel', 'warning')
+
+            def load(self):
+                return main.app
+
+        StandaloneApplication().run()
+    else:
+        import uvicorn
+        import main_asgi
+
+        patch_asgi(main_asgi, args)
+        uvicorn.run(main_asgi.app, host='127.0.0.1', port=args.port, log_level='warning')
+
+
+def make_body(text, user_id):
+    event = {
+        "type": "message",
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": user_id},
+        "webhookEventId": uuid.uuid4().hex,
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": uuid.uuid4().hex,
+        "message": {"type": "text", "id": str(random.randint(10**15, 10**16)), "quoteToken": uuid.uuid4().hex, "text": text},
+    }
+    return json.dumps({"destination": "U" + uuid.uuid4().hex, "events": [event]}, ensure_ascii=False)
+
+
+def sign(body):
+    digest = hmac.new(CHANNEL_SECRET.encode('utf-8'), body.encode('utf-8'), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode('utf-8')
+
+
+async def wait_until_ready(session, base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            async with session.get(f"{base_url}/health") as resp:
+                if resp.status == 200:
+                    return
+        except Exception:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("server did not become ready")
+
+
+async def run_load(args):
+    import aiohttp
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    latencies = []
+    statuses = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def send(session, i):
+        # 每個請求使用不同的使用者與問題，避免命中快取或共用對話紀錄
+        body = make_body(f"壓力測試問題 {i} {uuid.uuid4().hex}", "U" + uuid.uuid4().hex)
+        headers = {"Content-Type": "application/json", "X-Line-Signature": sign(body)}
+        async with semaphore:
+            t1 = time.time()
+            async with session.post(f"{base_url}/callback", data=body.encode('utf-8'), headers=headers) as resp:
+                await resp.read()
+                latencies.append(time.time() - t1)
+                statuses[resp.status] = statuses.get(resp.status, 0) + 1
+
+    timeout = aiohttp.ClientTimeout(total=None)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        await wait_until_ready(session, base_url)
+        t0 = time.time()
+        await asyncio.gather(*(send(session, i) for i in range(args.requests)))
+        elapsed = time.time() - t0
+
+    latencies.sort()
+    return {
+        "app": args.app,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "statuses": statuses,
+        "elapsed_seconds": round(elapsed, 2),
+        "requests_per_second": round(args.requests / elapsed, 2),
+        "p50_ms": round(1000 * latencies[len(latencies) // 2], 1),
+        "p95_ms": round(1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LINE bot webhook load test")
+    parser.add_argument('--app', choices=['flask', 'asgi'], default='asgi')
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--embed-latency', type=float, default=0.1)
+    parser.add_argument('--llm-latency', type=float, default=2.0)
+    parser.add_argument('--line-latency', type=float, default=0.1)
+    parser.add_argument('--retriever-latency', type=float, default=0.005)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    env = {
+        **os.environ,
+        "CHANNEL_SECRET": CHANNEL_SECRET,
+        "CHANNEL_ACCESS_TOKEN": "loadtest",
+        "OPENAI_API_KEY": "loadtest",
+        "DEEPINFRA_API_KEY": "loadtest",
+        # 對話紀錄寫入本機暫存目錄，不連線到 GCS
+        "LOCAL_STORAGE_DIR": os.path.join(workdir, "storage"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embeddings.sqlite3"),
+    }
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', *sys.argv[1:]], env=env)
+    try:
+        result = asyncio.run(run_load(args))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,32 +4,52 @@ sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
 
 import os
 import json
+import time
 import hmac
 import hashlib
 import base64
-from datetime import datetime, timedelta, timezone
-from typing import List, Dict
-import chromadb
+from typing import List, Dict, Optional
+from pathlib import Path
 from openai import OpenAI
 from linebot import LineBotApi, WebhookHandler
-from linebot.exceptions import InvalidSignatureError
+from linebot.exceptions import InvalidSignatureError, LineBotApiError
 from linebot.models import MessageEvent, TextMessage, TextSendMessage
-import pandas as pd
-from google.cloud import storage
+from linebot.v3.messaging import ApiClient, Configuration, MessagingApi, ShowLoadingAnimationRequest
 from google.oauth2 import service_account
 from flask import Flask, request, abort, jsonify
-from io import StringIO
+
+# 將專案根目錄加入 Python 路徑以供匯入（部署時 src/utils 會由部署腳本複製進映像）
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils import (
+    SegmentedChatLog, ChatHistoryStore, BlobHistoryBacking, RetrieverCache,
+    EmbeddingCache, deepinfra_embed_fn, SemanticResponseCache, make_context_key,
+    InProcessWorkQueue, StagePipeline, StreamChunker, get_storage, video_url, get_chat_room_id
+)
 
 # 常數定義
-CHROMA_DB = 'Cofit211-cosine'
+CHROMA_DB = os.environ.get('CHROMA_DB', 'Cofit211-cosine')
+# chroma 或 dense（memory-mapped 向量矩陣，需先以 src/others/export_dense_index.py 匯出）
+RETRIEVER_BACKEND = os.environ.get('RETRIEVER_BACKEND', 'chroma')
 CHAT_MODEL_NAME = "gpt-4o-mini"
+ERROR_MESSAGE = "抱歉,發生了一個錯誤"
+
+# 非同步模式：收到 webhook 後立即回應 200，再由工作執行緒產生回覆
+ASYNC_WEBHOOK = os.environ.get('ASYNC_WEBHOOK', '0') == '1'
+
+# 串流模式：顯示載入動畫，第一個段落以 reply 送出，其餘內容在句尾切分後以 push 送出
+STREAM_REPLY = os.environ.get('STREAM_REPLY', '0') == '1'
 GCS_BUCKET_NAME = 'ian-line-bot-files'
 GCS_FILE_PATH = 'messages-health.csv'
+GCS_LOG_PREFIX = 'messages-health'
 
 # Line Bot 設定
 line_bot_api = LineBotApi(os.environ.get('CHANNEL_ACCESS_TOKEN'))
 channel_secret = os.environ.get('CHANNEL_SECRET')
 handler = WebhookHandler(channel_secret)
+# 載入動畫只有 v3 API 提供
+messaging_api = MessagingApi(ApiClient(Configuration(access_token=os.environ.get('CHANNEL_ACCESS_TOKEN'))))
 
 # OpenAI 設定
 client = OpenAI(
@@ -42,23 +62,40 @@ deepinfra_client = OpenAI(
     base_url = "https://api.deepinfra.com/v1/openai",
 )
 
+# 查詢 embedding 快取（記憶體 LRU + 磁碟），EMBEDDING_CACHE_PATH 可指向掛載的磁碟讓快取跨容器重啟保留
+embedding_cache = EmbeddingCache(deepinfra_embed_fn(deepinfra_client), db_path=os.environ.get('EMBEDDING_CACHE_PATH', '/tmp/embeddings.sqlite3'))
+
+# 對話紀錄設定（每則訊息寫入一個片段，背景定期壓縮）
+log_storage = get_storage(GCS_BUCKET_NAME)
+chat_log = SegmentedChatLog(log_storage, prefix=GCS_LOG_PREFIX, legacy_name=GCS_FILE_PATH)
+chat_log.start_compactor()
+
+# 每個聊天室最近 5 輪對話的索引，查詢時不需掃描整份紀錄
+history_store = ChatHistoryStore(max_turns=5, backing=BlobHistoryBacking(log_storage, prefix=GCS_LOG_PREFIX))
+
+# 語意回答快取：沒有先前對話且問題與背景資訊都幾乎相同時，直接重用先前的回答
+response_cache = SemanticResponseCache(threshold=float(os.environ.get('RESPONSE_CACHE_THRESHOLD', 0.95)))
+
+# 程序內共用的 Chroma 集合，只載入一次索引，磁碟上的資料庫更新時自動重新載入
+retriever = RetrieverCache('./', CHROMA_DB, backend=RETRIEVER_BACKEND)
+
+# 非同步模式的有界工作佇列，佇列滿時回應 503 讓 LINE 重送
+work_queue = InProcessWorkQueue(
+    workers=int(os.environ.get('WORKER_THREADS', 8)),
+    max_size=int(os.environ.get('WORK_QUEUE_SIZE', 100)),
+)
+
 app = Flask(__name__)
 
 def get_embedding(text: str) -> List[float]:
-    embeddings = deepinfra_client.embeddings.create(
-        model="BAAI/bge-m3",
-        input=text,
-        encoding_format="float"
-    )
-    return embeddings.data[0].embedding
+    return embedding_cache.get_embedding(text)
 
 def configure_retriever():
-    client = chromadb.PersistentClient(path='./')
-    collection = client.get_collection(name=CHROMA_DB)
-    return collection
+    return retriever.get_collection()
 
-def get_relevant_documents(query: str, collection, top_k: int = 3) -> List[Dict]:
-    query_embedding = get_embedding(query)
+def get_relevant_documents(query: str, collection, top_k: int = 3, query_embedding: List[float] = None) -> List[Dict]:
+    if query_embedding is None:
+        query_embedding = get_embedding(query)
     results = collection.query(
         query_embeddings=[query_embedding],
         n_results=top_k,
@@ -80,65 +117,55 @@ def generate_response(messages: List[Dict]) -> str:
         return chat_completion.choices[0].message.content
     except Exception as e:
         print(f"OpenAI API 錯誤: {str(e)}")
-        return f"抱歉,發生了一個錯誤: {str(e)}"
+        return f"{ERROR_MESSAGE}: {str(e)}"
 
-def log_message_to_gcs(user_input, gpt_output, chat_room_id, blob):
-    taipei_time = datetime.now(timezone.utc) + timedelta(hours=8)
-    
-    new_row = {
-        "timestamp": taipei_time.strftime('%Y-%m-%d %H:%M:%S'),
-        "chat_room_id": chat_room_id,
-        "user_input": user_input,
-        "gpt_output": gpt_output
-    }
-    
-    if blob.exists():
-        content = blob.download_as_text()
-        df = pd.read_csv(StringIO(content))
-    else:
-        df = pd.DataFrame(columns=["timestamp", "chat_room_id", "user_input", "gpt_output"])
-    
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    
-    blob.upload_from_string(df.to_csv(index=False), 'text/csv')
-
-def get_chat_history(chat_room_id, blob):
-    if blob.exists():
-        content = blob.download_as_text()
-        df = pd.read_csv(StringIO(content))
-        
-        chat_history = df[df['chat_room_id'] == chat_room_id].tail(5)
-        
-        formatted_history = []
-        for _, row in chat_history.iterrows():
-            if row['gpt_output'] == '。':
-                formatted_history = []
-            else:
-                formatted_history.append(f"時間: {row['timestamp']}")
-                formatted_history.append(f"使用者: {row['user_input']}")
-                formatted_history.append(f"AI: {row['gpt_output']}")
-                formatted_history.append("---")
-            
-        formatted_history_embedding_use = []
-        if not chat_history.empty:
-            last_row = chat_history.iloc[-1]
-            formatted_history_embedding_use.append(f"使用者: {last_row['user_input']}")
-            formatted_history_embedding_use.append(f"AI: {last_row['gpt_output']}")
-        
-        return "\n".join(formatted_history), "\n".join(formatted_history_embedding_use)
-    else:
-        return "", ""
+def generate_response_stream(messages: List[Dict], status: Optional[Dict] = None):
+    """逐段產生模型輸出；失敗時最後一段為錯誤訊息，並將 status["failed"] 設為 True（可能已輸出部分內容）"""
+    try:
+        chat_completion = client.chat.completions.create(
+            model=CHAT_MODEL_NAME,
+            messages=messages,
+            temperature=0,
+            stream=True
+        )
+        for chunk in chat_completion:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        print(f"OpenAI API 錯誤: {str(e)}")
+        if status is not None:
+            status["failed"] = True
+        yield f"{ERROR_MESSAGE}: {str(e)}"
+
+def log_message_to_gcs(user_input, gpt_output, chat_room_id):
+    chat_log.append(user_input, gpt_output, chat_room_id)
+    history_store.append(chat_room_id, user_input, gpt_output)
+
+def get_chat_history(chat_room_id):
+    return history_store.format_history(chat_room_id)
 
 @app.route("/health", methods=['GET'])
 def health_check():
     """Cloud Run 的健康檢查端點"""
     return jsonify({"status": "healthy"}), 200
 
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    return jsonify({
+        "embedding_cache": embedding_cache.get_stats(),
+        "response_cache": response_cache.get_stats(),
+        "work_queue": work_queue.get_stats(),
+        "pipeline": message_pipeline.get_stats(),
+    }), 200
+
 @app.route("/callback", methods=['POST'])
 def callback():
     signature = request.headers.get('X-Line-Signature', '')
     body = request.get_data(as_text=True)
 
+    if ASYNC_WEBHOOK:
+        return enqueue_events(body, signature)
+
     try:
         handler.handle(body, signature)
     except InvalidSignatureError:
@@ -146,51 +173,199 @@ def callback():
 
     return 'OK'
 
+def enqueue_events(body, signature):
+    try:
+        events = handler.parser.parse(body, signature)
+    except InvalidSignatureError:
+        abort(400)
+
+    events = [e for e in events if isinstance(e, MessageEvent) and isinstance(e.message, TextMessage)]
+    # 整批放入或整批拒絕：只放入一部分再回 503 時，LINE 重送整批會讓已放入的事件被回答兩次。
+    # 以聊天室為 key，同一聊天室的訊息由同一個執行緒依序處理，對話紀錄的順序不會錯亂
+    payloads = [event.as_json_dict() for event in events]
+    if not work_queue.submit_batch('message', [(get_chat_room_id(payload), payload) for payload in payloads]):
+        return 'Service Unavailable', 503
+
+    return 'OK'
+
+def handle_queued_message(payload):
+    handle_message(MessageEvent.new_from_json_dict(payload))
+
+work_queue.register('message', handle_queued_message)
+
+def reply_message(event, chat_room_id, message):
+    try:
+        line_bot_api.reply_message(event.reply_token, message)
+    except LineBotApiError as e:
+        if not ASYNC_WEBHOOK:
+            raise
+        # 非同步處理時 reply token 可能已過期，改用 push 訊息
+        print(f"reply 失敗，改用 push: {str(e)}")
+        line_bot_api.push_message(chat_room_id, message)
+
+def stage_history(chat_room_id):
+    return get_chat_history(chat_room_id)
+
+def stage_collection():
+    return configure_retriever()
+
+def stage_speculative_embedding(chat_room_id, user_input):
+    # 沒有先前對話時查詢文字就是 user_input，與讀取對話紀錄同時先行計算；失敗時不影響正式流程。
+    # 快取中已知有對話紀錄（進行中的對話）時查詢文字會包含紀錄，預先計算的結果用不到，不呼叫 API
+    if history_store.peek_has_history(chat_room_id):
+        return None
+    try:
+        return get_embedding(user_input)
+    except Exception as e:
+        print(f"預先計算 embedding 失敗: {str(e)}")
+        return None
+
+def stage_query_embedding(history, user_input):
+    # 沒有先前對話時與預先計算的文字正規化後相同，會直接命中快取或等待同一個查詢
+    chat_history, chat_history_embedding_use = history
+    cumulative_query = chat_history_embedding_use + '\n' + user_input
+    return get_embedding(cumulative_query)
+
+def stage_documents(collection, query_embedding):
+    return get_relevant_documents(None, collection, top_k=3, query_embedding=query_embedding)
+
+def build_messages(chat_history, user_input, relevant_docs):
+    context = relevant_docs[0]['page_content'] if relevant_docs else ""
+    return [
+        {"role": "system", "content": f"你是一位專業的健康、醫療和飲食相關的諮詢師。用繁體中文回覆。可以參考以下背景資訊但不限於此來回答問題:\n\n{context}\n除了以上資訊你可以再進行補充，回答不用過長，回答得有結構及完整就好。必要時可以跟使用者詢問更多資訊來提供給你。"},
+        {"role": "user", "content": f"之前的對話紀錄：\n{chat_history}\n\n使用者的最新問題：{user_input}"}
+    ]
+
+def format_video_links(relevant_docs):
+    # 將 YouTube URL 加入回覆中
+    youtube_urls = []
+    for doc in relevant_docs:
+        if 'video_id' in doc['metadata']:
+            # 有時間資訊的 chunk 直接連到影片中的該段落
+            youtube_url = video_url(doc['metadata'])
+            youtube_urls.append(youtube_url)
+
+    if youtube_urls:
+        return "\n\n推薦影片：\n" + "\n".join(youtube_urls)
+    return ""
+
+def stage_answer(history, user_input, documents, query_embedding):
+    chat_history, chat_history_embedding_use = history
+    relevant_docs = documents
+    messages_for_ai = build_messages(chat_history, user_input, relevant_docs)
+
+    context_key = make_context_key(relevant_docs)
+    GPT_output = response_cache.lookup(query_embedding, context_key, has_history=bool(chat_history))
+    if GPT_output is None:
+        t1 = time.time()
+        GPT_output = generate_response(messages_for_ai)
+        if not GPT_output.startswith(ERROR_MESSAGE):
+            response_cache.store(query_embedding, context_key, GPT_output, time.time() - t1,
+                                 has_history=bool(chat_history))
+    GPT_output = GPT_output.replace('*', '').replace('#', '')
+
+    return GPT_output + format_video_links(relevant_docs)
+
+# 每則訊息的處理流程：讀取對話紀錄、載入索引與預先計算 embedding 同時進行
+message_pipeline = (
+    StagePipeline(max_workers=int(os.environ.get('PIPELINE_THREADS', 32)))
+    .stage('history', stage_history, deps=['chat_room_id'])
+    .stage('collection', stage_collection)
+    .stage('speculative_embedding', stage_speculative_embedding, deps=['chat_room_id', 'user_input'])
+    .stage('query_embedding', stage_query_embedding, deps=['history', 'user_input'])
+    .stage('documents', stage_documents, deps=['collection', 'query_embedding'])
+    .stage('answer', stage_answer, deps=['history', 'user_input', 'documents', 'query_embedding'])
+)
+
 @handler.add(MessageEvent, message=TextMessage)
 def handle_message(event):
     user_input = event.message.text
     chat_room_id = event.source.group_id if hasattr(event.source, 'group_id') else event.source.user_id
 
-    client = storage.Client()
-    bucket = client.get_bucket(GCS_BUCKET_NAME)
-    blob = bucket.blob(GCS_FILE_PATH)
-    
     if user_input == 'reset':
         user_input = '。'
         GPT_output = '。'
+    elif STREAM_REPLY:
+        GPT_output = stream_answer(event, chat_room_id, user_input)
+        log_message_to_gcs(user_input, GPT_output, chat_room_id)
+        return 'OK'
     else:
-        chat_history, chat_history_embedding_use = get_chat_history(chat_room_id, blob)
-        
-        collection = configure_retriever()
-        
-        cumulative_query = chat_history_embedding_use + '\n' + user_input
-        relevant_docs = get_relevant_documents(cumulative_query, collection, top_k=3)
-        context = relevant_docs[0]['page_content'] if relevant_docs else ""
-
-        messages_for_ai = [
-            {"role": "system", "content": f"你是一位專業的健康、醫療和飲食相關的諮詢師。用繁體中文回覆。可以參考以下背景資訊但不限於此來回答問題:\n\n{context}\n除了以上資訊你可以再進行補充，回答不用過長，回答得有結構及完整就好。必要時可以跟使用者詢問更多資訊來提供給你。"},
-            {"role": "user", "content": f"之前的對話紀錄：\n{chat_history}\n\n使用者的最新問題：{user_input}"}
-        ]
-        
-        GPT_output = generate_response(messages_for_ai)
-        GPT_output = GPT_output.replace('*', '').replace('#', '')
-        
-        # 將 YouTube URL 加入回覆中
-        youtube_urls = []
-        for doc in relevant_docs:
-            if 'video_id' in doc['metadata']:
-                video_id = doc['metadata']['video_id']
-                youtube_url = f"https://www.youtube.com/watch?v={video_id}"
-                youtube_urls.append(youtube_url)
-        
-        if youtube_urls:
-            GPT_output += "\n\n推薦影片：\n" + "\n".join(youtube_urls)
-
-    log_message_to_gcs(user_input, GPT_output, chat_room_id, blob)
+        run = message_pipeline.run(chat_room_id=chat_room_id, user_input=user_input)
+        print(f"pipeline {run.format_timings()}")
+        GPT_output = run['answer']
+
+    log_message_to_gcs(user_input, GPT_output, chat_room_id)
     
-    line_bot_api.reply_message(event.reply_token, TextSendMessage(GPT_output))
+    reply_message(event, chat_room_id, TextSendMessage(GPT_output))
 
     return 'OK'
 
+def show_loading_animation(chat_room_id):
+    # 載入動畫只支援一對一聊天
+    if not chat_room_id.startswith('U'):
+        return
+    try:
+        messaging_api.show_loading_animation(
+            ShowLoadingAnimationRequest(chat_id=chat_room_id, loading_seconds=60)
+        )
+    except Exception as e:
+        print(f"載入動畫顯示失敗: {str(e)}")
+
+def stream_answer(event, chat_room_id, user_input):
+    """串流產生回覆並分段送出，回傳完整的回覆內容"""
+    t0 = time.time()
+    show_loading_animation(chat_room_id)
+
+    run = message_pipeline.run(targets=['documents', 'speculative_embedding'],
+                               chat_room_id=chat_room_id, user_input=user_input)
+    chat_history, chat_history_embedding_use = run['history']
+    relevant_docs = run['documents']
+    query_embedding = run['query_embedding']
+    video_links = format_video_links(relevant_docs)
+
+    context_key = make_context_key(relevant_docs)
+    cached_output = response_cache.lookup(query_embedding, context_key, has_history=bool(chat_history))
+    if cached_output is not None:
+        GPT_output = cached_output.replace('*', '').replace('#', '') + video_links
+        reply_message(event, chat_room_id, TextSendMessage(GPT_output))
+        return GPT_output
+
+    replied = False
+    first_chunk_seconds = None
+
+    def send(text):
+        nonlocal replied, first_chunk_seconds
+        if not replied:
+            reply_message(event, chat_room_id, TextSendMessage(text))
+            replied = True
+            first_chunk_seconds = time.time() - t0
+            # reply 送出後動畫會消失，還有後續內容時重新顯示
+            show_loading_animation(chat_room_id)
+        else:
+            line_bot_api.push_message(chat_room_id, TextSendMessage(text))
+
+    chunker = StreamChunker()
+    full_output = ""
+    stream_status = {"failed": False}
+    t1 = time.time()
+    for delta in generate_response_stream(build_messages(chat_history, user_input, relevant_docs), stream_status):
+        full_output += delta
+        for chunk in chunker.feed(delta.replace('*', '').replace('#', '')):
+            send(chunk)
+    generation_seconds = time.time() - t1
+    for chunk in chunker.feed(video_links) + chunker.flush():
+        send(chunk)
+    if not replied:
+        send(ERROR_MESSAGE)
+
+    # 串流中途失敗時 full_output 是部分回答加上錯誤訊息，不可快取
+    if full_output and not stream_status["failed"]:
+        response_cache.store(query_embedding, context_key, full_output, generation_seconds,
+                             has_history=bool(chat_history))
+    print(f"stream {run.format_timings()} first_message={1000 * (first_chunk_seconds or 0):.0f}ms "
+          f"total={1000 * (time.time() - t0):.0f}ms")
+
+    return full_output.replace('*', '').replace('#', '') + video_links
+
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
\ No newline at end of file
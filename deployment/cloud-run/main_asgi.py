@@ -0,0 +1,228 @@
+__import__('pysqlite3')
+import sys
+sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+
+# main.py 的 ASGI 版本：OpenAI / DeepInfra / LINE 皆使用非同步客戶端，等待上游 API 時不佔用執行緒。
+# GCS 與 Chroma 仍是同步 I/O，由專用的 I/O 執行緒池執行（IO_THREADS，預設 64）；
+# 預設 executor 在 1 vCPU 的 Cloud Run 實例上只有 5 個執行緒，會限制同時處理的對話數
+# 執行：uvicorn main_asgi:app --host 0.0.0.0 --port 8080
+
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List, Dict
+from pathlib import Path
+from openai import AsyncOpenAI
+from linebot.v3.webhook import WebhookParser
+from linebot.v3.exceptions import InvalidSignatureError
+from linebot.v3.webhooks import MessageEvent, TextMessageContent
+from linebot.v3.messaging import (
+    AsyncApiClient, AsyncMessagingApi, Configuration, ReplyMessageRequest, TextMessage
+)
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+# 將專案根目錄加入 Python 路徑以供匯入（部署時 src/utils 會由部署腳本複製進映像）
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils import (
+    SegmentedChatLog, ChatHistoryStore, BlobHistoryBacking, RetrieverCache,
+    EmbeddingCache, deepinfra_async_embed_fn, SemanticResponseCache, make_context_key,
+    get_storage, video_url
+)
+
+# 常數定義
+CHROMA_DB = os.environ.get('CHROMA_DB', 'Cofit211-cosine')
+# chroma 或 dense（memory-mapped 向量矩陣，需先以 src/others/export_dense_index.py 匯出）
+RETRIEVER_BACKEND = os.environ.get('RETRIEVER_BACKEND', 'chroma')
+CHAT_MODEL_NAME = "gpt-4o-mini"
+GCS_BUCKET_NAME = 'ian-line-bot-files'
+GCS_FILE_PATH = 'messages-health.csv'
+GCS_LOG_PREFIX = 'messages-health'
+ERROR_MESSAGE = "抱歉,發生了一個錯誤"
+# 同步 I/O（GCS、Chroma、embedding 磁碟快取）的執行緒數，在 lifespan 中設為事件迴圈的預設 executor
+IO_THREADS = int(os.environ.get('IO_THREADS', 64))
+
+# Line Bot 設定（AsyncMessagingApi 需在事件迴圈啟動後建立）
+parser = WebhookParser(os.environ.get('CHANNEL_SECRET'))
+line_configuration = Configuration(access_token=os.environ.get('CHANNEL_ACCESS_TOKEN'))
+line_bot_api = None
+
+# OpenAI 設定
+client = AsyncOpenAI(
+    api_key = os.environ.get('OPENAI_API_KEY'),
+)
+
+# DeepInfra 設定
+deepinfra_client = AsyncOpenAI(
+    api_key = os.environ.get('DEEPINFRA_API_KEY'),
+    base_url = "https://api.deepinfra.com/v1/openai",
+)
+
+# 查詢 embedding 快取（記憶體 LRU + 磁碟），EMBEDDING_CACHE_PATH 可指向掛載的磁碟讓快取跨容器重啟保留
+embedding_cache = EmbeddingCache(None, async_embed_fn=deepinfra_async_embed_fn(deepinfra_client),
+                                 db_path=os.environ.get('EMBEDDING_CACHE_PATH', '/tmp/embeddings.sqlite3'))
+
+# 對話紀錄設定（每則訊息寫入一個片段，背景定期壓縮）
+log_storage = get_storage(GCS_BUCKET_NAME)
+chat_log = SegmentedChatLog(log_storage, prefix=GCS_LOG_PREFIX, legacy_name=GCS_FILE_PATH)
+chat_log.start_compactor()
+
+# 每個聊天室最近 5 輪對話的索引，查詢時不需掃描整份紀錄
+history_store = ChatHistoryStore(max_turns=5, backing=BlobHistoryBacking(log_storage, prefix=GCS_LOG_PREFIX))
+
+# 語意回答快取：沒有先前對話且問題與背景資訊都幾乎相同時，直接重用先前的回答
+response_cache = SemanticResponseCache(threshold=float(os.environ.get('RESPONSE_CACHE_THRESHOLD', 0.95)))
+
+# 程序內共用的 Chroma 集合，只載入一次索引，磁碟上的資料庫更新時自動重新載入
+retriever = RetrieverCache('./', CHROMA_DB, backend=RETRIEVER_BACKEND)
+
+def get_relevant_documents(query_embedding: List[float], top_k: int = 3) -> List[Dict]:
+    # Chroma 查詢為同步呼叫，由 asyncio.to_thread 在 I/O 執行緒池中執行
+    results = retriever.get_collection().query(
+        query_embeddings=[query_embedding],
+        n_results=top_k,
+        include=["documents", "metadatas"]
+    )
+    documents = [
+        {"page_content": doc, "metadata": meta}
+        for doc, meta in zip(results['documents'][0], results['metadatas'][0])
+    ]
+    return documents
+
+async def generate_response(messages: List[Dict]) -> str:
+    try:
+        chat_completion = await client.chat.completions.create(
+            model=CHAT_MODEL_NAME,
+            messages=messages,
+            temperature=0
+        )
+        return chat_completion.choices[0].message.content
+    except Exception as e:
+        print(f"OpenAI API 錯誤: {str(e)}")
+        return f"{ERROR_MESSAGE}: {str(e)}"
+
+def log_message_to_gcs(user_input, gpt_output, chat_room_id):
+    chat_log.append(user_input, gpt_output, chat_room_id)
+    history_store.append(chat_room_id, user_input, gpt_output)
+
+async def handle_message(event):
+    user_input = event.message.text
+    chat_room_id = event.source.group_id if hasattr(event.source, 'group_id') else event.source.user_id
+
+    if user_input == 'reset':
+        user_input = '。'
+        GPT_output = '。'
+    else:
+        chat_history, chat_history_embedding_use = await asyncio.to_thread(history_store.format_history, chat_room_id)
+
+        cumulative_query = chat_history_embedding_use + '\n' + user_input
+        query_embedding = await embedding_cache.aget_embedding(cumulative_query)
+        relevant_docs = await asyncio.to_thread(get_relevant_documents, query_embedding, 3)
+        context = relevant_docs[0]['page_content'] if relevant_docs else ""
+
+        messages_for_ai = [
+            {"role": "system", "content": f"你是一位專業的健康、醫療和飲食相關的諮詢師。用繁體中文回覆。可以參考以下背景資訊但不限於此來回答問題:\n\n{context}\n除了以上資訊你可以再進行補充，回答不用過長，回答得有結構及完整就好。必要時可以跟使用者詢問更多資訊來提供給你。"},
+            {"role": "user", "content": f"之前的對話紀錄：\n{chat_history}\n\n使用者的最新問題：{user_input}"}
+        ]
+
+        context_key = make_context_key(relevant_docs)
+        GPT_output = response_cache.lookup(query_embedding, context_key, has_history=bool(chat_history))
+        if GPT_output is None:
+            t1 = time.time()
+            GPT_output = await generate_response(messages_for_ai)
+            if not GPT_output.startswith(ERROR_MESSAGE):
+                response_cache.store(query_embedding, context_key, GPT_output, time.time() - t1,
+                                     has_history=bool(chat_history))
+        GPT_output = GPT_output.replace('*', '').replace('#', '')
+
+        # 將 YouTube URL 加入回覆中
+        youtube_urls = []
+        for doc in relevant_docs:
+            if 'video_id' in doc['metadata']:
+                # 有時間資訊的 chunk 直接連到影片中的該段落
+                youtube_url = video_url(doc['metadata'])
+                youtube_urls.append(youtube_url)
+
+        if youtube_urls:
+            GPT_output += "\n\n推薦影片：\n" + "\n".join(youtube_urls)
+
+    await asyncio.to_thread(log_message_to_gcs, user_input, GPT_output, chat_room_id)
+
+    await line_bot_api.reply_message(
+        ReplyMessageRequest(reply_token=event.reply_token, messages=[TextMessage(text=GPT_output)])
+    )
+
+async def handle_room_events(events):
+    # 同一聊天室的訊息依序處理，確保每則回覆都看得到前一則的對話紀錄
+    for event in events:
+        await handle_message(event)
+
+async def health_check(request):
+    """Cloud Run 的健康檢查端點"""
+    return JSONResponse({"status": "healthy"})
+
+async def metrics(request):
+    return JSONResponse({
+        "embedding_cache": embedding_cache.get_stats(),
+        "response_cache": response_cache.get_stats(),
+    })
+
+async def callback(request):
+    signature = request.headers.get('X-Line-Signature', '')
+    body = (await request.body()).decode('utf-8')
+
+    try:
+        events = parser.parse(body, signature)
+    except InvalidSignatureError:
+        return PlainTextResponse('Bad Request', status_code=400)
+
+    rooms = OrderedDict()
+    for event in events:
+        if isinstance(event, MessageEvent) and isinstance(event.message, TextMessageContent):
+            chat_room_id = event.source.group_id if hasattr(event.source, 'group_id') else event.source.user_id
+            rooms.setdefault(chat_room_id, []).append(event)
+    # 不同聊天室同時處理，單一聊天室失敗不影響其他聊天室
+    results = await asyncio.gather(*(handle_room_events(room_events) for room_events in rooms.values()),
+                                   return_exceptions=True)
+    errors = [e for e in results if isinstance(e, Exception)]
+    for e in errors:
+        print(f"發生錯誤：{type(e).__name__} - {str(e)}")
+    if errors:
+        return PlainTextResponse('Internal Server Error', status_code=500)
+
+    return PlainTextResponse('OK')
+
+@asynccontextmanager
+async def lifespan(app):
+    global line_bot_api
+    # asyncio.to_thread 與 run_in_executor(None, ...) 都使用這個 executor
+    io_executor = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="io")
+    asyncio.get_running_loop().set_default_executor(io_executor)
+    api_client = AsyncApiClient(line_configuration)
+    line_bot_api = AsyncMessagingApi(api_client)
+    try:
+        await asyncio.to_thread(retriever.warm_up)
+    except Exception as e:
+        print(f"retriever warm-up failed: {e}")
+    yield
+    await api_client.close()
+    io_executor.shutdown(wait=False)
+
+app = Starlette(
+    routes=[
+        Route("/health", health_check, methods=["GET"]),
+        Route("/metrics", metrics, methods=["GET"]),
+        Route("/callback", callback, methods=["POST"]),
+    ],
+    lifespan=lifespan,
+)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
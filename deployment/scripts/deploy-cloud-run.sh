@@ -13,6 +13,12 @@ MEMORY="1Gi"
 CPU="1"
 MAX_INSTANCES="10"
 PORT="8080"
+# 設為 1 時啟用非同步 webhook（需要常駐 CPU，回應 200 後背景執行緒才不會被節流）
+ASYNC_WEBHOOK="${ASYNC_WEBHOOK:-0}"
+# 設為 1 時以串流方式分段回覆
+STREAM_REPLY="${STREAM_REPLY:-0}"
+# 要查詢的 Chroma 集合（{頻道}-cosine）
+CHROMA_DB="${CHROMA_DB:-Cofit211-cosine}"
 
 # 輸出顏色
 RED='\033[0;31m'
@@ -41,6 +47,17 @@ if [ -z "$PROJECT_ID" ]; then
     exit 1
 fi
 
+# 同步共用模組
+echo -e "${YELLOW}📦 同步共用模組...${NC}"
+./deployment/scripts/sync-shared.sh deployment/cloud-run
+SHARED_DIR="$(pwd)/deployment/cloud-run/src"
+trap 'rm -rf "$SHARED_DIR"' EXIT
+
+CPU_FLAGS=""
+if [ "$ASYNC_WEBHOOK" = "1" ]; then
+    CPU_FLAGS="--no-cpu-throttling"
+fi
+
 # 使用 Cloud Build 建置和部署
 echo -e "${YELLOW}🏗️  使用 Cloud Build 建置和部署...${NC}"
 cd deployment/cloud-run
@@ -54,7 +71,8 @@ gcloud run deploy $SERVICE_NAME \
     --max-instances=$MAX_INSTANCES \
     --port=$PORT \
     --allow-unauthenticated \
-    --set-env-vars="PORT=$PORT"
+    $CPU_FLAGS \
+    --set-env-vars="PORT=$PORT,ASYNC_WEBHOOK=$ASYNC_WEBHOOK,STREAM_REPLY=$STREAM_REPLY,CHROMA_DB=$CHROMA_DB"
 
 echo -e "${GREEN}✅ Cloud Run 服務部署成功！${NC}"
 
@@ -49,7 +49,7 @@ gcloud functions deploy $FUNCTION_NAME \
     --timeout=$TIMEOUT \
     --region=$REGION \
     --allow-unauthenticated \
-    --set-env-vars="PYTHONPATH=/workspace" \
+    --set-env-vars="PYTHONPATH=/workspace,CHROMA_DB=${CHROMA_DB:-Cofit211-cosine}" \
     --source=.
 
 echo -e "${GREEN}✅ Cloud Function 部署成功！${NC}"
@@ -57,5 +57,6 @@ echo -e "${GREEN}📍 函數 URL：https://$REGION-$(gcloud config get-value pro
 
 # 清理
 rm -f function-source.zip
+rm -rf src
 
 echo -e "${GREEN}🎉 部署完成！${NC}"
\ No newline at end of file
@@ -7,6 +7,9 @@ set -e
 
 echo "📦 打包 Cloud Functions 以供部署..."
 
+# 同步共用模組
+./deployment/scripts/sync-shared.sh deployment/cloud-functions
+
 # 切換到 cloud functions 目錄
 cd deployment/cloud-functions
 
@@ -19,6 +22,7 @@ zip -r function-source.zip \
     main.py \
     requirements.txt \
     chroma.sqlite3 \
+    src/ \
     b67cd040-1701-467f-b8cb-a6b369b398b0/
 
 echo "✅ Cloud Functions 套件已建立：deployment/cloud-functions/function-source.zip"
@@ -0,0 +1,20 @@
+#!/bin/bash
+
+# 將共用模組 src/utils 複製到部署目錄
+# Cloud Run 與 Cloud Functions 的建置內容只包含各自的目錄，需先同步共用程式碼
+
+set -e
+
+TARGET_DIR="$1"
+
+if [ -z "$TARGET_DIR" ]; then
+    echo "用法：./deployment/scripts/sync-shared.sh deployment/cloud-run"
+    exit 1
+fi
+
+rm -rf "$TARGET_DIR/src"
+mkdir -p "$TARGET_DIR/src"
+cp -r src/utils "$TARGET_DIR/src/utils"
+find "$TARGET_DIR/src" -name "__pycache__" -type d -prune -exec rm -rf {} +
+
+echo "✅ 已同步 src/utils 至 $TARGET_DIR/src/utils"
@@ -1,18 +1,15 @@
 import os
 import json
+import time
 import hmac
 import hashlib
 import base64
-from datetime import datetime, timedelta, timezone
 from typing import List, Dict
-import chromadb
+from collections import deque
 from openai import OpenAI
 from linebot import LineBotApi, WebhookHandler
 from linebot.exceptions import InvalidSignatureError
 from linebot.models import MessageEvent, TextMessage, TextSendMessage
-from google.cloud import storage
-import pandas as pd
-from io import StringIO
 import sys
 from pathlib import Path
 
@@ -20,11 +17,18 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
-from src.utils import PathHelper
+from src.utils import (
+    PathHelper, SegmentedChatLog, ChatHistoryStore, BlobHistoryBacking, RetrieverCache,
+    EmbeddingCache, deepinfra_embed_fn, SemanticResponseCache, make_context_key,
+    dispatch_by_room, get_storage, video_url
+)
 
 # 常數定義
-CHROMA_DB = 'Cofit211-cosine'
+CHROMA_DB = os.environ.get('CHROMA_DB', 'Cofit211-cosine')
+# chroma 或 dense（memory-mapped 向量矩陣，需先以 src/others/export_dense_index.py 匯出）
+RETRIEVER_BACKEND = os.environ.get('RETRIEVER_BACKEND', 'chroma')
 CHAT_MODEL_NAME = "gpt-4o-mini"
+ERROR_MESSAGE = "抱歉，發生了一個錯誤"
 
 # Line Bot 設定
 line_bot_api = LineBotApi(os.environ.get('CHANNEL_ACCESS_TOKEN'))
@@ -42,29 +46,37 @@ deepinfra_client = OpenAI(
     base_url = "https://api.deepinfra.com/v1/openai",
 )
 
+# 查詢 embedding 快取（記憶體 LRU + 磁碟），EMBEDDING_CACHE_PATH 可指向掛載的磁碟讓快取跨容器重啟保留
+embedding_cache = EmbeddingCache(deepinfra_embed_fn(deepinfra_client), db_path=os.environ.get('EMBEDDING_CACHE_PATH', str(PathHelper.data_dir / "cache" / "embeddings.sqlite3")))
+
 # GCS 設定
 bucket_name = 'ian-line-bot-files'  # 替換為您的 GCS bucket 名稱
 file_name = 'messages-health.csv'  # CSV 檔案名稱
 
-# 初始化 GCS 客戶端
-storage_client = storage.Client()
-bucket = storage_client.bucket(bucket_name)
+log_prefix = 'messages-health'  # 對話紀錄片段的前綴
+
+# 初始化對話紀錄（每則訊息寫入一個片段，舊版 CSV 僅供讀取）
+log_storage = get_storage(bucket_name)
+chat_log = SegmentedChatLog(log_storage, prefix=log_prefix, legacy_name=file_name)
+
+# 每個聊天室最近 5 輪對話的索引，查詢時不需掃描整份紀錄
+history_store = ChatHistoryStore(max_turns=5, backing=BlobHistoryBacking(log_storage, prefix=log_prefix))
+
+# 語意回答快取：沒有先前對話且問題與背景資訊都幾乎相同時，直接重用先前的回答
+response_cache = SemanticResponseCache(threshold=float(os.environ.get('RESPONSE_CACHE_THRESHOLD', 0.95)))
+
+# 程序內共用的 Chroma 集合，只載入一次索引，磁碟上的資料庫更新時自動重新載入
+retriever = RetrieverCache(PathHelper.db_dir, CHROMA_DB, backend=RETRIEVER_BACKEND)
 
 def get_embedding(text: str) -> List[float]:
-    embeddings = deepinfra_client.embeddings.create(
-        model="BAAI/bge-m3",
-        input=text,
-        encoding_format="float"
-    )
-    return embeddings.data[0].embedding
+    return embedding_cache.get_embedding(text)
 
 def configure_retriever():
-    client = chromadb.PersistentClient(path=str(PathHelper.db_dir))
-    collection = client.get_collection(name=CHROMA_DB)
-    return collection
+    return retriever.get_collection()
 
-def get_relevant_documents(query: str, collection, top_k: int = 3) -> List[Dict]:
-    query_embedding = get_embedding(query)
+def get_relevant_documents(query: str, collection, top_k: int = 3, query_embedding: List[float] = None) -> List[Dict]:
+    if query_embedding is None:
+        query_embedding = get_embedding(query)
     results = collection.query(
         query_embeddings=[query_embedding],
         n_results=top_k,
@@ -86,56 +98,76 @@ def generate_response(messages: List[Dict]) -> str:
         return chat_completion.choices[0].message.content
     except Exception as e:
         print(f"OpenAI API 錯誤: {str(e)}")
-        return f"抱歉，發生了一個錯誤: {str(e)}"
+        return f"{ERROR_MESSAGE}: {str(e)}"
 
-def log_message_to_csv(user_input, gpt_output, chat_room_id):
-    blob = bucket.blob(file_name)
+def log_message_to_csv(turns, chat_room_id):
+    # 同一聊天室的多則訊息合併為一次寫入
+    chat_log.append_rows([{**turn, "chat_room_id": chat_room_id} for turn in turns])
+    history_store.extend(chat_room_id, turns)
+
+def get_chat_history(chat_room_id):
+    return history_store.get_turns(chat_room_id)
+
+def generate_answer(user_input, chat_history, chat_history_embedding_use):
+    collection = configure_retriever()
     
-    if blob.exists():
-        content = blob.download_as_text()
-        df = pd.read_csv(StringIO(content))
-    else:
-        df = pd.DataFrame(columns=["timestamp", "chat_room_id", "user_input", "gpt_output"])
+    cumulative_query = chat_history_embedding_use + '\n' + user_input
+    query_embedding = get_embedding(cumulative_query)
+    relevant_docs = get_relevant_documents(cumulative_query, collection, top_k=3, query_embedding=query_embedding)
+    context = relevant_docs[0]['page_content'] if relevant_docs else ""
+
+    messages_for_ai = [
+        {"role": "system", "content": f"你是一位專業的健康、醫療和飲食相關的諮詢師。用繁體中文回覆。可以參考以下背景資訊但不限於此來回答問題:\n\n{context}\n除了以上資訊你可以再進行補充，回答不用過長，回答得有結構及完整就好。必要時可以跟使用者詢問更多資訊來提供給你。"},
+        {"role": "user", "content": f"之前的對話紀錄：\n{chat_history}\n\n使用者的最新問題：{user_input}"}
+    ]
     
-    taipei_time = datetime.now(timezone.utc) + timedelta(hours=8)
-
-    new_row = pd.DataFrame({
-        "timestamp": [taipei_time.strftime('%Y-%m-%d %H:%M:%S')],
-        "chat_room_id": [chat_room_id],
-        "user_input": [user_input],
-        "gpt_output": [gpt_output]
-    })
-    df = pd.concat([df, new_row], ignore_index=True)
+    context_key = make_context_key(relevant_docs)
+    GPT_output = response_cache.lookup(query_embedding, context_key, has_history=bool(chat_history))
+    if GPT_output is None:
+        t1 = time.time()
+        GPT_output = generate_response(messages_for_ai)
+        if not GPT_output.startswith(ERROR_MESSAGE):
+            response_cache.store(query_embedding, context_key, GPT_output, time.time() - t1,
+                                 has_history=bool(chat_history))
     
-    csv_buffer = StringIO()
-    df.to_csv(csv_buffer, index=False)
-    blob.upload_from_string(csv_buffer.getvalue(), content_type='text/csv')
-
-def get_chat_history(chat_room_id):
-    blob = bucket.blob(file_name)
+    # 將 YouTube URL 加入回覆中
+    youtube_urls = []
+    for doc in relevant_docs:
+        if 'video_id' in doc['metadata']:
+            # 有時間資訊的 chunk 直接連到影片中的該段落
+            youtube_url = video_url(doc['metadata'])
+            youtube_urls.append(youtube_url)
     
-    if blob.exists():
-        content = blob.download_as_text()
-        df = pd.read_csv(StringIO(content))
-        
-        chat_history = df[df['chat_room_id'] == chat_room_id].tail(5)
-        
-        formatted_history = []
-        for _, row in chat_history.iterrows():
-            formatted_history.append(f"時間: {row['timestamp']}")
-            formatted_history.append(f"使用者: {row['user_input']}")
-            formatted_history.append(f"AI: {row['gpt_output']}")
-            formatted_history.append("---")
-            
-        formatted_history_embedding_use = []
-        if not chat_history.empty:
-            last_row = chat_history.iloc[-1]
-            formatted_history_embedding_use.append(f"使用者: {last_row['user_input']}")
-            formatted_history_embedding_use.append(f"AI: {last_row['gpt_output']}")
-        
-        return "\n".join(formatted_history), "\n".join(formatted_history_embedding_use)
-    else:
-        return "", ""
+    if youtube_urls:
+        GPT_output += "\n\n相關影片：\n" + "\n".join(youtube_urls)
+
+    return GPT_output
+
+def handle_room_events(chat_room_id, events):
+    """
+    依序處理同一聊天室的訊息，歷史只讀取一次、紀錄只寫入一次
+    """
+    turns = deque(get_chat_history(chat_room_id), maxlen=history_store.max_turns)
+    new_turns = []
+    try:
+        for event in events:
+            # 單一訊息失敗只記錄錯誤並繼續處理後面的訊息；整批回應 500 會讓 LINE 重送已回覆的訊息
+            try:
+                user_input = event['message']['text']
+
+                chat_history, chat_history_embedding_use = history_store.format_turns(list(turns))
+                GPT_output = generate_answer(user_input, chat_history, chat_history_embedding_use)
+
+                turn = history_store.make_turn(user_input, GPT_output)
+                history_store.apply_turn(turns, turn)
+                new_turns.append(turn)
+
+                line_bot_api.reply_message(event['replyToken'], TextSendMessage(GPT_output))
+            except Exception as e:
+                print(f"聊天室 {chat_room_id} 的訊息處理失敗：{type(e).__name__} - {str(e)}")
+    finally:
+        if new_turns:
+            log_message_to_csv(new_turns, chat_room_id)
 
 def linebot(request):
     if request.method != 'POST' or 'X-Line-Signature' not in request.headers:
@@ -150,43 +182,16 @@ def linebot(request):
     if x_line_signature == signature:
         try:
             json_data = json.loads(body)
-            handler.handle(body, x_line_signature)
-            tk = json_data['events'][0]['replyToken']
-            
-            user_input = json_data['events'][0]['message']['text']
-            
-            chat_room_id = json_data['events'][0]['source']['groupId'] if 'groupId' in json_data['events'][0]['source'] else json_data['events'][0]['source']['userId']
-            
-            chat_history, chat_history_embedding_use = get_chat_history(chat_room_id)
             
-            collection = configure_retriever()
-            
-            cumulative_query = chat_history_embedding_use + '\n' + user_input
-            relevant_docs = get_relevant_documents(cumulative_query, collection, top_k=3)
-            context = relevant_docs[0]['page_content'] if relevant_docs else ""
-
-            messages_for_ai = [
-                {"role": "system", "content": f"你是一位專業的健康、醫療和飲食相關的諮詢師。用繁體中文回覆。可以參考以下背景資訊但不限於此來回答問題:\n\n{context}\n除了以上資訊你可以再進行補充，回答不用過長，回答得有結構及完整就好。必要時可以跟使用者詢問更多資訊來提供給你。"},
-                {"role": "user", "content": f"之前的對話紀錄：\n{chat_history}\n\n使用者的最新問題：{user_input}"}
+            # 處理同一批次中的所有文字訊息：同一聊天室依序、不同聊天室平行
+            events = [
+                e for e in json_data['events']
+                if e.get('type') == 'message' and e.get('message', {}).get('type') == 'text'
             ]
-            
-            GPT_output = generate_response(messages_for_ai)
-            
-            # 將 YouTube URL 加入回覆中
-            youtube_urls = []
-            for doc in relevant_docs:
-                if 'video_id' in doc['metadata']:
-                    video_id = doc['metadata']['video_id']
-                    youtube_url = f"https://www.youtube.com/watch?v={video_id}"
-                    youtube_urls.append(youtube_url)
-            
-            if youtube_urls:
-                GPT_output += "\n\n相關影片：\n" + "\n".join(youtube_urls)
-            
-            log_message_to_csv(user_input, GPT_output, chat_room_id)
-            
-            line_bot_api.reply_message(tk, TextSendMessage(GPT_output))
-            
+            # 失敗的聊天室已記錄錯誤；其餘訊息已回覆，回應 200 避免 LINE 重送整批造成重複回覆
+            dispatch_by_room(events, handle_room_events)
+            # 在背景執行緒壓縮，不延遲 webhook 的回應
+            chat_log.maybe_compact()
             return 'OK', 200
         except Exception as e:
             print(f"發生錯誤：{type(e).__name__} - {str(e)}")
@@ -1,7 +1,6 @@
 import os
 import streamlit as st
 from dotenv import load_dotenv
-import chromadb
 from openai import OpenAI
 from typing import List, Dict
 import sys
@@ -11,11 +10,16 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
-from src.utils import PathHelper, get_logger
+from src.utils import (
+    PathHelper, RetrieverCache, EmbeddingCache, deepinfra_embed_fn, get_logger, video_url
+)
 
 # 常數定義
 CHANNEL_NAME = 'Cofit211'
-CHROMA_DB = 'Cofit211-cosine'
+CHROMA_DB = os.environ.get('CHROMA_DB', 'Cofit211-cosine')
+# chroma 或 dense（memory-mapped 向量矩陣，需先以 src/others/export_dense_index.py 匯出）
+# hybrid 為 dense + lexical weights 融合檢索，需先以 src/others/build_hybrid_index.py 建立索引，查詢時使用本機的 bge-m3
+RETRIEVER_BACKEND = os.environ.get('RETRIEVER_BACKEND', 'chroma')
 CHAT_MODEL_NAME = "gpt-4o-mini"
 INIT_MESSAGE = "您好!我是您的 AI 諮詢師。有什麼我可以幫您的嗎?"
 
@@ -38,27 +42,51 @@ deepinfra_client = OpenAI(
     base_url="https://api.deepinfra.com/v1/openai",
 )
 
+@st.cache_resource
+def get_embedding_cache():
+    # 與 LINE Bot 共用同一個磁碟快取檔
+    return EmbeddingCache(deepinfra_embed_fn(deepinfra_client),
+                          db_path=PathHelper.data_dir / "cache" / "embeddings.sqlite3")
+
+embedding_cache = get_embedding_cache()
+
 def get_embedding(text: str) -> List[float]:
-    embeddings = deepinfra_client.embeddings.create(
-        model="BAAI/bge-m3",
-        input=text,
-        encoding_format="float"
-    )
-    return embeddings.data[0].embedding
-
-@st.cache_resource(ttl=24 * 3600)
+    return embedding_cache.get_embedding(text)
+
+@st.cache_resource
+def get_retriever():
+    # Streamlit 每次互動都會重跑腳本，以 cache_resource 讓整個程序共用同一個 RetrieverCache；
+    # 索引被重寫時 RetrieverCache 依檔案修改時間自動重新載入（三種 backend 皆同）
+    return RetrieverCache(PathHelper.db_dir, CHROMA_DB, backend=RETRIEVER_BACKEND)
+
+@st.cache_resource
+def get_bge_m3_model():
+    from FlagEmbedding import BGEM3FlagModel
+    return BGEM3FlagModel('BAAI/bge-m3', use_fp16=True)
+
 def configure_retriever():
-    client = chromadb.PersistentClient(path=str(PathHelper.db_dir))
-    collection = client.get_collection(name=CHROMA_DB)
-    return collection
+    return get_retriever().get_collection()
 
 def get_relevant_documents(query: str, collection, top_k: int = 3) -> List[Dict]:
-    query_embedding = get_embedding(query)
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=top_k,
-        include=["documents", "metadatas"]
-    )
+    if RETRIEVER_BACKEND == 'hybrid':
+        model = get_bge_m3_model()
+        output = model.encode([query], max_length=8192, return_sparse=True,
+                              return_colbert_vecs=collection.colbert is not None)
+        results = collection.query(
+            query_embeddings=output['dense_vecs'].tolist(),
+            n_results=top_k,
+            include=["documents", "metadatas"],
+            query_lexical_weights=output['lexical_weights'],
+            query_colbert_vecs=output.get('colbert_vecs'),
+        )
+        logger.info(f"hybrid retrieval timings: {results['timings']}")
+    else:
+        query_embedding = get_embedding(query)
+        results = collection.query(
+            query_embeddings=[query_embedding],
+            n_results=top_k,
+            include=["documents", "metadatas"]
+        )
     documents = [
         {"page_content": doc, "metadata": meta} 
         for doc, meta in zip(results['documents'][0], results['metadatas'][0])
@@ -125,8 +153,8 @@ if user_query := st.chat_input(placeholder="請輸入您的問題"):
     if relevant_docs:
         st.write("相關影片:")
         for i, doc in enumerate(relevant_docs, 1):
-            video_id = doc['metadata']['video_id']
-            youtube_url = f"https://www.youtube.com/watch?v={video_id}"
+            # 有時間資訊的 chunk 直接連到影片中的該段落
+            youtube_url = video_url(doc['metadata'])
             st.write(f"{i}. [{youtube_url}]({youtube_url})")
 
 # 側邊欄
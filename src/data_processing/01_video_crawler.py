@@ -1,13 +1,11 @@
 channel_name = 'Cofit211'
+# 同時下載字幕的執行緒數與每秒請求數上限（請求過快會被 YouTube 暫時封鎖）
+fetch_workers = 8
+requests_per_second = 5
+# 增量模式：只列出上次執行之後上傳的影片（第一次執行或設為 False 時列出全部）
+incremental = True
 
 import json
-import time
-
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.wait import WebDriverWait
-from youtube_transcript_api import YouTubeTranscriptApi
 
 try:
     import sys
@@ -17,8 +15,8 @@ try:
     project_root = Path(__file__).parent.parent.parent
     sys.path.insert(0, str(project_root))
     
-    import src.constants as const
-    from src.utils import PathHelper, get_logger
+    import src.data_processing.constants as const
+    from src.utils import PathHelper, get_logger, ChannelListing, YouTubeTranscriptSource, fetch_transcripts
 except Exception as e:
     print(e)
     raise Exception("Please run this script from the root directory of the project")
@@ -26,84 +24,49 @@ except Exception as e:
 # 日誌記錄器
 logger = get_logger(__name__)
 
-def main():
-    logger.info(f"channel_name: {channel_name}")
-
-    # 初始化驅動程式
-    driver = webdriver.Chrome()
-
-    url = f"https://www.youtube.com/@{channel_name}"
-    driver.get(url + "/videos")
-
-    # 捲動頁面
-    ht = driver.execute_script("return document.documentElement.scrollHeight;")
-    while True:
-        prev_ht = driver.execute_script("return document.documentElement.scrollHeight;")
-        driver.execute_script(
-            "window.scrollTo(0, document.documentElement.scrollHeight);"
-        )
-        time.sleep(2)
-        ht = driver.execute_script("return document.documentElement.scrollHeight;")
-        if prev_ht == ht:
-            break
+def load_listing(path):
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
 
-    # 儲存
-    # https://stackoverflow.com/questions/74578175/getting-video-links-from-youtube-channel-in-python-selenium
-    videos = []
-    try:
-        for e in WebDriverWait(driver, 20).until(
-            EC.presence_of_all_elements_located((By.CSS_SELECTOR, "div#details"))
-        ):
-            # 屬性
-            title = e.find_element(By.CSS_SELECTOR, "a#video-title-link").get_attribute(
-                "title"
-            )
-            vurl = e.find_element(By.CSS_SELECTOR, "a#video-title-link").get_attribute(
-                "href"
-            )
 
-            # 加入
-            videos.append(
-                {
-                    const.VIDEO_URL: vurl,
-                    const.TITLE: title,
-                }
-            )
-    except Exception as e:
-        e
-        pass
-
-    logger.info(f"# videos from {channel_name}: {len(videos)}")
+def main(channel_name=channel_name):
+    logger.info(f"channel_name: {channel_name}")
 
-    # 取得轉錄文字
+    # 以 HTTP 分頁列出頻道影片；增量模式只讀取到上次列過的影片為止
+    listing_fname = PathHelper.entities_dir / f"{channel_name}.videos.json"
+    listed = load_listing(listing_fname)
+    known_ids = {video[const.VIDEO_ID] for video in listed} if incremental else set()
+    new_videos = ChannelListing().list_videos(channel_name, known_ids=known_ids)
+    logger.info(f"# new videos from {channel_name}: {len(new_videos)}")
+
+    # 新影片在前，與頻道頁面的順序相同
+    new_ids = {video["video_id"] for video in new_videos}
+    listed = [
+        {const.VIDEO_ID: video["video_id"], const.VIDEO_URL: video["video_url"], const.TITLE: video["title"]}
+        for video in new_videos
+    ] + [video for video in listed if video[const.VIDEO_ID] not in new_ids]
+    listing_fname.parent.mkdir(parents=True, exist_ok=True)
+    with open(listing_fname, "w", encoding="utf-8") as f:
+        json.dump(listed, f, ensure_ascii=False)
+
+    logger.info(f"# videos from {channel_name}: {len(listed)}")
+    videos = [dict(video) for video in listed]
+
+    # 取得轉錄文字：平行下載，已存在的檔案略過（中斷後重新執行會從未完成的影片繼續）
     for video_i in videos:
-        video_id = video_i[const.VIDEO_URL].split("=")[-1]
-        video_i[const.VIDEO_ID] = video_id
         video_i[const.CHANNEL_NAME] = channel_name
-        logger.info(f"video id: {video_id}")
-
-        entity_fname = PathHelper.entities_dir / f"{channel_name}/{video_i[const.VIDEO_ID]}.json"
-
-        # 檢查檔案是否存在
-        if entity_fname.exists():
-            logger.info(f"file exist: {entity_fname}")
-            # 跳到下一個影片
-            continue
 
-        try:
-            transcript_i = YouTubeTranscriptApi.get_transcript(
-                video_id, languages=["zh-TW"]
-            )
-            video_i[const.TRANSCRIPT] = transcript_i
-        except Exception as e:
-            e
-            video_i[const.TRANSCRIPT] = []
-        finally:
-            # 將物件儲存為 json 到本地
-            with open(
-                PathHelper.entities_dir / f"{channel_name}/{video_i[const.VIDEO_ID]}.json", "w"
-            ) as f:
-                json.dump(video_i, f)
+    # 依序嘗試繁體、簡體（轉為繁體）與自動產生的字幕，都沒有時才由 03 / 04 下載音訊並語音辨識
+    source = YouTubeTranscriptSource()
+    stats = fetch_transcripts(source, videos, PathHelper.entities_dir / channel_name,
+                              video_id_key=const.VIDEO_ID, transcript_key=const.TRANSCRIPT,
+                              source_key=const.TRANSCRIPT_SOURCE,
+                              workers=fetch_workers, rate=requests_per_second, burst=fetch_workers)
+    logger.info(f"fetched {stats['fetched']} transcripts, {stats['unavailable']} unavailable, "
+                f"{stats['failed']} failed, {stats['skipped']} skipped in {stats['seconds']}s")
+    logger.info(f"transcript sources: {stats.get('sources', {})}")
 
 
 if __name__ == "__main__":
@@ -1,7 +1,14 @@
 channel_name = 'Cofit211'
+# 每次批次推論一起處理的影片數，以及模型每個 forward 的輸入數
+videos_per_batch = 16
+punct_batch_size = 32
+# 平行處理的程序數（每個程序各自載入模型，約 2GB 記憶體；使用 GPU 時維持 1）
+workers = 1
 
 import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 from deepmultilingualpunctuation import PunctuationModel
 from dotenv import load_dotenv
@@ -14,7 +21,8 @@ try:
     project_root = Path(__file__).parent.parent.parent
     sys.path.insert(0, str(project_root))
     
-    from src.utils import PathHelper, get_logger
+    import src.data_processing.constants as const
+    from src.utils import PathHelper, get_logger, BatchedPunctuation, TranscriptStore, open_transcript_store
 except Exception as e:
     print(e)
     raise Exception("Please run this script from the root directory of the project")
@@ -26,24 +34,31 @@ load_dotenv(dotenv_path=dotenv_path)
 # 日誌記錄器
 logger = get_logger(__name__)
 
-# 初始化模型
-logger.info("init punctuation model")
-punct_model = PunctuationModel()
+# 初始化模型（第一次使用時才載入；使用多個程序時每個程序各自載入）
+punct_model = None
+
+
+def get_punct_model():
+    global punct_model
+    if punct_model is None:
+        logger.info("init punctuation model")
+        punct_model = PunctuationModel()
+    return punct_model
+
+
+def split_segments(transcript, n=5):
+    """每 n 行字幕合併為一段，作為一次標點還原的輸入"""
+    return [" ".join(transcript[i : i + n]) for i in range(0, len(transcript), n)]
+
 
 # 處理函數
 def preprocess_transcript(transcript):
     """
-    為轉錄文字加入標點符號並合併為一個文件
+    為轉錄文字加入標點符號並合併為一個文件（逐段呼叫模型，作為批次版本的對照）
     """
-    # 分割為長度為 n 的清單
-    n = 5
-    transcript_text = [transcript[i : i + n] for i in range(0, len(transcript), n)]
-
-    # 恢復標點符號
-    transcript_text_restore = []
-    for transcript_text_i in transcript_text:
-        result_punct = punct_model.restore_punctuation(" ".join(transcript_text_i))
-        transcript_text_restore.append(result_punct)
+    # 分割為長度為 n 的清單並恢復標點符號
+    transcript_text_restore = [get_punct_model().restore_punctuation(segment)
+                               for segment in split_segments(transcript)]
 
     # 合併轉錄文字
     transcript = "\n".join(transcript_text_restore)
@@ -51,51 +66,111 @@ def preprocess_transcript(transcript):
     return transcript
 
 
-def main():
-    # 選擇檔案
-    entities = [i for i in os.listdir(PathHelper.entities_dir / f"{channel_name}") if i.endswith(".json")]
+def preprocess_transcripts(transcripts):
+    """
+    一次處理多支影片：所有影片的段落合併成一次批次推論，結果與逐支呼叫 preprocess_transcript 相同
+    """
+    segments = [split_segments(transcript) for transcript in transcripts]
+    restored = iter(BatchedPunctuation(get_punct_model(), batch_size=punct_batch_size)
+                    .restore_many([segment for video in segments for segment in video]))
+    return ["\n".join(next(restored) for _ in video) for video in segments]
 
-    logger.info(f"# files: {len(entities)}")
 
-    # 文字轉文字
-    m_transcripts_processed = 0
-    for jf in entities:
-        fname = jf.split(".")[0]
+def transcript_segments(transcript):
+    """字幕行轉為逐字稿 store 的 segments：[[start, end, text], ...]"""
+    return [[round(t["start"], 3), round(t["start"] + t.get("duration", 0.0), 3), t["text"]] for t in transcript]
+
+
+def process_videos(store_path, jobs):
+    """
+    處理一組影片的實體檔，寫入逐字稿 store，回傳成功寫入的數量
+
+    整組批次處理失敗時（例如某支影片的字幕是空字串）改為逐支處理，只略過有問題的影片。
+    """
+    names, transcripts, entities = [], [], []
+    for entity_fname in jobs:
         try:
-            with open((PathHelper.entities_dir / f"{channel_name}" / jf), "r") as f:
+            with open(entity_fname, "r") as f:
                 ent_i = json.load(f)
+            names.append(entity_fname.stem)
+            transcripts.append([t["text"] for t in ent_i[const.TRANSCRIPT]])
+            entities.append(ent_i)
+        except Exception as e:
+            logger.error(e)
+
+    try:
+        results = preprocess_transcripts(transcripts)
+    except Exception as e:
+        logger.warning(f"batch of {len(transcripts)} videos failed ({e}), falling back to one video at a time")
+        results = []
+        for name, transcript in zip(names, transcripts):
+            try:
+                results.append(preprocess_transcripts([transcript])[0])
+            except Exception as e:
+                logger.error(f"{name}: {e}")
+                results.append(None)
 
-            # 如果檔案存在，則跳過
-            if (PathHelper.text_dir / f"{channel_name}" / f"{fname}.txt").exists():
-                logger.info(f"file exist: {fname}")
-                continue
+    # 整組一次寫入（多個程序同時寫入時由 store 的檔案鎖互斥）
+    records = [{"video_id": name, "text": transcript, "segments": transcript_segments(ent_i[const.TRANSCRIPT]),
+                "source": ent_i.get(const.TRANSCRIPT_SOURCE)}
+               for name, transcript, ent_i in zip(names, results, entities) if transcript is not None]
+    TranscriptStore(store_path).put_many(records)
+    return len(records)
 
-            # 如果實體中有轉錄文字，則儲存文字
-            if ent_i.get("transcript"):
-                transcript_text = [t["text"] for t in ent_i["transcript"]]
 
-                # 預處理轉錄文字
-                transcript = preprocess_transcript(transcript_text)
+def init_worker(threads):
+    import torch
 
-                # 以編碼儲存轉錄文字
-                with open(
-                    PathHelper.text_dir / f"{channel_name}" / f"{fname}.txt", "w", encoding="utf8"
-                ) as f:
-                    json.dump(transcript, f)
+    # 多個程序同時執行時分配 CPU 執行緒，避免互相搶用
+    torch.set_num_threads(threads)
+    get_punct_model()
 
-                m_transcripts_processed += 1
-            
-            else:
-                logger.info(f"file no transcript: {fname}")
 
+def main(channel_name=channel_name):
+    # 選擇檔案
+    entities = [i for i in os.listdir(PathHelper.entities_dir / f"{channel_name}") if i.endswith(".json")]
+
+    logger.info(f"# files: {len(entities)}")
+
+    # 只處理還沒有逐字稿、且實體中有轉錄文字的影片
+    store = open_transcript_store(PathHelper.text_dir, channel_name)
+    jobs = []
+    for jf in entities:
+        fname = jf.split(".")[0]
+        # 如果已有逐字稿，則跳過
+        if fname in store:
+            logger.info(f"file exist: {fname}")
+            continue
+        try:
+            with open((PathHelper.entities_dir / f"{channel_name}" / jf), "r") as f:
+                ent_i = json.load(f)
         except Exception as e:
             logger.error(e)
             continue
+        if ent_i.get(const.TRANSCRIPT):
+            jobs.append(PathHelper.entities_dir / f"{channel_name}" / jf)
+        else:
+            logger.info(f"file no transcript: {fname}")
+
+    # 文字轉文字：每 videos_per_batch 支影片一起批次推論
+    groups = [jobs[i : i + videos_per_batch] for i in range(0, len(jobs), videos_per_batch)]
+    t1 = time.time()
+    m_transcripts_processed = 0
+    if workers > 1 and len(groups) > 1:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(threads,)) as executor:
+            for m_processed in executor.map(process_videos, [store.path] * len(groups), groups):
+                m_transcripts_processed += m_processed
+    else:
+        for group in groups:
+            m_transcripts_processed += process_videos(store.path, group)
+    elapsed = time.time() - t1
 
     # 日誌記錄
-    logger.info(f"extract transcript from {m_transcripts_processed} files")
+    logger.info(f"extract transcript from {m_transcripts_processed} files "
+                f"({m_transcripts_processed / max(elapsed, 1e-9) * 60:.1f} videos/min)")
 
 
 if __name__ == "__main__":
 
-    main()
\ No newline at end of file
+    main()
@@ -1,10 +1,10 @@
 channel_name = 'Cofit211'
+# 同時下載的影片數；連續失敗超過 max_download_attempts 次的影片不再嘗試（刪除記錄檔可重置）
+download_workers = 4
+max_download_attempts = 5
 
 import json
 import os
-from pytubefix import YouTube
-from pytubefix.cli import on_progress
-from tqdm import tqdm
 try:
     import sys
     from pathlib import Path
@@ -13,58 +13,52 @@ try:
     project_root = Path(__file__).parent.parent.parent
     sys.path.insert(0, str(project_root))
     
-    import src.constants as const
-    from src.utils import PathHelper, get_logger
+    import src.data_processing.constants as const
+    from src.utils import (
+        PathHelper, get_logger, PytubefixAudioSource, FailureLedger, download_audio_files, open_transcript_store
+    )
 except Exception as e:
     print(e)
     raise Exception("Please run this script from the root directory of the project")
 
 logger = get_logger(__name__)
 
-def download_audio(video_url, output_path):
-    # 取得影片 ID
-    video_id = video_url.split("=")[-1]
-    output_file = f"{output_path}/{video_id}.mp3"
-
-    # 如果檔案已存在，跳過下載
-    if os.path.exists(output_file):
-        logger.info(f"File already exists: {output_file}")
-        return
-
-    try:
-        yt = YouTube(video_url, on_progress_callback = on_progress)
-        print(yt.title)
-         
-        ys = yt.streams.get_audio_only()
-        audio_file = ys.download(mp3=True, output_path=output_path, filename=f"{video_id}")
-        
-        logger.info(f"Audio successfully downloaded: {audio_file}")
-    except Exception as e:
-        logger.error(f"Error downloading audio for {video_url}: {str(e)}")
-
-def main():
+def main(channel_name=channel_name):
     entities = [i for i in os.listdir(PathHelper.entities_dir / f"{channel_name}") if i.endswith(".json")]
     m_docs = len(entities)
     m_docs_wo_transcript = 0
     m_docs_failed = 0
+    store = open_transcript_store(PathHelper.text_dir, channel_name)
 
-    for e in tqdm(entities, total=len(entities)):
+    videos = []
+    for e in entities:
         try:
             with open(PathHelper.entities_dir / f"{channel_name}" / e, "r") as f:
                 data = json.load(f)
-            
-            # 下載音訊（如果沒有文字稿）
+
+            # 下載音訊（如果沒有任何字幕，且還沒有語音辨識的逐字稿）
             if not data.get(const.TRANSCRIPT):
+                if data[const.VIDEO_ID] in store:
+                    continue
                 m_docs_wo_transcript += 1
-                download_audio(data[const.VIDEO_URL], PathHelper.audio_dir / f"{channel_name}")
+                videos.append((data[const.VIDEO_ID], data[const.VIDEO_URL]))
         except Exception as e:
             logger.error(f"Error processing {e}: {str(e)}")
             m_docs_failed += 1
             continue
 
+    # 平行下載，中斷的檔案續傳；失敗的影片記錄在 download_failures.json，下次執行再試
+    output_dir = PathHelper.audio_dir / f"{channel_name}"
+    ledger = FailureLedger(output_dir / "download_failures.json", max_attempts=max_download_attempts)
+    stats = download_audio_files(PytubefixAudioSource(), videos, output_dir, workers=download_workers,
+                                 ledger=ledger)
+
     logger.info(f"Total docs: {m_docs}")
     logger.info(f"Docs without transcript: {m_docs_wo_transcript}")
     logger.info(f"Docs failed: {m_docs_failed}")
+    logger.info(f"Downloaded {stats['downloaded']} files ({stats['bytes'] / 1e6:.1f} MB) in {stats['seconds']}s: "
+                f"{stats['mb_per_sec']} MB/s, {stats['files_per_min']} files/min; "
+                f"{stats['failed']} failed, {stats['gave_up']} given up")
 
 if __name__ == "__main__":
     
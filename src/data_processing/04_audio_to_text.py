@@ -1,13 +1,19 @@
 channel_name = 'Cofit211'
+# 同時辨識的檔案數（每個 worker 分到 CPU 核心數 / asr_workers 個執行緒）與每次批次解碼的片段數
+asr_workers = 2
+asr_batch_size = 8
+# 草稿模式：以小模型 + greedy 解碼快速產生逐字稿，用於初步篩選
+draft = False
+model_size = "large-v3"
+draft_model_size = "small"
 
 import json
 import os
+import threading
 
 from deepmultilingualpunctuation import PunctuationModel
 from dotenv import load_dotenv
-from faster_whisper import WhisperModel
 # from pydub import AudioSegment
-from tqdm import tqdm
 
 try:
     import sys
@@ -17,7 +23,9 @@ try:
     project_root = Path(__file__).parent.parent.parent
     sys.path.insert(0, str(project_root))
     
-    from src.utils import PathHelper, get_logger
+    from src.utils import (
+        PathHelper, get_logger, TranscriptionScheduler, load_whisper_model, AUDIO_EXTENSIONS, open_transcript_store
+    )
 except Exception as e:
     print(e)
     raise Exception("Please run this script from the root directory of the project")
@@ -43,7 +51,26 @@ def restore_punctuation_in_chunks(punct_model, text, chunk_size):
     return " ".join(results)
 
 
-def main():
+def punctuate_segments(punct_model, seg_i):
+    """每 10 個語音辨識片段（start, end, text）一組恢復標點符號後合併"""
+    # 合併轉錄文字
+    transcript_text = [
+        [s[2] for s in seg_i[i: i + 10]] for i in range(0, len(seg_i), 10)
+    ]
+    transcript_text_restore = []
+    for transcript_text_i in transcript_text:
+        result_punct = restore_punctuation_in_chunks(punct_model, " ".join(transcript_text_i), 512)
+        transcript_text_restore.append(result_punct)
+
+    return "".join(transcript_text_restore)
+
+
+def asr_segments(seg_i):
+    """語音辨識片段轉為逐字稿 store 的 segments：[[start, end, text], ...]"""
+    return [[round(start, 3), round(end, 3), text] for start, end, text in seg_i]
+
+
+def main(channel_name=channel_name):
 
     logger.info(f"channel_name: {channel_name}")
 
@@ -51,10 +78,10 @@ def main():
     punct_model = PunctuationModel()
 
     # 選擇檔案
-    fnames = [i for i in os.listdir(PathHelper.audio_dir / f"{channel_name}") if i.endswith(".mp3")]
-    fnames_has_text = [i for i in os.listdir(PathHelper.text_dir / f"{channel_name}") if i.endswith(".txt")]
-    fnames_wo_text = list(set(fnames) - set(fnames_has_text))
-    logger.info(f"# files has text (all): {len(fnames_has_text)}")
+    fnames = [i for i in os.listdir(PathHelper.audio_dir / f"{channel_name}") if i.endswith(AUDIO_EXTENSIONS)]
+    store = open_transcript_store(PathHelper.text_dir, channel_name)
+    fnames_wo_text = [i for i in fnames if i.split(".")[0] not in store]
+    logger.info(f"# files has text (all): {len(store)}")
     logger.info(f"# files without text (all): {len(fnames_wo_text)}")
 
     # 選擇檔案子集
@@ -93,19 +120,26 @@ def main():
             #     ) as f:
             #         json.dump(transcript, f)
 
+            # 已有字幕（含簡體或自動產生的字幕）的影片由 02 處理，不需要語音辨識
+            if ent_i.get("transcript"):
+                continue
+
             # 如果是選定的頻道，則加入到 entities_selected
             if channel_name:
                 if ent_i.get("channel_name") == channel_name:
-                    entities_selected.append(f"{ent_i['video_id']}.mp3")
+                    entities_selected.append(ent_i['video_id'])
             else:
-                entities_selected.append(f"{ent_i['video_id']}.mp3")
+                entities_selected.append(ent_i['video_id'])
 
         except Exception as e:
             logger.error(e)
             continue
 
     # 日誌記錄
-    fnames_selected = set(fnames_wo_text).intersection(set(entities_selected))
+    # 同一支影片有多個音檔（舊版的 .mp3 與新版的 .m4a）時只取一個
+    entities_selected = set(entities_selected)
+    fnames_selected = list({i.split(".")[0]: i for i in sorted(fnames_wo_text)
+                            if i.split(".")[0] in entities_selected}.values())
     logger.info(f"# files w/o text: {len(fnames_selected)}")
 
     limit = 0
@@ -116,61 +150,50 @@ def main():
     logger.info(f"# files selected: {len(fnames_selected)}")
 
     # 音訊轉文字
-    # 使用 faster whisper
-    model_size = "large-v3"
-    model = WhisperModel(model_size, device="cpu", compute_type="int8")
-    # total_sec = 0
-    for fname_ext in tqdm(fnames_selected):
-        fname = fname_ext.split(".")[0]
-        if (PathHelper.text_dir / f"{channel_name}" / f"{fname}.txt").exists():
-            logger.info(f"file exist: {fname}")
-            continue
-        # audio_file = AudioSegment.from_mp3(PathHelper.audio_dir / f"{channel_name}" / fname_ext)
-        # logger.info(f"fname: {fname}")
-
-        # 取得總秒數
-        # total_sec += audio_file.duration_seconds
-
-        # 估計成本
-        # estimated_cost = total_sec / 60 * 0.006 * 32
-        # logger.info("estimated cost in TWD: ${:.2f}".format(estimated_cost))
-
-        # 音訊轉文字並合併
-        seg_i = []
-        segments, info = model.transcribe(
-            str(PathHelper.audio_dir / f"{channel_name}" / fname_ext),
-            beam_size=5,
-            initial_prompt="以下是普通話的句子。",
-        )
+    # 使用 faster whisper：多個 worker 同時辨識不同檔案，VAD 略過靜音，語音片段批次解碼
+    # 草稿模式以較小的模型與 greedy 解碼快速產生逐字稿（寫到 {channel_name}-draft，不影響正式的逐字稿）
+    output_store = open_transcript_store(PathHelper.text_dir, f"{channel_name}-draft") if draft else store
+    fnames_selected = [fname_ext for fname_ext in sorted(fnames_selected)
+                       if fname_ext.split('.')[0] not in output_store]
+    logger.info(f"# files to transcribe: {len(fnames_selected)}")
+    if not fnames_selected:
+        return
+
+    threads_per_worker = max(1, (os.cpu_count() or 1) // asr_workers)
+    asr_model_size = draft_model_size if draft else model_size
+    model = load_whisper_model(asr_model_size, workers=asr_workers,
+                               threads_per_worker=threads_per_worker, device="cpu", compute_type="int8")
+    scheduler = TranscriptionScheduler(
+        model,
+        workers=asr_workers,
+        batch_size=asr_batch_size,
+        vad_filter=True,
+        beam_size=1 if draft else 5,
+        initial_prompt="以下是普通話的句子。",
+    )
+    # 標點模型不保證可被多個執行緒同時呼叫
+    punct_lock = threading.Lock()
+
+    def save_result(result):
+        fname = os.path.basename(result.path).split(".")[0]
         logger.info(
             "Detected language '%s' with probability %f"
-            % (info.language, info.language_probability)
+            % (result.language, result.language_probability)
         )
 
-        if info.language not in ("en", "zh"):
-            with open(PathHelper.text_dir / f"{channel_name}" / f"{fname}.txt", "w") as f:
-                json.dump("", f)
-            continue
-
-        for segment in segments:
-            # print("[%.2fs -> %.2fs] %s" % (segment.start, segment.end, segment.text))
-            seg_i.append([segment.start, segment.end, segment.text])
-
-        # 合併轉錄文字
-        transcript_text = [
-            [s[2] for s in seg_i[i: i + 10]] for i in range(0, len(seg_i), 10)
-        ]
-        transcript_text_restore = []
-        for transcript_text_i in transcript_text:
-            result_punct = restore_punctuation_in_chunks(punct_model, " ".join(transcript_text_i), 512)
-            transcript_text_restore.append(result_punct)
+        if result.language not in ("en", "zh"):
+            output_store.put(fname, "", source=f"asr:{asr_model_size}")
+            return
 
-        transcript_processed = "".join(transcript_text_restore)
+        with punct_lock:
+            transcript_processed = punctuate_segments(punct_model, result.segments)
 
-        # 儲存轉錄文字
-        with open(PathHelper.text_dir / f"{channel_name}" / f"{fname}.txt", "w") as f:
-            json.dump(transcript_processed, f)
+        # 儲存轉錄文字與片段時間
+        output_store.put(fname, transcript_processed, segments=asr_segments(result.segments),
+                         source=f"asr:{asr_model_size}")
 
+    scheduler.run([str(PathHelper.audio_dir / f"{channel_name}" / fname_ext) for fname_ext in fnames_selected],
+                  on_result=save_result)
 
 if __name__ == "__main__":
 
@@ -1,15 +1,23 @@
 channel_name = 'Cofit211'
+# 同時保存 bge-m3 的 lexical weights 到倒排索引（混合檢索用）；colbert 向量體積很大，預設不保存
+save_lexical_weights = True
+save_colbert_vecs = False
+# 每批補齊後的 token 數上限（批次大小 x 最長段落的 token 數），依 GPU 記憶體調整
+max_batch_tokens = 32768
+# 切分與嵌入設定，變更後 manifest 會把所有影片視為需要更新
+# chunk 以句子為邊界、帶有在影片中的開始與結束秒數；大小（字元數）可用 src/others/benchmark_chunking.py 比較檢索品質
+chunk_size = 600
+chunk_overlap = 100
+model_name = 'BAAI/bge-m3'
+max_length = 8192
+# 每個視窗處理的影片數：處理完一個視窗就寫入 manifest 作為檢查點，記憶體用量與影片總數無關
+videos_per_window = 50
 
-import os
-import pandas as pd
 # from openai import OpenAI
 from FlagEmbedding import BGEM3FlagModel
 from dotenv import load_dotenv
-from langchain.document_loaders import DataFrameLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from tqdm import tqdm
 import chromadb
-import time
 
 try:
     import sys
@@ -19,7 +27,10 @@ try:
     project_root = Path(__file__).parent.parent.parent
     sys.path.insert(0, str(project_root))
     
-    from src.utils import PathHelper, get_logger
+    from src.utils import (
+        PathHelper, get_logger, append_hybrid_segment, merge_hybrid_segments, encode_in_batches, ThroughputMeter, IngestManifest,
+        export_dense_index, dense_index_path, DenseIndex, open_transcript_store, chunk_transcript
+    )
 except Exception as e:
     print(e)
     raise Exception("Please run this script from the root directory of the project")
@@ -27,6 +38,9 @@ except Exception as e:
 # 日誌記錄器
 logger = get_logger(__name__)
 
+# chromadb 0.5 起可直接接受 NumPy 陣列作為 embeddings，舊版需先轉成 list
+CHROMA_ACCEPTS_NDARRAY = tuple(int(v) for v in chromadb.__version__.split(".")[:2]) >= (0, 5)
+
 # 載入環境變數
 dotenv_path = PathHelper.root_dir / ".env"
 load_dotenv(dotenv_path=dotenv_path)
@@ -37,109 +51,174 @@ load_dotenv(dotenv_path=dotenv_path)
 #     base_url="https://api.deepinfra.com/v1/openai",
 # )
 
-def main():
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=6000, chunk_overlap=600, length_function=len
-    )
-    
-    # 載入資料到資料框
-    videos = os.listdir(PathHelper.text_dir / channel_name)
-    video_ids = [v.split(".")[0] for v in videos]
-    df_videos = pd.DataFrame({"video_id": video_ids})
-    
+def update_exports(collection, collection_name):
+    # 把這次執行（以及之前中斷留下）的倒排索引片段一次併入索引
+    merge_hybrid_segments(PathHelper.db_dir, collection_name)
+    # 已匯出 DenseIndex（RETRIEVER_BACKEND=dense）時一併更新，避免查詢到舊的內容
+    output_dir = dense_index_path(PathHelper.db_dir, collection_name)
+    if output_dir.exists() and collection.count():
+        export_dense_index(collection, output_dir, dtype=DenseIndex(output_dir).dtype)
+
+def split_text(video_id, text, segments=None):
+    """切分一支影片的逐字稿，回傳 [(video id, chunk id, 內容, metadata)]；metadata 含 chunk 在影片中的秒數"""
+    chunks = []
+    for j, chunk in enumerate(chunk_transcript(text, segments, chunk_size=chunk_size, chunk_overlap=chunk_overlap)):
+        metadata = {"video_id": video_id}
+        # chroma 的 metadata 不接受 None，沒有時間資訊（舊版逐字稿）時不寫入
+        if chunk["start"] is not None:
+            metadata["start"] = chunk["start"]
+            metadata["end"] = chunk["end"]
+        chunks.append((video_id, f"id_{video_id}_{j}", chunk["text"], metadata))
+    return chunks
+
+def split_videos(store, video_ids):
+    """從逐字稿 store 讀取並切分一個視窗內的影片，回傳 [(video id, chunk id, 內容, metadata)]"""
+    chunks = []
+    for record in store.scan(["text", "segments"], video_ids):
+        logger.info(f"{record['video_id']} length: {len(record['text'])}")
+        chunks.extend(split_text(record["video_id"], record["text"], record["segments"]))
+    return chunks
+
+def open_collection(channel_name):
+    """回傳（client, collection, collection_name）"""
+    collection_name = channel_name+'-cosine'
+
     # 初始化 Chroma 客戶端
     client = chromadb.PersistentClient(path=str(PathHelper.db_dir))
 
     # 檢查集合是否存在，如果不存在則建立
     try:
-        collection = client.get_or_create_collection(name=channel_name+'-cosine',
+        collection = client.get_or_create_collection(name=collection_name,
                                                      metadata={"hnsw:space": "cosine"})
         print(f"Using collection '{channel_name}'.")
     except ValueError as e:
         print(f"Error creating or getting collection: {e}")
         raise
+    return client, collection, collection_name
+
+def load_manifest(collection_name):
+    return IngestManifest(PathHelper.db_dir / f"{collection_name}.manifest.json", {
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "chunker": "sentences-with-timestamps",
+        "model": model_name,
+        "max_length": max_length,
+    })
+
+def load_model():
+    return BGEM3FlagModel(model_name, use_fp16=True)
+
+def ingest_chunks(collection, collection_name, model, manifest, meter, chunks):
+    """
+    嵌入並寫入一組影片的所有 chunk，刪除多出來的舊 chunk、寫入倒排索引的片段並記錄到 manifest（呼叫端負責 save）
 
-    new_list = []
-    # 透過將文字分割為約 8192 個 token 的大小來建立新清單
-    for _, row in df_videos.iterrows():
-        video_id = row["video_id"]
-        
-        # 檢查 video_id 是否已存在於集合中
-        existing_docs = collection.get(
-            where={"video_id": video_id},
-            include=["metadatas"]
+    chunks 必須包含這些影片的全部 chunk；回傳（寫入的 chunk 數, 刪除的舊 chunk 數）。
+    """
+    video_ids = [video_id for video_id, _, _, _ in chunks]
+    ids = [doc_id for _, doc_id, _, _ in chunks]
+    texts = [text for _, _, text, _ in chunks]
+    metadatas = [metadata for _, _, _, metadata in chunks]
+    lexical_weights_list = []
+    colbert_vecs_list = []
+    for batch, output in encode_in_batches(model, texts,
+                                           max_tokens=max_batch_tokens,
+                                           max_length=max_length,
+                                           meter=meter,
+                                           return_sparse=save_lexical_weights,
+                                           return_colbert_vecs=save_colbert_vecs,
+                                           ):
+        # 將資料寫入集合（內容有變動的影片沿用相同的 id，以 upsert 覆寫）
+        dense_vecs = output['dense_vecs']
+        collection.upsert(
+            embeddings=dense_vecs if CHROMA_ACCEPTS_NDARRAY else dense_vecs.tolist(),
+            documents=[texts[i] for i in batch],
+            ids=[ids[i] for i in batch],
+            metadatas=[metadatas[i] for i in batch]
         )
-        
-        if existing_docs["ids"]:
-            print(f"Video ID {video_id} already exists in the collection. Skipping.")
-            continue
-        
-        try:
-            with open(PathHelper.text_dir / channel_name / f"{video_id}.txt", encoding="utf8") as f:
-                transcript = f.readlines()
-                text = eval(transcript[0])
-            print(f"{video_id} length: {len(text)}")
-            
-            if len(text) <= 6000:
-                new_list.append([video_id, text, 0])
-            else:
-                # 使用文字分割器將文字分割為塊
-                split_text = text_splitter.split_text(text)
-                for j, chunk in enumerate(split_text):
-                    new_list.append([video_id, chunk, j])
-                    
-        except Exception as e:
-            logger.error(f"Error processing video ID {video_id}: {e}")
-    
-    if not new_list:
+        if save_lexical_weights:
+            lexical_weights_list.extend(zip((ids[i] for i in batch), output['lexical_weights']))
+        if save_colbert_vecs:
+            colbert_vecs_list.extend(output['colbert_vecs'])
+
+    # 內容變短的影片刪除多出來的舊 chunk
+    window_ids = {}
+    for video_id, doc_id in zip(video_ids, ids):
+        window_ids.setdefault(video_id, []).append(doc_id)
+    stale_ids = []
+    for video_id, chunk_ids in window_ids.items():
+        stale_ids.extend(sorted(set(manifest.chunk_ids(video_id)) - set(chunk_ids)))
+    if stale_ids:
+        collection.delete(ids=stale_ids)
+    if save_lexical_weights and ids:
+        batch_ids = [doc_id for doc_id, _ in lexical_weights_list]
+        # 只寫這個視窗的片段，整個索引在 update_exports 合併一次
+        append_hybrid_segment(PathHelper.db_dir, collection_name, batch_ids,
+                              [weights for _, weights in lexical_weights_list],
+                              colbert_vecs_list if save_colbert_vecs else None,
+                              delete_ids=stale_ids)
+
+    for video_id, chunk_ids in window_ids.items():
+        manifest.record(video_id, chunk_ids)
+    return len(ids), len(stale_ids)
+
+def main(channel_name=channel_name):
+    # 目前所有的逐字稿（只讀 store 的索引，不需讀取內容）
+    store = open_transcript_store(PathHelper.text_dir, channel_name)
+    hashes = store.hashes()
+
+    client, collection, collection_name = open_collection(channel_name)
+
+    # 以 manifest 比對內容雜湊，一次決定要新增、更新、刪除或略過哪些影片
+    manifest = load_manifest(collection_name)
+    if not manifest.exists and collection.count():
+        manifest.bootstrap_from_collection(collection, hashes)
+    diff = manifest.diff(hashes)
+    print(f"Manifest: {diff}")
+
+    # 刪除已不存在的影片（先寫入 manifest，之後中斷也不會重做）
+    deleted_ids = []
+    for video_id in diff.deleted:
+        deleted_ids.extend(manifest.chunk_ids(video_id))
+        manifest.remove(video_id)
+    if deleted_ids:
+        collection.delete(ids=deleted_ids)
+        if save_lexical_weights:
+            append_hybrid_segment(PathHelper.db_dir, collection_name, [], [], delete_ids=deleted_ids)
+        print(f"Deleted {len(deleted_ids)} chunks of {len(diff.deleted)} removed videos.")
+    manifest.save()
+
+    to_ingest = diff.to_ingest
+    if not to_ingest:
+        if deleted_ids:
+            update_exports(collection, collection_name)
+        else:
+            merge_hybrid_segments(PathHelper.db_dir, collection_name)
         print("No new videos to process. Exiting.")
         return client
 
-    df_new = pd.DataFrame(new_list, columns=["video_id", "content", "chunk_index"])
-    
-    # 建立文件
-    loader = DataFrameLoader(df_new, page_content_column="content")
-    docs = loader.load()
-    page_contents = [doc.page_content for doc in docs]
-    embeddings_list = []
-    
-    # 建立嵌入向量 
-    model = BGEM3FlagModel('BAAI/bge-m3', use_fp16=True)
-    for content in tqdm(page_contents, total=len(page_contents)):
-    # for content in page_contents:
-        t1 = time.time()
-        # embeddings = openai.embeddings.create(
-        #     model="BAAI/bge-m3",
-        #     input=content,
-        #     encoding_format="float"
-        # )
-        embeddings = model.encode(content, 
-                                  batch_size=12, 
-                                  max_length=8192,
-                                  )['dense_vecs']
-        t2 = time.time()
-        print(f"len(str): {len(content)}")
-        # print(f"Tokens used for embedding: {embeddings.usage.prompt_tokens}")
-        print(f"Sec used: {t2 - t1}")
-        print("==================================")
-        # embeddings_list.append(embeddings.data[0].embedding)
-        embeddings_list.append(embeddings.tolist())
-
-    # 準備資料
-    # 修改 ids 的產生方式，確保唯一性
-    ids = [f"id_{row['video_id']}_{row['chunk_index']}" for _, row in df_new.iterrows()]
-    # 只在 metadatas 中包含 video_id
-    metadatas = [{"video_id": row['video_id']} for _, row in df_new.iterrows()]
-
-    # 將資料加入集合
-    collection.add(
-        embeddings=embeddings_list,
-        documents=page_contents,
-        ids=ids,
-        metadatas=metadatas
-    )
+    # 以固定數量的影片為一個視窗：切分、嵌入、寫入後更新 manifest 作為檢查點，
+    # 記憶體用量只與視窗大小有關；中斷後重新執行，已完成的影片在 diff 中會是 unchanged
+    model = load_model()
+    meter = ThroughputMeter()
+    progress = tqdm(total=len(to_ingest), unit="video")
+    upserted = stale_count = 0
+    for start in range(0, len(to_ingest), videos_per_window):
+        window = to_ingest[start:start + videos_per_window]
+        chunks = split_videos(store, window)
+        n_upserted, n_stale = ingest_chunks(collection, collection_name, model, manifest, meter, chunks)
+
+        # 檢查點：這個視窗的影片都已寫入 manifest
+        manifest.save()
+        upserted += n_upserted
+        stale_count += n_stale
+        progress.update(len(window))
+        logger.info(f"window {start // videos_per_window + 1}: {len(window)} videos, {n_upserted} chunks, {meter}")
+    progress.close()
+    print(f"Embedding throughput: {meter}")
 
-    print(f"Added {len(new_list)} new video chunks to the collection.")
+    update_exports(collection, collection_name)
+    print(f"Upserted {upserted} chunks of {len(to_ingest)} videos, "
+          f"deleted {len(deleted_ids) + stale_count} stale chunks.")
     return client
 
 if __name__ == "__main__":
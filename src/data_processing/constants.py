@@ -2,4 +2,5 @@ VIDEO_ID = "video_id"
 VIDEO_URL = "video_url"
 TITLE = "title"
 TRANSCRIPT = "transcript"
-CHANNEL_NAME = "channel_name"
\ No newline at end of file
+CHANNEL_NAME = "channel_name"
+TRANSCRIPT_SOURCE = "transcript_source"
@@ -0,0 +1,92 @@
+# 要處理的頻道：新增頻道只需在這裡加一行（或在命令列指定）
+channels = [
+    'Cofit211',
+]
+# 同時執行的（頻道, 階段）數；語音辨識與嵌入需要載入大型模型，各自限制同時只跑一個頻道
+max_workers = 4
+
+import importlib.util
+import threading
+
+try:
+    import sys
+    from pathlib import Path
+
+    # 將專案根目錄加入 Python 路徑以供匯入
+    project_root = Path(__file__).parent.parent.parent
+    sys.path.insert(0, str(project_root))
+
+    from src.utils import PathHelper, get_logger, ChannelStage, StageCache, run_channels, transcript_store_path
+except Exception as e:
+    print(e)
+    raise Exception("Please run this script from the root directory of the project")
+
+# 日誌記錄器
+logger = get_logger(__name__)
+
+# 用法：python src/data_processing/run_pipeline.py [頻道 ...] [--force 階段,階段]
+# 流程：crawl → transcript ─────────→ index
+#            └→ audio → asr ───────↗
+# 每個階段沿用各腳本的 main(channel_name)，已處理過的影片由腳本本身略過；
+# 階段的輸入目錄與上次成功時相同則整個階段略過（狀態存在 data/pipeline_state.json）
+
+_modules = {}
+_modules_lock = threading.Lock()
+
+
+def load_script(fname):
+    """載入編號開頭的處理腳本（無法直接 import），同一腳本只載入一次，模型也只初始化一次"""
+    with _modules_lock:
+        if fname not in _modules:
+            spec = importlib.util.spec_from_file_location(fname.split(".")[0], Path(__file__).parent / fname)
+            module = importlib.util.module_from_spec(spec)
+            # 註冊到 sys.modules，腳本中的函數才能傳給子程序（例如 02 的 ProcessPoolExecutor）
+            sys.modules[spec.name] = module
+            spec.loader.exec_module(module)
+            _modules[fname] = module
+        return _modules[fname]
+
+
+def script_stage(fname):
+    def run(channel_name):
+        for directory in (PathHelper.entities_dir, PathHelper.audio_dir):
+            (directory / channel_name).mkdir(parents=True, exist_ok=True)
+        load_script(fname).main(channel_name=channel_name)
+    return run
+
+
+def build_stages():
+    return [
+        # 抓取遠端的影片清單，每次都執行（本身為增量）
+        ChannelStage("crawl", script_stage("01_video_crawler.py")),
+        ChannelStage("transcript", script_stage("02_transcript_to_text.py"), deps=["crawl"],
+                     inputs=lambda ch: [PathHelper.entities_dir / ch]),
+        ChannelStage("audio", script_stage("03_video_to_audio.py"), deps=["crawl"],
+                     inputs=lambda ch: [PathHelper.entities_dir / ch]),
+        ChannelStage("asr", script_stage("04_audio_to_text.py"), deps=["audio"],
+                     inputs=lambda ch: [PathHelper.audio_dir / ch], max_concurrency=1),
+        ChannelStage("index", script_stage("05_storage_chroma.py"), deps=["transcript", "asr"],
+                     inputs=lambda ch: [transcript_store_path(PathHelper.text_dir, ch)], max_concurrency=1),
+    ]
+
+
+def main():
+    args = sys.argv[1:]
+    force = []
+    if "--force" in args:
+        i = args.index("--force")
+        force = args[i + 1].split(",") if i + 1 < len(args) else []
+        args = args[:i] + args[i + 2:]
+    selected = args or channels
+
+    PathHelper.ensure_dirs()
+    cache = StageCache(PathHelper.data_dir / "pipeline_state.json")
+    results = run_channels(selected, build_stages(), cache=cache, max_workers=max_workers, force=force)
+    for channel_name, stages in results.items():
+        logger.info(f"{channel_name}: " + ", ".join(f"{name}={status}" for name, status in stages.items()))
+    return results
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,185 @@
+channel_name = 'Cofit211'
+# 各階段的並行數與佇列上限：下載與語音辨識較慢，以多個 worker 處理；標點與嵌入以小批次處理
+download_workers = 2
+asr_workers = 2
+punct_batch_videos = 8
+embed_batch_videos = 4
+queue_size = 4
+
+import json
+import os
+
+try:
+    import sys
+    from pathlib import Path
+
+    # 將專案根目錄加入 Python 路徑以供匯入
+    project_root = Path(__file__).parent.parent.parent
+    sys.path.insert(0, str(project_root))
+
+    import src.data_processing.constants as const
+    from src.data_processing.run_pipeline import load_script
+    from src.utils import (
+        PathHelper, get_logger, StreamingPipeline, StreamStage, ThroughputMeter, TranscriptionScheduler,
+        load_whisper_model, PytubefixAudioSource, FailureLedger, download_audio_files, find_audio_file,
+        open_transcript_store
+    )
+except Exception as e:
+    print(e)
+    raise Exception("Please run this script from the root directory of the project")
+
+# 日誌記錄器
+logger = get_logger(__name__)
+
+# 用法：python src/data_processing/stream_pipeline.py [channel_name]
+# 串流模式：每支影片依序經過 下載 → 語音辨識 → 標點 → 切分 → 嵌入，完成一個階段就進入下一個階段，
+# 階段之間以有界佇列連接；每批嵌入完成就寫入集合與 manifest，新影片不需等整個頻道處理完就能被搜尋。
+# 逐字稿與批次執行寫入同一個 store，之後的批次執行（02–05）會視為已完成。
+
+
+def list_videos(channel_name, store, manifest):
+    """依頻道清單的順序（新到舊）列出需要處理的影片"""
+    entities_dir = PathHelper.entities_dir / channel_name
+    listing_fname = PathHelper.entities_dir / f"{channel_name}.videos.json"
+    if listing_fname.exists():
+        with open(listing_fname, encoding="utf-8") as f:
+            video_ids = [video[const.VIDEO_ID] for video in json.load(f)]
+    else:
+        video_ids = sorted(i.split(".")[0] for i in os.listdir(entities_dir) if i.endswith(".json"))
+
+    items = []
+    for video_id in video_ids:
+        entity_fname = entities_dir / f"{video_id}.json"
+        if video_id in store:
+            if not manifest.is_current(video_id, store.get_hash(video_id)):
+                items.append({"video_id": video_id, "kind": "text"})
+            continue
+        if not entity_fname.exists():
+            continue
+        with open(entity_fname) as f:
+            entity = json.load(f)
+        kind = "transcript" if entity.get(const.TRANSCRIPT) else "audio"
+        items.append({"video_id": video_id, "kind": kind, "video_url": entity[const.VIDEO_URL]})
+    return items
+
+
+def main(channel_name=channel_name):
+    storage = load_script("05_storage_chroma.py")
+    transcript_to_text = load_script("02_transcript_to_text.py")
+    audio_to_text = load_script("04_audio_to_text.py")
+
+    for directory in (PathHelper.entities_dir, PathHelper.audio_dir):
+        (directory / channel_name).mkdir(parents=True, exist_ok=True)
+    entities_dir = PathHelper.entities_dir / channel_name
+    audio_dir = PathHelper.audio_dir / channel_name
+
+    client, collection, collection_name = storage.open_collection(channel_name)
+    manifest = storage.load_manifest(collection_name)
+    store = open_transcript_store(PathHelper.text_dir, channel_name)
+    items = list_videos(channel_name, store, manifest)
+    logger.info(f"{len(items)} videos to process: "
+                + ", ".join(f"{kind}={sum(item['kind'] == kind for item in items)}"
+                            for kind in ("text", "transcript", "audio")))
+    if not items:
+        return client
+
+    ledger = FailureLedger(audio_dir / "download_failures.json")
+    audio_source = PytubefixAudioSource()
+    scheduler = None
+    if any(item["kind"] == "audio" for item in items):
+        model = load_whisper_model(audio_to_text.model_size, workers=asr_workers,
+                                   threads_per_worker=max(1, (os.cpu_count() or 1) // asr_workers))
+        scheduler = TranscriptionScheduler(model, workers=asr_workers, batch_size=audio_to_text.asr_batch_size,
+                                           vad_filter=True, beam_size=5, initial_prompt="以下是普通話的句子。")
+    embed_model = storage.load_model()
+    meter = ThroughputMeter()
+
+    def download(item):
+        if item["kind"] != "audio":
+            return item
+        path = find_audio_file(audio_dir, item["video_id"])
+        if path is None:
+            download_audio_files(audio_source, [(item["video_id"], item["video_url"])], audio_dir,
+                                 workers=1, ledger=ledger)
+            path = find_audio_file(audio_dir, item["video_id"])
+        if path is None:
+            return None
+        return {**item, "audio_path": str(path)}
+
+    def transcribe(item):
+        if item["kind"] != "audio":
+            return item
+        result = scheduler.transcribe(item["audio_path"])
+        logger.info(str(result))
+        if result.language not in ("en", "zh"):
+            return {**item, "text": ""}
+        return {**item, "segments": result.segments}
+
+    def punctuate(batch):
+        entities = {}
+        for item in batch:
+            if item["kind"] == "transcript":
+                with open(entities_dir / f"{item['video_id']}.json") as f:
+                    entities[item["video_id"]] = json.load(f)
+        transcripts = [[t["text"] for t in entity[const.TRANSCRIPT]] for entity in entities.values()]
+        restored = dict(zip(entities, transcript_to_text.preprocess_transcripts(transcripts) if transcripts else []))
+
+        results, records = [], []
+        for item in batch:
+            video_id = item["video_id"]
+            if item["kind"] == "text":
+                record = store.get(video_id)
+                results.append({**item, "text": record["text"], "segments": record["segments"]})
+                continue
+            if item["kind"] == "transcript":
+                entity = entities[video_id]
+                record = {"text": restored[video_id],
+                          "segments": transcript_to_text.transcript_segments(entity[const.TRANSCRIPT]),
+                          "source": entity.get(const.TRANSCRIPT_SOURCE)}
+            elif "segments" in item:
+                record = {"text": audio_to_text.punctuate_segments(transcript_to_text.get_punct_model(),
+                                                                   item["segments"]),
+                          "segments": audio_to_text.asr_segments(item["segments"]),
+                          "source": f"asr:{audio_to_text.model_size}"}
+            else:
+                record = {"text": item["text"], "segments": [], "source": f"asr:{audio_to_text.model_size}"}
+            records.append({"video_id": video_id, **record})
+            results.append({**item, "text": record["text"], "segments": record["segments"]})
+        # 與批次執行寫入同一個 store
+        store.put_many(records)
+        return results
+
+    def split(item):
+        return {"video_id": item["video_id"],
+                "chunks": storage.split_text(item["video_id"], item["text"], item["segments"])}
+
+    def embed(batch):
+        for item in batch:
+            manifest.track(item["video_id"], store.get_hash(item["video_id"]))
+        chunks = [chunk for item in batch for chunk in item["chunks"]]
+        storage.ingest_chunks(collection, collection_name, embed_model, manifest, meter, chunks)
+        # 寫入 manifest 後這些影片就可以被搜尋，中斷後重新執行也不會重做
+        manifest.save()
+        return [item["video_id"] for item in batch]
+
+    pipeline = StreamingPipeline([
+        StreamStage("download", download, workers=download_workers, queue_size=queue_size),
+        StreamStage("asr", transcribe, workers=asr_workers, queue_size=queue_size),
+        StreamStage("punctuate", punctuate, batch_size=punct_batch_videos, queue_size=queue_size),
+        StreamStage("split", split, queue_size=queue_size),
+        StreamStage("embed", embed, batch_size=embed_batch_videos, queue_size=queue_size),
+    ])
+    stats = pipeline.run(items, on_output=lambda video_id, latency:
+                         logger.info(f"{video_id} searchable {latency:.1f}s after entering the pipeline"))
+    print(f"Processed {stats['completed']}/{stats['items']} videos in {stats['seconds']}s, "
+          f"first searchable after {stats['first_latency']}s, median {stats['p50_latency']}s")
+    print(f"Embedding throughput: {meter}")
+
+    # 倒排索引的片段在全部影片處理完後合併一次，在此之前新影片只能以 dense 檢索
+    storage.update_exports(collection, collection_name)
+    return client
+
+
+if __name__ == "__main__":
+
+    main(sys.argv[1] if len(sys.argv) > 1 else channel_name)
@@ -1,4 +1,3 @@
-import os
 from FlagEmbedding import BGEM3FlagModel
 from openai import OpenAI
 import numpy as np
@@ -10,7 +9,7 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from src.utils import PathHelper
+from src.utils import PathHelper, open_transcript_store
 
 model = BGEM3FlagModel('BAAI/bge-m3', use_fp16=True)
 
@@ -19,15 +18,10 @@ openai = OpenAI(
     base_url="https://api.deepinfra.com/v1/openai",
 )
 
-files = os.listdir(PathHelper.text_dir / 'test')
+store = open_transcript_store(PathHelper.text_dir, 'test')
 
-if '.DS_Store' in files:
-    del(files[0])
-
-for file in files:
-    with open(PathHelper.text_dir / 'test' / file, encoding="utf8") as f:
-        transcript = f.readlines()
-        text = eval(transcript[0])
+for record in store.scan(["text"]):
+    text = record["text"]
     # text = text[:800]
     
     embeddings_1 = model.encode(text, 
@@ -0,0 +1,39 @@
+import sys
+import tempfile
+from pathlib import Path
+
+# 將專案根目錄加入 Python 路徑以供匯入
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils import FailureLedger, FakeAudioSource, download_audio_files
+
+# 以本地的假音訊來源比較不同並行數的下載速度（MB/s、files/min），並驗證中斷續傳與失敗記錄
+# 用法：python src/others/benchmark_audio_download.py [影片數] [每支 MB] [每個連線的 MB/s] [每 64KB 中斷的機率]
+
+
+def main():
+    n_videos = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    size_mb = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    bandwidth_mb = float(sys.argv[3]) if len(sys.argv) > 3 else 5.0
+    failure_rate = float(sys.argv[4]) if len(sys.argv) > 4 else 0.002
+
+    sizes = {f"video{i:04d}": int(size_mb * 1e6) for i in range(n_videos)}
+    videos = [(video_id, f"https://www.youtube.com/watch?v={video_id}") for video_id in sizes]
+    videos.append(("missing", "https://www.youtube.com/watch?v=missing"))
+
+    for workers in (1, 4, 16):
+        with tempfile.TemporaryDirectory() as output_dir:
+            source = FakeAudioSource(sizes, bandwidth=bandwidth_mb * 1e6, failure_rate=failure_rate)
+            ledger = FailureLedger(Path(output_dir) / "download_failures.json", max_attempts=2)
+            stats = download_audio_files(source, videos, output_dir, workers=workers, retries=5, base_delay=0.01,
+                                         rate=1000, ledger=ledger, range_size=1 << 20)
+            intact = all((Path(output_dir) / f"{video_id}.m4a").read_bytes() == FakeAudioSource.content(video_id, size)
+                         for video_id, size in sizes.items())
+            print(f"workers={workers:>3}: {stats['mb_per_sec']:>6.1f} MB/s, {stats['files_per_min']:>7.1f} files/min, "
+                  f"downloaded={stats['downloaded']} resumed={stats['resumed']} failed={stats['failed']} "
+                  f"intact={intact} ledger={sorted(ledger.entries)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from FlagEmbedding import BGEM3FlagModel
+
+# 將專案根目錄加入 Python 路徑以供匯入
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils import PathHelper, open_transcript_store, chunk_transcript
+
+# 比較不同 chunk 大小的檢索品質與送進 prompt 的背景資訊長度（bot 只把第一名的 chunk 當作背景資訊）
+# 用法：python src/others/benchmark_chunking.py [channel_name] [影片數] [queries.json]
+# queries.json 為標註好的問題 [{"query": "...", "video_id": "...", "t": 秒數（可省略）}, ...]；
+# 沒有提供時從逐字稿抽出片段當作問題，主要用來比較 chunk 的時間定位與長度，分數會比真實問題高
+channel_name = sys.argv[1] if len(sys.argv) > 1 else 'Cofit211'
+n_videos = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+queries_path = sys.argv[3] if len(sys.argv) > 3 else None
+chunk_sizes = [300, 600, 1200, 2400, 6000]
+# 重疊的字元數為 chunk 大小的比例
+overlap_ratio = 1 / 6
+top_k = 3
+queries_per_video = 2
+
+store = open_transcript_store(PathHelper.text_dir, channel_name)
+rng = random.Random(0)
+records = {record["video_id"]: record for record in store.scan(["text", "segments"]) if record["text"].strip()}
+video_ids = sorted(records)
+rng.shuffle(video_ids)
+video_ids = sorted(video_ids[:n_videos])
+
+if queries_path:
+    with open(queries_path, encoding="utf-8") as f:
+        queries = json.load(f)
+    # 問題對應的影片必須在比較的影片中
+    video_ids = sorted(set(video_ids) | {query["video_id"] for query in queries if query["video_id"] in records})
+else:
+    queries = []
+    for video_id in video_ids:
+        segments = records[video_id]["segments"]
+        if len(segments) < 4:
+            continue
+        for index in rng.sample(range(1, len(segments) - 2), min(queries_per_video, len(segments) - 3)):
+            queries.append({"query": " ".join(segment[2] for segment in segments[index:index + 2]),
+                            "video_id": video_id, "t": segments[index][0]})
+print(f"{len(video_ids)} videos, {len(queries)} queries")
+
+model = BGEM3FlagModel('BAAI/bge-m3', use_fp16=True)
+query_vecs = model.encode([query["query"] for query in queries], batch_size=12, max_length=512)['dense_vecs']
+
+print(f"{'chunk_size':>10} {'chunks':>7} {'video@1':>8} {f'video@{top_k}':>8} {'time@1':>7} "
+      f"{'MRR':>6} {'context':>8} {'encode_s':>9}")
+for chunk_size in chunk_sizes:
+    chunk_overlap = int(chunk_size * overlap_ratio)
+    chunks = []
+    for video_id in video_ids:
+        record = records[video_id]
+        for chunk in chunk_transcript(record["text"], record["segments"], chunk_size, chunk_overlap):
+            chunks.append({**chunk, "video_id": video_id})
+
+    t1 = time.time()
+    doc_vecs = model.encode([chunk["text"] for chunk in chunks], batch_size=12, max_length=8192)['dense_vecs']
+    encode_seconds = time.time() - t1
+    scores = query_vecs @ doc_vecs.T
+    top = np.argsort(-scores, axis=1)[:, :top_k]
+
+    video_hit_1 = video_hit_k = time_hit = reciprocal_rank = context_chars = 0
+    for query, ranked in zip(queries, top):
+        ranked_chunks = [chunks[i] for i in ranked]
+        hits = [chunk["video_id"] == query["video_id"] for chunk in ranked_chunks]
+        video_hit_1 += hits[0]
+        video_hit_k += any(hits)
+        reciprocal_rank += 1 / (hits.index(True) + 1) if any(hits) else 0
+        first = ranked_chunks[0]
+        if hits[0] and query.get("t") is not None and first["start"] is not None:
+            time_hit += first["start"] <= query["t"] <= first["end"]
+        context_chars += len(first["text"])
+
+    n = max(len(queries), 1)
+    print(f"{chunk_size:>10} {len(chunks):>7} {video_hit_1 / n:>8.3f} {video_hit_k / n:>8.3f} {time_hit / n:>7.3f} "
+          f"{reciprocal_rank / n:>6.3f} {context_chars / n:>8.0f} {encode_seconds:>9.1f}")
@@ -0,0 +1,59 @@
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from FlagEmbedding import BGEM3FlagModel
+
+# 將專案根目錄加入 Python 路徑以供匯入
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils import PathHelper, HybridRetriever
+
+# 比較 dense-only 與混合檢索的結果，並量測每個階段（編碼、dense、sparse、融合、colbert）的延遲
+# 用法：python src/others/benchmark_hybrid.py [collection_name]
+collection_name = sys.argv[1] if len(sys.argv) > 1 else 'Cofit211-cosine'
+top_k = 3
+queries = [
+    '肚子痛該怎麼辦？',
+    '二甲雙胍會傷腎嗎？',
+    '地中海飲食適合減重嗎？',
+    '維生素D要怎麼補充？',
+    '膝蓋退化可以吃葡萄糖胺嗎？',
+    '糖尿病可以吃地瓜嗎？',
+    '間歇性斷食會掉肌肉嗎？',
+    '益生菌什麼時候吃比較好？',
+]
+
+model = BGEM3FlagModel('BAAI/bge-m3', use_fp16=True)
+retriever = HybridRetriever.load(PathHelper.db_dir, collection_name)
+use_colbert = retriever.colbert is not None
+
+stage_ms = {}
+changed = 0
+for query in queries:
+    t1 = time.time()
+    output = model.encode([query], max_length=8192, return_sparse=True, return_colbert_vecs=use_colbert)
+    stage_ms.setdefault("encode", []).append(1000 * (time.time() - t1))
+
+    dense_only = retriever.dense.query(output['dense_vecs'].tolist(), n_results=top_k, include=["metadatas"])
+    t1 = time.time()
+    results = retriever.query(output['dense_vecs'].tolist(), n_results=top_k,
+                              include=["metadatas"],
+                              query_lexical_weights=output['lexical_weights'],
+                              query_colbert_vecs=output.get('colbert_vecs'))
+    stage_ms.setdefault("retrieval_total", []).append(1000 * (time.time() - t1))
+    for stage, ms in results["timings"].items():
+        stage_ms.setdefault(stage, []).append(ms)
+
+    if dense_only["ids"][0] != results["ids"][0]:
+        changed += 1
+    print(query)
+    print(f"  dense : {[m['video_id'] for m in dense_only['metadatas'][0]]}")
+    print(f"  hybrid: {[m['video_id'] for m in results['metadatas'][0]]}")
+
+print(f"documents: {retriever.count()}, colbert rerank: {use_colbert}")
+for stage, values in stage_ms.items():
+    print(f"{stage:>16}: p50={np.percentile(values, 50):.2f}ms p95={np.percentile(values, 95):.2f}ms")
+print(f"queries whose top-{top_k} changed: {changed}/{len(queries)}")
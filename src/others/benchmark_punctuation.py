@@ -0,0 +1,66 @@
+import importlib.util
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+# 將專案根目錄加入 Python 路徑以供匯入
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils import PathHelper
+
+# 比較逐段呼叫 restore_punctuation 與批次推論的速度（videos/min），並確認輸出完全相同
+# 用法：python src/others/benchmark_punctuation.py [channel_name] [影片數] [videos_per_batch]
+
+
+def load_stage():
+    path = project_root / "src" / "data_processing" / "02_transcript_to_text.py"
+    spec = importlib.util.spec_from_file_location("transcript_to_text", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    channel_name = sys.argv[1] if len(sys.argv) > 1 else "Cofit211"
+    n_videos = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    videos_per_batch = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+
+    entities_dir = PathHelper.entities_dir / channel_name
+    transcripts = []
+    for fname in sorted(os.listdir(entities_dir)):
+        if not fname.endswith(".json"):
+            continue
+        with open(entities_dir / fname) as f:
+            transcript = json.load(f).get("transcript")
+        if transcript:
+            transcripts.append([t["text"] for t in transcript])
+        if len(transcripts) >= n_videos:
+            break
+    print(f"{len(transcripts)} videos, {sum(len(t) for t in transcripts)} caption lines")
+
+    stage = load_stage()
+    stage.get_punct_model()
+
+    t1 = time.time()
+    expected = [stage.preprocess_transcript(transcript) for transcript in transcripts]
+    sequential = time.time() - t1
+    print(f"sequential: {sequential:.1f}s ({len(transcripts) / sequential * 60:.1f} videos/min)")
+
+    t1 = time.time()
+    batched = []
+    for i in range(0, len(transcripts), videos_per_batch):
+        batched.extend(stage.preprocess_transcripts(transcripts[i:i + videos_per_batch]))
+    elapsed = time.time() - t1
+    print(f"batched:    {elapsed:.1f}s ({len(transcripts) / elapsed * 60:.1f} videos/min), "
+          f"speedup {sequential / elapsed:.1f}x")
+
+    mismatched = [i for i, (a, b) in enumerate(zip(expected, batched)) if a != b]
+    print(f"identical output: {not mismatched}" + (f" (mismatched videos: {mismatched})" if mismatched else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import resource
+import subprocess
+from pathlib import Path
+
+import numpy as np
+
+# 將專案根目錄加入 Python 路徑以供匯入
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+# 比較 Chroma 與 DenseIndex 的冷啟動時間、記憶體與查詢延遲
+# 每個 backend 在獨立的子程序中執行，冷啟動包含 import、載入索引與第一次查詢
+# 用法：python src/others/benchmark_retriever.py [collection_name] [查詢次數] [db_dir]
+# DenseIndex 需先以 export_dense_index.py 匯出（float16 與 int8 各匯出到不同目錄時可分別比較）
+
+TOP_K = 3
+
+
+def rss_mb():
+    """目前的 RSS（Linux 讀 /proc，其他平台以 ru_maxrss 近似）"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def run_worker(backend, collection_name, db_dir, queries_path):
+    t0 = time.time()
+    rss_start = rss_mb()
+    from src.utils import RetrieverCache
+
+    retriever = RetrieverCache(db_dir, collection_name, backend=backend)
+    collection = retriever.get_collection()
+    load_seconds = time.time() - t0
+    queries = np.load(queries_path)
+    collection.query(query_embeddings=[queries[0].tolist()], n_results=TOP_K, include=["documents", "metadatas"])
+    cold_start_seconds = time.time() - t0
+    rss_loaded = rss_mb()
+
+    latencies = []
+    top_ids = []
+    for query in queries:
+        t1 = time.time()
+        results = collection.query(query_embeddings=[query.tolist()], n_results=TOP_K,
+                                   include=["documents", "metadatas"])
+        latencies.append(time.time() - t1)
+        top_ids.append(results["ids"][0])
+
+    latencies.sort()
+    print(json.dumps({
+        "backend": backend,
+        "documents": collection.count(),
+        "load_seconds": round(load_seconds, 3),
+        "cold_start_seconds": round(cold_start_seconds, 3),
+        "rss_start_mb": round(rss_start, 1),
+        "rss_loaded_mb": round(rss_loaded, 1),
+        "rss_after_queries_mb": round(rss_mb(), 1),
+        "p50_ms": round(1000 * latencies[len(latencies) // 2], 3),
+        "p95_ms": round(1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+        "top_ids": top_ids,
+    }, ensure_ascii=False))
+
+
+def make_queries(collection_name, db_dir, n_queries):
+    """取集合中的向量加上雜訊作為查詢，兩個 backend 使用同一組查詢"""
+    import chromadb
+
+    client = chromadb.PersistentClient(path=str(db_dir))
+    collection = client.get_collection(name=collection_name)
+    embeddings = np.asarray(collection.get(include=["embeddings"], limit=n_queries)["embeddings"], dtype=np.float32)
+    rng = np.random.default_rng(0)
+    picks = embeddings[rng.integers(0, len(embeddings), n_queries)]
+    queries = picks + rng.normal(0, 0.02, picks.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def main():
+    collection_name = sys.argv[1] if len(sys.argv) > 1 else 'Cofit211-cosine'
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    from src.utils import PathHelper
+    db_dir = Path(sys.argv[3]) if len(sys.argv) > 3 else PathHelper.db_dir
+
+    queries_path = Path(tempfile.mkdtemp(prefix="benchmark-retriever-")) / "queries.npy"
+    np.save(queries_path, make_queries(collection_name, db_dir, n_queries))
+
+    results = {}
+    for backend in ("chroma", "dense"):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", backend, collection_name, str(db_dir), str(queries_path)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results[backend] = json.loads(output.strip().splitlines()[-1])
+
+    chroma_ids, dense_ids = results["chroma"].pop("top_ids"), results["dense"].pop("top_ids")
+    overlap = np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(chroma_ids, dense_ids) if a])
+    for result in results.values():
+        print(json.dumps(result, ensure_ascii=False))
+    print(f"top-{TOP_K} overlap with chroma: {overlap:.3f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        run_worker(sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5])
+    else:
+        main()
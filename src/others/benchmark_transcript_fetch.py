@@ -0,0 +1,39 @@
+import sys
+import tempfile
+from pathlib import Path
+
+# 將專案根目錄加入 Python 路徑以供匯入
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils import FakeTranscriptSource, fetch_transcripts
+
+# 以本地的假字幕來源比較逐支下載與平行下載的時間，並驗證中斷後可以續傳
+# 用法：python src/others/benchmark_transcript_fetch.py [影片數] [每次請求延遲秒數] [暫時性錯誤比例]
+
+
+def main():
+    n_videos = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    failure_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+
+    videos = [{"video_id": f"video{i:05d}", "channel_name": "fake"} for i in range(n_videos)]
+    # 每 10 支影片有 1 支沒有字幕
+    transcripts = {video["video_id"]: [{"text": "測試", "start": 0.0, "duration": 1.0}]
+                   for i, video in enumerate(videos) if i % 10}
+
+    for workers in (1, 8, 32):
+        with tempfile.TemporaryDirectory() as output_dir:
+            source = FakeTranscriptSource(transcripts, latency=latency, failure_rate=failure_rate)
+            stats = fetch_transcripts(source, videos, output_dir, workers=workers, rate=1000, burst=workers,
+                                      base_delay=0.05)
+            # 再執行一次：全部都應該略過
+            rerun = fetch_transcripts(source, videos, output_dir, workers=workers, rate=1000, burst=workers)
+            print(f"workers={workers:>3}: {stats['seconds']:>7.2f}s "
+                  f"({n_videos / max(stats['seconds'], 1e-9) * 60:.0f} videos/min), "
+                  f"fetched={stats['fetched']} unavailable={stats['unavailable']} failed={stats['failed']} "
+                  f"requests={source.calls}, rerun skipped={rerun['skipped']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+
+import chromadb
+from FlagEmbedding import BGEM3FlagModel
+from tqdm import tqdm
+
+# 將專案根目錄加入 Python 路徑以供匯入
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils import PathHelper, export_dense_index, dense_index_path, save_hybrid_indexes
+
+# 為既有的 Chroma 集合補建混合檢索需要的索引：dense 矩陣、lexical weights 倒排索引，以及可選的 colbert 向量
+# 用法：python src/others/build_hybrid_index.py [collection_name] [colbert]
+collection_name = sys.argv[1] if len(sys.argv) > 1 else 'Cofit211-cosine'
+save_colbert_vecs = len(sys.argv) > 2 and sys.argv[2] == 'colbert'
+batch_size = 8
+
+client = chromadb.PersistentClient(path=str(PathHelper.db_dir))
+collection = client.get_collection(name=collection_name)
+export_dense_index(collection, dense_index_path(PathHelper.db_dir, collection_name))
+
+model = BGEM3FlagModel('BAAI/bge-m3', use_fp16=True)
+count = collection.count()
+ids, lexical_weights, colbert_vecs = [], [], []
+for offset in tqdm(range(0, count, batch_size), total=(count + batch_size - 1) // batch_size):
+    batch = collection.get(include=["documents"], limit=batch_size, offset=offset)
+    output = model.encode(batch["documents"],
+                          batch_size=batch_size,
+                          max_length=8192,
+                          return_dense=False,
+                          return_sparse=True,
+                          return_colbert_vecs=save_colbert_vecs,
+                          )
+    ids.extend(batch["ids"])
+    lexical_weights.extend(output['lexical_weights'])
+    if save_colbert_vecs:
+        colbert_vecs.extend(output['colbert_vecs'])
+
+save_hybrid_indexes(PathHelper.db_dir, collection_name, ids, lexical_weights,
+                    colbert_vecs if save_colbert_vecs else None)
+
+print(f"built hybrid index for {count} documents")
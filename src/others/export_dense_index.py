@@ -0,0 +1,22 @@
+import sys
+from pathlib import Path
+
+import chromadb
+
+# 將專案根目錄加入 Python 路徑以供匯入
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils import PathHelper, export_dense_index, dense_index_path
+
+# 把 Chroma 集合匯出為 DenseIndex（RETRIEVER_BACKEND=dense 時使用）
+# 用法：python src/others/export_dense_index.py [collection_name] [float16|int8] [db_dir]
+collection_name = sys.argv[1] if len(sys.argv) > 1 else 'Cofit211-cosine'
+dtype = sys.argv[2] if len(sys.argv) > 2 else 'float16'
+db_dir = Path(sys.argv[3]) if len(sys.argv) > 3 else PathHelper.db_dir
+
+client = chromadb.PersistentClient(path=str(db_dir))
+collection = client.get_collection(name=collection_name)
+
+output_dir = export_dense_index(collection, dense_index_path(db_dir, collection_name), dtype=dtype)
+print(f"exported {collection.count()} vectors to {output_dir}")
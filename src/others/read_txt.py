@@ -1,4 +1,3 @@
-import json
 import sys
 from pathlib import Path
 
@@ -6,10 +5,9 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from src.utils import PathHelper
+from src.utils import PathHelper, open_transcript_store
 
-with open(PathHelper.text_dir / 'Cofit211' / 'Dwt2VAqdrlg.txt', "r", encoding="utf8") as f:
-    transcript = json.load(f)
+transcript = open_transcript_store(PathHelper.text_dir, 'Cofit211').get_text('Dwt2VAqdrlg')
     
 
 #%%    
@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+
+# 將專案根目錄加入 Python 路徑以供匯入
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils import SegmentedChatLog, ChatHistoryStore, BlobHistoryBacking, get_storage
+
+# 由既有的對話紀錄重建每個聊天室的歷史索引（上線前執行一次即可）
+# 設定 LOCAL_STORAGE_DIR 時改用本地目錄
+bucket_name = 'ian-line-bot-files'
+file_name = 'messages-health.csv'
+log_prefix = 'messages-health'
+
+log_storage = get_storage(bucket_name)
+chat_log = SegmentedChatLog(log_storage, prefix=log_prefix, legacy_name=file_name)
+history_store = ChatHistoryStore(max_turns=5, backing=BlobHistoryBacking(log_storage, prefix=log_prefix))
+
+n_rooms = history_store.rebuild_from_records(chat_log.iter_records())
+print(f"rebuilt {n_rooms} chat rooms")
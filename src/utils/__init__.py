@@ -1,2 +1,35 @@
 from .path_helper import PathHelper
 from .logger import get_logger
+from .storage import BlobStorage, LocalStorage, GCSStorage, get_storage
+from .chat_log import SegmentedChatLog, taipei_now
+from .chat_history import ChatHistoryStore, BlobHistoryBacking, RESET_SENTINEL
+from .retriever import RetrieverCache
+from .embedding_cache import EmbeddingCache, deepinfra_embed_fn, deepinfra_async_embed_fn, normalize_text
+from .response_cache import SemanticResponseCache, make_context_key
+from .work_queue import WorkQueue, InProcessWorkQueue
+from .batch_dispatch import dispatch_by_room, group_events_by_room, get_chat_room_id
+from .pipeline import StagePipeline, PipelineRun
+from .stream_chunker import StreamChunker
+from .dense_index import DenseIndex, export_dense_index, dense_index_path
+from .sparse_index import SparseIndex, ColbertStore, sparse_index_path, colbert_index_path
+from .hybrid_retriever import (
+    HybridRetriever, save_hybrid_indexes, append_hybrid_segment, merge_hybrid_segments, hybrid_segments_path
+)
+from .batch_embedding import encode_in_batches, make_token_batches, count_tokens, ThroughputMeter
+from .ingest_manifest import IngestManifest, ManifestDiff
+from .rate_limit import RateLimiter, HostRateLimiter, retry_with_jitter, backoff_delay
+from .transcript_fetcher import (
+    TranscriptSource, YouTubeTranscriptSource, FakeTranscriptSource, TranscriptUnavailable, fetch_transcripts
+)
+from .channel_listing import ChannelListing, UrllibHttp, parse_initial_data, extract_videos
+from .stage_cache import StageCache, dir_fingerprint
+from .channel_pipeline import ChannelStage, run_channels
+from .batched_punctuation import BatchedPunctuation, plan_chunks
+from .asr_scheduler import TranscriptionScheduler, TranscriptionResult, load_whisper_model
+from .audio_downloader import (
+    AudioSource, AudioStream, PytubefixAudioSource, FakeAudioSource, FailureLedger, download_audio_files,
+    find_audio_file, AUDIO_EXTENSIONS
+)
+from .streaming_pipeline import StreamingPipeline, StreamStage
+from .transcript_store import TranscriptStore, open_transcript_store, transcript_store_path, text_hash
+from .transcript_chunker import chunk_transcript, align_segments, split_sentences, video_url
@@ -0,0 +1,117 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class TranscriptionResult:
+    """單一音檔的辨識結果與耗時；rtf（real-time factor）= 處理秒數 / 音訊秒數，小於 1 代表比即時快"""
+
+    def __init__(self, path: str, language: str, language_probability: float,
+                 segments: List[Tuple[float, float, str]], duration: float, duration_after_vad: float,
+                 seconds: float):
+        self.path = path
+        self.language = language
+        self.language_probability = language_probability
+        self.segments = segments
+        self.duration = duration
+        self.duration_after_vad = duration_after_vad
+        self.seconds = seconds
+
+    @property
+    def rtf(self) -> float:
+        return self.seconds / self.duration if self.duration else 0.0
+
+    def __str__(self) -> str:
+        return (f"{os.path.basename(self.path)}: {self.duration:.0f}s audio "
+                f"({self.duration_after_vad:.0f}s speech) in {self.seconds:.1f}s, RTF={self.rtf:.3f}")
+
+
+def load_whisper_model(model_size: str, workers: int = 1, threads_per_worker: int = 0,
+                       device: str = "cpu", compute_type: str = "int8"):
+    """
+    載入一個可被 workers 個執行緒同時呼叫的 WhisperModel
+
+    CTranslate2 以 num_workers 建立多個平行的推論 worker，每個 worker 使用 threads_per_worker 個 CPU 執行緒
+    （0 為預設的 4），權重只載入一次。
+    """
+    from faster_whisper import WhisperModel
+
+    return WhisperModel(model_size, device=device, compute_type=compute_type,
+                        cpu_threads=threads_per_worker, num_workers=workers)
+
+
+class TranscriptionScheduler:
+    """
+    以多個執行緒同時辨識多個音檔，每個音檔先以 VAD 切掉靜音，再把語音片段批次解碼
+
+    faster-whisper 1.1 以上使用 BatchedInferencePipeline（batch_size 個 30 秒片段一起解碼）；
+    舊版或 batch_size <= 1 時改用 WhisperModel.transcribe（一樣以 vad_filter 略過靜音）。
+    """
+
+    def __init__(self, model, workers: int = 2, batch_size: int = 8, vad_filter: bool = True,
+                 **transcribe_kwargs):
+        self.model = model
+        self.workers = workers
+        self.batch_size = batch_size
+        self.vad_filter = vad_filter
+        self.transcribe_kwargs = transcribe_kwargs
+        self.pipeline = None
+        if batch_size > 1:
+            try:
+                from faster_whisper import BatchedInferencePipeline
+
+                self.pipeline = BatchedInferencePipeline(model=model)
+            except ImportError:
+                logger.warning("BatchedInferencePipeline requires faster-whisper>=1.1, decoding without batching")
+
+    def transcribe(self, path: str) -> TranscriptionResult:
+        t1 = time.time()
+        if self.pipeline is not None:
+            segments, info = self.pipeline.transcribe(path, batch_size=self.batch_size, vad_filter=self.vad_filter,
+                                                      **self.transcribe_kwargs)
+        else:
+            segments, info = self.model.transcribe(path, vad_filter=self.vad_filter, **self.transcribe_kwargs)
+        # segments 是產生器，實際的解碼在讀取時才進行
+        segments = [(segment.start, segment.end, segment.text) for segment in segments]
+        duration_after_vad = getattr(info, "duration_after_vad", None) or info.duration
+        return TranscriptionResult(path, info.language, info.language_probability, segments,
+                                   info.duration, duration_after_vad, time.time() - t1)
+
+    def run(self, paths: Sequence[str],
+            on_result: Optional[Callable[[TranscriptionResult], None]] = None) -> Dict:
+        """
+        辨識所有音檔，每完成一個就呼叫 on_result（在 worker 執行緒中），回傳整體統計
+
+        單一音檔失敗只記錄錯誤，不影響其他音檔。
+        """
+        stats = {"files": len(paths), "done": 0, "failed": 0, "audio_seconds": 0.0, "seconds": 0.0}
+        t1 = time.time()
+
+        def work(path: str) -> TranscriptionResult:
+            result = self.transcribe(path)
+            if on_result is not None:
+                on_result(result)
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="asr") as executor:
+            futures = {executor.submit(work, path): path for path in paths}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"failed to transcribe {futures[future]}: {type(e).__name__} - {str(e)}")
+                    stats["failed"] += 1
+                    continue
+                logger.info(str(result))
+                stats["done"] += 1
+                stats["audio_seconds"] += result.duration
+        stats["seconds"] = time.time() - t1
+        stats["rtf"] = stats["seconds"] / stats["audio_seconds"] if stats["audio_seconds"] else 0.0
+        logger.info(f"transcribed {stats['done']} files ({stats['audio_seconds'] / 60:.1f} min audio) "
+                    f"in {stats['seconds']:.1f}s, overall RTF={stats['rtf']:.3f}, {stats['failed']} failed")
+        return stats
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .logger import get_logger
+from .rate_limit import HostRateLimiter, retry_with_jitter
+
+logger = get_logger(__name__)
+
+# 視為已下載完成的音訊副檔名（.mp3 為舊版下載的檔案，內容其實是 m4a / webm）
+AUDIO_EXTENSIONS = (".m4a", ".webm", ".mp3")
+# googlevideo 對單一請求會限速，分段下載（與 pytubefix 相同的 9MB）
+RANGE_SIZE = 9 * 1024 * 1024
+PART_SUFFIX = ".part"
+
+
+class AudioStream:
+    """一支影片的純音訊串流"""
+
+    def __init__(self, url: str, filesize: int, ext: str = "m4a", abr: Optional[str] = None):
+        self.url = url
+        self.filesize = filesize
+        self.ext = ext
+        self.abr = abr
+
+
+class AudioSource:
+    """
+    音訊來源介面：resolve 取得串流資訊，read_range 讀取 [start, end] 的位元組（含 end）
+
+    host 用於依主機限制 resolve 的請求速率。
+    """
+
+    host = "default"
+
+    def resolve(self, video_url: str) -> AudioStream:
+        raise NotImplementedError
+
+    def read_range(self, stream: AudioStream, start: int, end: int) -> Iterator[bytes]:
+        raise NotImplementedError
+
+
+class PytubefixAudioSource(AudioSource):
+    """
+    以 pytubefix 解析 YouTube 的純音訊串流，選擇位元率最低的 m4a（AAC）
+
+    Whisper 會先把音訊重新取樣成 16kHz 單聲道，高位元率對辨識沒有幫助；
+    m4a 可由 faster-whisper（PyAV）直接解碼，不需另外轉檔。
+    """
+
+    host = "www.youtube.com"
+
+    def __init__(self, timeout: float = 30.0):
+        self.timeout = timeout
+
+    def resolve(self, video_url: str) -> AudioStream:
+        from pytubefix import YouTube
+
+        streams = YouTube(video_url).streams
+        stream = streams.filter(only_audio=True, subtype="mp4").order_by("abr").first()
+        ext = "m4a"
+        if stream is None:
+            stream = streams.filter(only_audio=True).order_by("abr").first()
+            ext = stream.subtype if stream is not None else ext
+        if stream is None:
+            raise ValueError(f"no audio stream for {video_url}")
+        return AudioStream(stream.url, stream.filesize, ext, stream.abr)
+
+    def read_range(self, stream: AudioStream, start: int, end: int) -> Iterator[bytes]:
+        request = urllib.request.Request(f"{stream.url}&range={start}-{end}",
+                                         headers={"User-Agent": "Mozilla/5.0"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            while True:
+                chunk = response.read(1 << 16)
+                if not chunk:
+                    break
+                yield chunk
+
+
+class FakeAudioSource(AudioSource):
+    """
+    本地測試用的音訊來源：以固定延遲與頻寬模擬下載，可設定失敗比例（在傳輸途中中斷，用於測試續傳）
+
+    sizes 中沒有的影片在 resolve 時拋出 ValueError。
+    """
+
+    host = "fake"
+
+    def __init__(self, sizes: Dict[str, int], latency: float = 0.05, bandwidth: float = 20e6,
+                 failure_rate: float = 0.0, seed: int = 0):
+        self.sizes = sizes
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def content(video_id: str, size: int) -> bytes:
+        block = hashlib.sha256(video_id.encode("utf-8")).digest()
+        return (block * (size // len(block) + 1))[:size]
+
+    def resolve(self, video_url: str) -> AudioStream:
+        time.sleep(self.latency)
+        video_id = video_url.split("=")[-1]
+        if video_id not in self.sizes:
+            raise ValueError(f"no audio stream for {video_url}")
+        return AudioStream(f"fake://{video_id}", self.sizes[video_id], "m4a", "48kbps")
+
+    def read_range(self, stream: AudioStream, start: int, end: int) -> Iterator[bytes]:
+        data = self.content(stream.url.split("//")[-1], stream.filesize)
+        chunk_size = 1 << 16
+        for offset in range(start, end + 1, chunk_size):
+            chunk = data[offset:min(offset + chunk_size, end + 1)]
+            with self._lock:
+                failed = self._random.random() < self.failure_rate
+            if failed:
+                raise ConnectionError(f"simulated connection reset at byte {offset}")
+            time.sleep(len(chunk) / self.bandwidth)
+            yield chunk
+
+
+class FailureLedger:
+    """
+    記錄下載失敗的影片、次數與最後的錯誤（JSON 檔），之後的執行會再試，超過 max_attempts 次則略過
+
+    下載成功時從記錄中移除。
+    """
+
+    def __init__(self, path, max_attempts: int = 5):
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def gave_up(self, video_id: str) -> bool:
+        with self._lock:
+            return self.entries.get(video_id, {}).get("attempts", 0) >= self.max_attempts
+
+    def record_failure(self, video_id: str, error: Exception) -> None:
+        with self._lock:
+            entry = self.entries.setdefault(video_id, {"attempts": 0})
+            entry["attempts"] += 1
+            entry["error"] = f"{type(error).__name__} - {str(error)}"
+            entry["last_attempt"] = time.time()
+            self._save()
+
+    def clear(self, video_id: str) -> None:
+        with self._lock:
+            if self.entries.pop(video_id, None) is not None:
+                self._save()
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + f".tmp-{os.getpid()}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def find_audio_file(output_dir, video_id: str) -> Optional[Path]:
+    for ext in AUDIO_EXTENSIONS:
+        path = Path(output_dir) / f"{video_id}{ext}"
+        if path.exists():
+            return path
+    return None
+
+
+def download_audio_files(source: AudioSource, videos: List[Tuple[str, str]], output_dir, workers: int = 4,
+                         retries: int = 3, base_delay: float = 2.0, rate: float = 2.0,
+                         ledger: Optional[FailureLedger] = None, range_size: int = RANGE_SIZE) -> Dict:
+    """
+    以有界執行緒池下載 [(video_id, video_url)] 的音訊到 output_dir/{video_id}.{ext}
+
+    下載中的檔案寫在 .part，中斷或失敗後從已下載的位置以 range 請求續傳，完成後才改名；
+    每次重試都重新 resolve（串流網址會過期）。重試後仍失敗的影片記錄在 ledger，下次執行再試。
+    回傳的統計包含本次下載的 MB/s 與 files/min。
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    limiter = HostRateLimiter(rate, burst=workers)
+    lock = threading.Lock()
+    stats = {"files": len(videos), "downloaded": 0, "skipped": 0, "gave_up": 0, "failed": 0,
+             "resumed": 0, "bytes": 0, "seconds": 0.0}
+
+    pending = []
+    for video_id, video_url in videos:
+        if find_audio_file(output_dir, video_id) is not None:
+            stats["skipped"] += 1
+        elif ledger is not None and ledger.gave_up(video_id):
+            stats["gave_up"] += 1
+        else:
+            pending.append((video_id, video_url))
+    logger.info(f"downloading {len(pending)} audio files ({stats['skipped']} done, "
+                f"{stats['gave_up']} given up) with {workers} workers")
+
+    def attempt(video_id: str, video_url: str) -> Path:
+        limiter.acquire(source.host)
+        stream = source.resolve(video_url)
+        part = output_dir / f"{video_id}.{stream.ext}{PART_SUFFIX}"
+        position = part.stat().st_size if part.exists() else 0
+        if position > stream.filesize:
+            position = 0
+        if position:
+            with lock:
+                stats["resumed"] += 1
+            logger.info(f"resuming {video_id} at {position}/{stream.filesize} bytes")
+        with open(part, "ab" if position else "wb") as f:
+            while position < stream.filesize:
+                end = min(position + range_size, stream.filesize) - 1
+                for chunk in source.read_range(stream, position, end):
+                    f.write(chunk)
+                    position += len(chunk)
+                    with lock:
+                        stats["bytes"] += len(chunk)
+                f.flush()
+                if position <= end:
+                    raise IOError(f"range {position}-{end} ended early")
+        final = output_dir / f"{video_id}.{stream.ext}"
+        os.replace(part, final)
+        return final
+
+    def download(video_id: str, video_url: str) -> Path:
+        try:
+            path = retry_with_jitter(lambda: attempt(video_id, video_url), retries=retries, base_delay=base_delay)
+        except Exception as e:
+            if ledger is not None:
+                ledger.record_failure(video_id, e)
+            raise
+        if ledger is not None:
+            ledger.clear(video_id)
+        return path
+
+    t1 = time.time()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download") as executor:
+        futures = {executor.submit(download, video_id, video_url): video_id for video_id, video_url in pending}
+        for future in as_completed(futures):
+            try:
+                path = future.result()
+                stats["downloaded"] += 1
+                logger.info(f"downloaded {path.name}")
+            except Exception as e:
+                stats["failed"] += 1
+                logger.error(f"failed to download audio for {futures[future]}: {type(e).__name__} - {str(e)}")
+    elapsed = time.time() - t1
+    stats["seconds"] = round(elapsed, 2)
+    stats["mb_per_sec"] = round(stats["bytes"] / 1e6 / elapsed, 2) if elapsed > 0 else 0.0
+    stats["files_per_min"] = round(stats["downloaded"] / elapsed * 60, 1) if elapsed > 0 else 0.0
+    logger.info(f"audio downloads: {stats}")
+    return stats
@@ -0,0 +1,46 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def get_chat_room_id(event: Dict) -> str:
+    """LINE webhook 事件（JSON）的聊天室 ID：群組為 groupId，否則為 userId"""
+    source = event['source']
+    return source['groupId'] if 'groupId' in source else source['userId']
+
+
+def group_events_by_room(events: List[Dict]) -> "OrderedDict[str, List[Dict]]":
+    """依聊天室分組，組內維持事件原本的順序"""
+    groups: "OrderedDict[str, List[Dict]]" = OrderedDict()
+    for event in events:
+        groups.setdefault(get_chat_room_id(event), []).append(event)
+    return groups
+
+
+def dispatch_by_room(events: List[Dict], handle_room: Callable[[str, List[Dict]], None],
+                     max_workers: int = 8) -> Dict[str, Exception]:
+    """
+    同一聊天室的事件交給同一次 handle_room 依序處理，不同聊天室平行處理
+
+    回傳處理失敗的聊天室與例外，單一聊天室失敗不影響其他聊天室。
+    """
+    groups = group_events_by_room(events)
+    errors: Dict[str, Exception] = {}
+    if not groups:
+        return errors
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(groups))) as executor:
+        futures = {
+            chat_room_id: executor.submit(handle_room, chat_room_id, room_events)
+            for chat_room_id, room_events in groups.items()
+        }
+        for chat_room_id, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"room {chat_room_id} failed: {type(e).__name__} - {str(e)}")
+                errors[chat_room_id] = e
+    return errors
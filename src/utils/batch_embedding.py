@@ -0,0 +1,81 @@
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def count_tokens(tokenizer, texts: Sequence[str], max_length: int = 8192) -> List[int]:
+    """每段文字的 token 數（含特殊 token，超過 max_length 時以 max_length 計）"""
+    encoded = tokenizer(list(texts), add_special_tokens=True, truncation=True, max_length=max_length)
+    return [len(ids) for ids in encoded["input_ids"]]
+
+
+def make_token_batches(lengths: Sequence[int], max_tokens: int = 32768, max_batch_size: int = 64) -> List[List[int]]:
+    """
+    依長度排序後分批，每批補齊後的 token 數（批次大小 x 最長長度）不超過 max_tokens
+
+    長度相近的文字放在同一批，補齊浪費的計算最少；回傳每批的原始索引。
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches: List[List[int]] = []
+    batch: List[int] = []
+    for i in order:
+        # 依長度遞減排列，批次中的第一個就是最長的
+        longest = lengths[batch[0]] if batch else lengths[i]
+        if batch and (len(batch) + 1 > max_batch_size or (len(batch) + 1) * longest > max_tokens):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class ThroughputMeter:
+    """累計已處理的段落數與 token 數，回報每秒處理量"""
+
+    def __init__(self):
+        self.start = time.time()
+        self.chunks = 0
+        self.tokens = 0
+
+    def add(self, chunks: int, tokens: int) -> None:
+        self.chunks += chunks
+        self.tokens += tokens
+
+    def summary(self) -> Dict:
+        elapsed = max(time.time() - self.start, 1e-9)
+        return {
+            "chunks": self.chunks,
+            "tokens": self.tokens,
+            "seconds": round(elapsed, 2),
+            "chunks_per_sec": round(self.chunks / elapsed, 2),
+            "tokens_per_sec": round(self.tokens / elapsed, 1),
+        }
+
+    def __str__(self) -> str:
+        s = self.summary()
+        return (f"{s['chunks']} chunks / {s['tokens']} tokens in {s['seconds']}s "
+                f"({s['chunks_per_sec']} chunks/s, {s['tokens_per_sec']} tokens/s)")
+
+
+def encode_in_batches(model, texts: Sequence[str], max_tokens: int = 32768, max_batch_size: int = 64,
+                      max_length: int = 8192, meter: Optional[ThroughputMeter] = None,
+                      **encode_kwargs) -> Iterator[Tuple[List[int], Dict]]:
+    """
+    以 token 預算分批呼叫 BGEM3FlagModel.encode，逐批回傳（原始索引, encode 的輸出）
+
+    呼叫端可以每拿到一批就寫入資料庫，不需等全部完成。
+    """
+    lengths = count_tokens(model.tokenizer, texts, max_length)
+    batches = make_token_batches(lengths, max_tokens, max_batch_size)
+    meter = meter or ThroughputMeter()
+    logger.info(f"embedding {len(texts)} chunks in {len(batches)} batches")
+    for batch in batches:
+        output = model.encode([texts[i] for i in batch], batch_size=len(batch), max_length=max_length,
+                              **encode_kwargs)
+        meter.add(len(batch), sum(lengths[i] for i in batch))
+        logger.info(f"batch of {len(batch)} (longest {lengths[batch[0]]} tokens): {meter}")
+        yield batch, output
@@ -0,0 +1,95 @@
+from typing import Dict, List, Sequence
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# 與 PunctuationModel.predict 相同的切分設定
+CHUNK_SIZE = 230
+OVERLAP = 5
+
+
+class _Chunk:
+    __slots__ = ("text", "words", "keep")
+
+    def __init__(self, text: str, words: List[str], keep: int):
+        self.text = text
+        self.words = words
+        self.keep = keep
+
+
+def plan_chunks(model, text: str) -> List[_Chunk]:
+    """
+    依 PunctuationModel.predict 的規則把一段文字切成模型輸入，回傳每個輸入與要採用的字數
+
+    包含原實作的細節：只有一個 chunk 時不重疊、最後一個 chunk 不丟棄重疊部分，
+    以及以內容（batch == batches[-1]）判斷最後一個 chunk 後 overlap 就一直為 0。
+    """
+    words = model.preprocess(text)
+    overlap = OVERLAP
+    if len(words) <= CHUNK_SIZE:
+        overlap = 0
+    batches = [words[i:i + CHUNK_SIZE] for i in range(0, len(words), CHUNK_SIZE - overlap)]
+    if len(batches[-1]) <= overlap:
+        batches.pop()
+
+    chunks = []
+    for batch in batches:
+        if batch == batches[-1]:
+            overlap = 0
+        chunks.append(_Chunk(" ".join(batch), batch, len(batch) - overlap))
+    return chunks
+
+
+def tag_words(chunk: _Chunk, result: List[Dict]) -> List[List]:
+    """把 token 分類結果對應回字（與 PunctuationModel.predict 的迴圈相同）"""
+    assert len(chunk.text) == result[-1]["end"], "chunk size too large, text got clipped"
+    tagged_words = []
+    char_index = 0
+    result_index = 0
+    score = None
+    for word in chunk.words[:chunk.keep]:
+        char_index += len(word) + 1
+        label = 0
+        while result_index < len(result) and char_index > result[result_index]["end"]:
+            label = result[result_index]["entity"]
+            score = result[result_index]["score"]
+            result_index += 1
+        tagged_words.append([word, label, score])
+    return tagged_words
+
+
+class BatchedPunctuation:
+    """
+    以批次推論取代逐段呼叫 PunctuationModel.restore_punctuation，輸出與逐段呼叫相同
+
+    每段文字切出的模型輸入與原實作完全相同（不把不同段落接在一起，否則模型看到的上下文不同、結果會改變），
+    所有段落（可跨影片）的輸入依長度排序後一次交給 pipeline 批次推論，減少 forward 次數與補齊的浪費。
+    """
+
+    def __init__(self, model, batch_size: int = 32):
+        self.model = model
+        self.batch_size = batch_size
+
+    def _infer(self, texts: List[str]) -> List[List[Dict]]:
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        outputs = self.model.pipe([texts[i] for i in order], batch_size=self.batch_size)
+        results: List[List[Dict]] = [[] for _ in texts]
+        for i, output in zip(order, outputs):
+            results[i] = output
+        return results
+
+    def restore_many(self, texts: Sequence[str]) -> List[str]:
+        """等同 [model.restore_punctuation(text) for text in texts]"""
+        plans = [plan_chunks(self.model, text) for text in texts]
+        flat = [chunk for plan in plans for chunk in plan]
+        results = iter(self._infer([chunk.text for chunk in flat])) if flat else iter(())
+        restored = []
+        for text, plan in zip(texts, plans):
+            tagged_words = []
+            for chunk in plan:
+                tagged_words.extend(tag_words(chunk, next(results)))
+            assert len(tagged_words) == len(self.model.preprocess(text))
+            restored.append(self.model.prediction_to_text(tagged_words))
+        logger.info(f"restored punctuation of {len(texts)} segments with {len(flat)} model inputs")
+        return restored
@@ -0,0 +1,165 @@
+import json
+import re
+import urllib.request
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from .logger import get_logger
+from .rate_limit import RateLimiter, retry_with_jitter
+
+logger = get_logger(__name__)
+
+YOUTUBE_URL = "https://www.youtube.com"
+BROWSE_URL = YOUTUBE_URL + "/youtubei/v1/browse"
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "Accept-Language": "zh-TW,zh;q=0.9,en;q=0.8",
+    # 略過歐盟地區的 cookie 同意頁
+    "Cookie": "CONSENT=YES+1",
+}
+
+_INITIAL_DATA_RE = re.compile(r"(?:var\s+ytInitialData|window\[\"ytInitialData\"\])\s*=\s*")
+_CLIENT_VERSION_RE = re.compile(r'"INNERTUBE_CLIENT_VERSION"\s*:\s*"([^"]+)"')
+_API_KEY_RE = re.compile(r'"INNERTUBE_API_KEY"\s*:\s*"([^"]+)"')
+
+
+class UrllibHttp:
+    """以標準函式庫發送請求，可換成測試用的假物件（需提供 get_text / post_json）"""
+
+    def __init__(self, timeout: float = 30.0, headers: Optional[Dict[str, str]] = None):
+        self.timeout = timeout
+        self.headers = headers or DEFAULT_HEADERS
+
+    def get_text(self, url: str) -> str:
+        request = urllib.request.Request(url, headers=self.headers)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return response.read().decode("utf-8")
+
+    def post_json(self, url: str, payload: Dict) -> Dict:
+        request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                         headers={**self.headers, "Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+
+def parse_initial_data(html: str) -> Dict:
+    """取出頻道頁面中內嵌的 ytInitialData（一個 JSON 物件）"""
+    match = _INITIAL_DATA_RE.search(html)
+    if match is None:
+        raise ValueError("ytInitialData not found in page")
+    # raw_decode 只解析第一個完整的 JSON 物件，不受後面的 ";</script>" 影響
+    data, _ = json.JSONDecoder().raw_decode(html, match.end())
+    return data
+
+
+def parse_client_config(html: str) -> Dict[str, str]:
+    """取出 continuation 請求需要的 client 版本與 API key（新版頁面可能沒有 API key）"""
+    config = {}
+    version = _CLIENT_VERSION_RE.search(html)
+    if version:
+        config["client_version"] = version.group(1)
+    api_key = _API_KEY_RE.search(html)
+    if api_key:
+        config["api_key"] = api_key.group(1)
+    return config
+
+
+def _text(node: Dict) -> str:
+    if not isinstance(node, dict):
+        return ""
+    if "simpleText" in node:
+        return node["simpleText"]
+    if "content" in node:
+        return node["content"]
+    return "".join(run.get("text", "") for run in node.get("runs", []))
+
+
+def _walk(node) -> Iterator[Dict]:
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _walk(value)
+
+
+def extract_videos(data: Dict) -> Tuple[List[Dict], Optional[str]]:
+    """
+    從 ytInitialData 或 continuation 回應中取出影片（依頁面順序，新到舊）與下一頁的 continuation token
+
+    同時支援 videoRenderer 與較新的 lockupViewModel 版面。
+    """
+    videos: List[Dict] = []
+    seen: Set[str] = set()
+    token = None
+    for node in _walk(data):
+        renderer = node.get("videoRenderer")
+        if isinstance(renderer, dict) and renderer.get("videoId"):
+            video_id, title = renderer["videoId"], _text(renderer.get("title", {}))
+        elif isinstance(node.get("lockupViewModel"), dict) and \
+                node["lockupViewModel"].get("contentType") == "LOCKUP_CONTENT_TYPE_VIDEO":
+            lockup = node["lockupViewModel"]
+            video_id = lockup.get("contentId")
+            title = _text(lockup.get("metadata", {}).get("lockupMetadataViewModel", {}).get("title", {}))
+        else:
+            continuation = node.get("continuationItemRenderer")
+            if isinstance(continuation, dict):
+                command = continuation.get("continuationEndpoint", {}).get("continuationCommand", {})
+                token = command.get("token", token)
+            continue
+        if video_id and video_id not in seen:
+            seen.add(video_id)
+            videos.append({"video_id": video_id, "title": title,
+                           "video_url": f"{YOUTUBE_URL}/watch?v={video_id}"})
+    return videos, token
+
+
+class ChannelListing:
+    """
+    以 HTTP 分頁列出頻道的所有影片：先抓 /videos 頁面的 ytInitialData，
+    再以 continuation token 呼叫 youtubei browse API 取得下一頁（每頁約 30 支）
+
+    known_ids 不為空時為增量模式：頻道列表由新到舊排列，遇到第一支已知的影片就停止，
+    每天執行只會讀取最前面一兩頁。
+    """
+
+    def __init__(self, http=None, rate: float = 2.0, retries: int = 3):
+        self.http = http or UrllibHttp()
+        self.limiter = RateLimiter(rate)
+        self.retries = retries
+
+    def _call(self, fn, *args):
+        def attempt():
+            self.limiter.acquire()
+            return fn(*args)
+        return retry_with_jitter(attempt, retries=self.retries)
+
+    def list_videos(self, channel_name: str, known_ids: Optional[Set[str]] = None,
+                    max_pages: Optional[int] = None) -> List[Dict]:
+        known_ids = known_ids or set()
+        html = self._call(self.http.get_text, f"{YOUTUBE_URL}/@{channel_name}/videos")
+        config = parse_client_config(html)
+        videos, token = extract_videos(parse_initial_data(html))
+        result: List[Dict] = []
+        pages = 1
+        while True:
+            for video in videos:
+                if video["video_id"] in known_ids:
+                    logger.info(f"reached known video {video['video_id']} after {pages} pages, "
+                                f"{len(result)} new videos")
+                    return result
+                result.append(video)
+            if not token or (max_pages is not None and pages >= max_pages):
+                break
+            url = BROWSE_URL + (f"?key={config['api_key']}" if "api_key" in config else "")
+            payload = {
+                "context": {"client": {"clientName": "WEB",
+                                       "clientVersion": config.get("client_version", "2.20240101.00.00"),
+                                       "hl": "zh-TW"}},
+                "continuation": token,
+            }
+            videos, token = extract_videos(self._call(self.http.post_json, url, payload))
+            pages += 1
+        logger.info(f"listed {len(result)} videos of {channel_name} in {pages} pages")
+        return result
@@ -0,0 +1,86 @@
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from .logger import get_logger
+from .pipeline import StagePipeline
+from .stage_cache import StageCache, dir_fingerprint
+
+logger = get_logger(__name__)
+
+DONE = "done"
+CACHED = "cached"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class ChannelStage:
+    """
+    處理流程中的一個階段，對每個頻道各執行一次
+
+    fn(channel_name) 執行該階段；inputs(channel_name) 回傳此階段讀取的目錄，
+    上次成功時的目錄指紋相同就略過（inputs 為 None 的階段，例如抓取遠端資料，每次都執行）。
+    max_concurrency 限制同時執行此階段的頻道數，用於需要載入大型模型的階段。
+    """
+
+    def __init__(self, name: str, fn: Callable[[str], None], deps: Sequence[str] = (),
+                 inputs: Optional[Callable[[str], List[Path]]] = None, max_concurrency: Optional[int] = None):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.inputs = inputs
+        self._semaphore = threading.Semaphore(max_concurrency) if max_concurrency else None
+
+    def run(self, channel_name: str, cache: Optional[StageCache], force: bool = False) -> str:
+        key = f"{channel_name}/{self.name}"
+        fingerprint = dir_fingerprint(self.inputs(channel_name)) if self.inputs is not None else None
+        if fingerprint is not None and cache is not None and not force and cache.get(key) == fingerprint:
+            logger.info(f"[{key}] inputs unchanged, skipped")
+            return CACHED
+        if self._semaphore is not None:
+            self._semaphore.acquire()
+        try:
+            t1 = time.time()
+            logger.info(f"[{key}] started")
+            self.fn(channel_name)
+            logger.info(f"[{key}] finished in {time.time() - t1:.1f}s")
+        finally:
+            if self._semaphore is not None:
+                self._semaphore.release()
+        # 記錄執行前的指紋：執行期間輸入又有變動時，下次仍會重新執行
+        if fingerprint is not None and cache is not None:
+            cache.set(key, fingerprint)
+        return DONE
+
+
+def run_channels(channels: Sequence[str], stages: Sequence[ChannelStage], cache: Optional[StageCache] = None,
+                 max_workers: int = 4, force: Sequence[str] = ()) -> Dict[str, Dict[str, str]]:
+    """
+    以（頻道, 階段）為節點的相依圖執行所有頻道：不同頻道互不等待，可同時處於不同階段
+
+    單一階段失敗時只略過同一頻道的下游階段，其他頻道照常執行。
+    force 中的階段不使用快取。回傳 {頻道: {階段: done / cached / failed / skipped}}。
+    """
+    pipeline = StagePipeline(max_workers=max_workers)
+    for channel_name in channels:
+        for stage in stages:
+            def run_stage(channel_name=channel_name, stage=stage, **dep_results) -> str:
+                if any(result in (FAILED, SKIPPED) for result in dep_results.values()):
+                    logger.info(f"[{channel_name}/{stage.name}] skipped because an upstream stage failed")
+                    return SKIPPED
+                try:
+                    return stage.run(channel_name, cache, force=stage.name in force)
+                except Exception as e:
+                    logger.error(f"[{channel_name}/{stage.name}] failed: {type(e).__name__} - {str(e)}")
+                    return FAILED
+
+            pipeline.stage(f"{channel_name}/{stage.name}", run_stage,
+                           deps=[f"{channel_name}/{dep}" for dep in stage.deps])
+    run = pipeline.run()
+    logger.info(f"pipeline finished: {run.format_timings()}")
+
+    results: Dict[str, Dict[str, str]] = {}
+    for channel_name in channels:
+        results[channel_name] = {stage.name: run[f"{channel_name}/{stage.name}"] for stage in stages}
+    return results
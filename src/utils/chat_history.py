@@ -0,0 +1,188 @@
+import json
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from .chat_log import taipei_now
+from .logger import get_logger
+from .storage import BlobStorage, PreconditionFailed
+
+logger = get_logger(__name__)
+
+# 使用者輸入 reset 時寫入的標記，之後的對話不再參考之前的紀錄
+RESET_SENTINEL = '。'
+
+
+class BlobHistoryBacking:
+    """
+    每個聊天室一個小物件（<prefix>/rooms/<chat_room_id>.json），只保存最近 N 輪對話
+    """
+
+    def __init__(self, storage: BlobStorage, prefix: str = "messages-health"):
+        self.storage = storage
+        self.prefix = prefix.rstrip("/")
+
+    def _name(self, chat_room_id: str) -> str:
+        return f"{self.prefix}/rooms/{chat_room_id}.json"
+
+    def load(self, chat_room_id: str) -> Tuple[List[Dict], int]:
+        data, generation = self.storage.read_with_generation(self._name(chat_room_id))
+        if not data:
+            return [], generation
+        return json.loads(data.decode("utf-8")), generation
+
+    def generation(self, chat_room_id: str) -> int:
+        return self.storage.generation(self._name(chat_room_id))
+
+    def save(self, chat_room_id: str, turns: List[Dict], if_generation_match: Optional[int] = None) -> int:
+        data = json.dumps(turns, ensure_ascii=False).encode("utf-8")
+        return self.storage.write_bytes(self._name(chat_room_id), data, content_type="application/json",
+                                        if_generation_match=if_generation_match)
+
+
+class _Room:
+    __slots__ = ("turns", "generation")
+
+    def __init__(self, turns: Deque[Dict], generation: int = 0):
+        self.turns = turns
+        self.generation = generation
+
+
+class ChatHistoryStore:
+    """
+    以 chat_room_id 為索引的對話歷史，每個聊天室只保留最近 max_turns 輪
+
+    查詢成本只與 max_turns 有關，與總訊息數或聊天室數量無關。
+    記憶體中最多快取 max_rooms 個聊天室（LRU），若提供 backing 則寫入時同步保存，
+    並以版本號做條件式寫入，多個實例同時寫入同一聊天室時會重新讀取後再套用。
+    """
+
+    def __init__(self, max_turns: int = 5, max_rooms: int = 10000,
+                 backing: Optional[BlobHistoryBacking] = None, revalidate: bool = True):
+        self.max_turns = max_turns
+        self.max_rooms = max_rooms
+        self.backing = backing
+        # 有持久化時，每次讀取先比對版本號，避免其他實例寫入後讀到過期的快取
+        self.revalidate = revalidate and backing is not None
+        self._rooms: "OrderedDict[str, _Room]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._room_locks = [threading.Lock() for _ in range(64)]
+
+    def _load(self, chat_room_id: str) -> _Room:
+        turns, generation = self.backing.load(chat_room_id) if self.backing else ([], 0)
+        return _Room(deque(turns, maxlen=self.max_turns), generation)
+
+    def _room_lock(self, chat_room_id: str) -> threading.Lock:
+        # 依聊天室分段上鎖，不同聊天室的讀寫可以同時進行
+        return self._room_locks[hash(chat_room_id) % len(self._room_locks)]
+
+    def _cache(self, chat_room_id: str, room: _Room) -> None:
+        with self._lock:
+            self._rooms[chat_room_id] = room
+            self._rooms.move_to_end(chat_room_id)
+            while len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+
+    def _room(self, chat_room_id: str) -> _Room:
+        """需在持有該聊天室的鎖時呼叫"""
+        with self._lock:
+            room = self._rooms.get(chat_room_id)
+            if room is not None:
+                self._rooms.move_to_end(chat_room_id)
+        if room is not None and self.revalidate and self.backing.generation(chat_room_id) != room.generation:
+            room = None
+        if room is None:
+            room = self._load(chat_room_id)
+            self._cache(chat_room_id, room)
+        return room
+
+    @staticmethod
+    def apply_turn(turns: Deque[Dict], turn: Dict) -> None:
+        """套用一輪對話；遇到 reset 標記時清空之前的紀錄"""
+        if turn["gpt_output"] == RESET_SENTINEL:
+            turns.clear()
+        else:
+            turns.append(turn)
+
+    @staticmethod
+    def make_turn(user_input: str, gpt_output: str, timestamp: Optional[str] = None) -> Dict:
+        return {
+            "timestamp": timestamp or taipei_now().strftime('%Y-%m-%d %H:%M:%S'),
+            "user_input": user_input,
+            "gpt_output": gpt_output,
+        }
+
+    def append(self, chat_room_id: str, user_input: str, gpt_output: str, timestamp: Optional[str] = None) -> None:
+        self.extend(chat_room_id, [self.make_turn(user_input, gpt_output, timestamp)])
+
+    def extend(self, chat_room_id: str, turns: List[Dict], retries: int = 3) -> None:
+        """一次套用多輪對話，持久化時只寫入一次"""
+        with self._room_lock(chat_room_id):
+            room = self._room(chat_room_id)
+            for turn in turns:
+                self.apply_turn(room.turns, turn)
+            if self.backing is None:
+                return
+            for _ in range(retries):
+                try:
+                    room.generation = self.backing.save(chat_room_id, list(room.turns),
+                                                        if_generation_match=room.generation)
+                    return
+                except PreconditionFailed:
+                    # 其他實例已更新此聊天室，重新讀取後再套用
+                    room = self._load(chat_room_id)
+                    self._cache(chat_room_id, room)
+                    for turn in turns:
+                        self.apply_turn(room.turns, turn)
+            logger.error(f"failed to persist chat history for {chat_room_id}")
+
+    def reset(self, chat_room_id: str) -> None:
+        self.append(chat_room_id, RESET_SENTINEL, RESET_SENTINEL)
+
+    def get_turns(self, chat_room_id: str) -> List[Dict]:
+        with self._room_lock(chat_room_id):
+            return list(self._room(chat_room_id).turns)
+
+    def peek_has_history(self, chat_room_id: str) -> Optional[bool]:
+        """只看記憶體快取（不讀取 backing）：聊天室是否有對話紀錄，未快取時回傳 None"""
+        with self._lock:
+            room = self._rooms.get(chat_room_id)
+            return None if room is None else bool(room.turns)
+
+    def format_history(self, chat_room_id: str) -> Tuple[str, str]:
+        """回傳（提供給模型的對話紀錄, 用於 embedding 查詢的最後一輪對話）"""
+        return self.format_turns(self.get_turns(chat_room_id))
+
+    @staticmethod
+    def format_turns(turns: List[Dict]) -> Tuple[str, str]:
+        formatted_history = []
+        for turn in turns:
+            formatted_history.append(f"時間: {turn['timestamp']}")
+            formatted_history.append(f"使用者: {turn['user_input']}")
+            formatted_history.append(f"AI: {turn['gpt_output']}")
+            formatted_history.append("---")
+
+        formatted_history_embedding_use = []
+        if turns:
+            formatted_history_embedding_use.append(f"使用者: {turns[-1]['user_input']}")
+            formatted_history_embedding_use.append(f"AI: {turns[-1]['gpt_output']}")
+
+        return "\n".join(formatted_history), "\n".join(formatted_history_embedding_use)
+
+    def rebuild_from_records(self, records: Iterable[Dict]) -> int:
+        """由既有對話紀錄（如 SegmentedChatLog.iter_records()）重建索引，回傳聊天室數量"""
+        rooms: Dict[str, _Room] = {}
+        for record in records:
+            room = rooms.setdefault(record["chat_room_id"], _Room(deque(maxlen=self.max_turns)))
+            self.apply_turn(room.turns, {
+                "timestamp": record["timestamp"],
+                "user_input": record["user_input"],
+                "gpt_output": record["gpt_output"],
+            })
+        for chat_room_id, room in rooms.items():
+            with self._room_lock(chat_room_id):
+                if self.backing is not None:
+                    room.generation = self.backing.save(chat_room_id, list(room.turns))
+                self._cache(chat_room_id, room)
+        logger.info(f"rebuilt chat history for {len(rooms)} rooms")
+        return len(rooms)
@@ -0,0 +1,234 @@
+import csv
+import io
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .logger import get_logger
+from .storage import BlobStorage, PreconditionFailed
+
+logger = get_logger(__name__)
+
+LOG_COLUMNS = ["timestamp", "chat_room_id", "user_input", "gpt_output"]
+
+# GCS compose 一次最多 32 個來源，保留一個給既有的壓縮檔
+COMPOSE_BATCH_SIZE = 31
+# 壓縮租約的有效秒數；剩下不到一半時停止本輪，避免租約過期後與下一個持有者同時壓縮
+COMPACTION_LEASE_SECONDS = 600
+
+
+def taipei_now() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(hours=8)
+
+
+def encode_rows(rows: List[Dict]) -> bytes:
+    """將對話紀錄編碼為不含標頭的 CSV，多個片段直接串接後仍是合法的 CSV"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in rows:
+        writer.writerow([row[column] for column in LOG_COLUMNS])
+    return buffer.getvalue().encode("utf-8")
+
+
+def decode_rows(data: bytes, has_header: bool = False) -> Iterator[Dict]:
+    reader = csv.reader(io.StringIO(data.decode("utf-8")))
+    if has_header:
+        next(reader, None)
+    for values in reader:
+        if len(values) == len(LOG_COLUMNS):
+            yield dict(zip(LOG_COLUMNS, values))
+
+
+class SegmentedChatLog:
+    """
+    只新增不覆寫的對話紀錄
+
+    每則訊息寫成一個獨立的小物件（segments/<小時>/<時間戳>-<uuid>.csv），
+    寫入成本與紀錄總量無關，多個程序同時寫入也不會互相覆蓋。
+    背景壓縮會把已結束的小時片段以 compose 合併成 compacted/<小時>.csv。
+    """
+
+    def __init__(self, storage: BlobStorage, prefix: str = "messages-health",
+                 legacy_name: Optional[str] = None, grace_seconds: int = 300,
+                 lease_seconds: int = COMPACTION_LEASE_SECONDS):
+        self.storage = storage
+        self.prefix = prefix.rstrip("/")
+        # 舊版整份 CSV，只讀取不再寫入
+        self.legacy_name = legacy_name
+        # 小時結束後保留一段時間，讓仍在寫入的訊息落地再壓縮
+        self.grace_seconds = grace_seconds
+        self.lease_seconds = lease_seconds
+        self._compactor = None
+        # 從建立時開始計時，冷啟動的實例不會在第一個請求就壓縮
+        self._last_compaction = time.time()
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._compaction_lock = threading.Lock()
+
+    @property
+    def segments_prefix(self) -> str:
+        return f"{self.prefix}/segments/"
+
+    @property
+    def compacted_prefix(self) -> str:
+        return f"{self.prefix}/compacted/"
+
+    @property
+    def lease_name(self) -> str:
+        return f"{self.prefix}/compact.lock"
+
+    def append(self, user_input: str, gpt_output: str, chat_room_id: str,
+               timestamp: Optional[datetime] = None) -> str:
+        row = {
+            "timestamp": (timestamp or taipei_now()).strftime('%Y-%m-%d %H:%M:%S'),
+            "chat_room_id": chat_room_id,
+            "user_input": user_input,
+            "gpt_output": gpt_output,
+        }
+        return self.append_rows([row], timestamp)
+
+    def append_rows(self, rows: List[Dict], timestamp: Optional[datetime] = None) -> str:
+        """將多筆紀錄寫成單一片段，回傳片段名稱"""
+        hour = (timestamp or taipei_now()).strftime('%Y%m%d%H')
+        name = f"{self.segments_prefix}{hour}/{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.csv"
+        self.storage.write_bytes(name, encode_rows(rows), content_type="text/csv")
+        return name
+
+    def iter_records(self) -> Iterator[Dict]:
+        """依時間順序讀出所有紀錄：舊版 CSV → 壓縮檔 → 尚未壓縮的片段"""
+        if self.legacy_name:
+            data = self.storage.read_bytes(self.legacy_name)
+            if data:
+                yield from decode_rows(data, has_header=True)
+        for name in self.storage.list_names(self.compacted_prefix):
+            data = self.storage.read_bytes(name)
+            if data:
+                yield from decode_rows(data)
+        for name in self.storage.list_names(self.segments_prefix):
+            data = self.storage.read_bytes(name)
+            if data:
+                yield from decode_rows(data)
+
+    def _closed_hours(self, now: datetime) -> Dict[str, List[str]]:
+        cutoff = (now - timedelta(seconds=self.grace_seconds)).strftime('%Y%m%d%H')
+        hours: Dict[str, List[str]] = {}
+        for name in self.storage.list_names(self.segments_prefix):
+            hour = name[len(self.segments_prefix):].split("/", 1)[0]
+            if hour < cutoff:
+                hours.setdefault(hour, []).append(name)
+        return hours
+
+    def _acquire_lease(self) -> Optional[Tuple[str, float]]:
+        """
+        以條件式寫入 compact.lock 取得壓縮租約，回傳 (token, 到期時間)
+
+        租約不存在時以版本號 0（只在物件不存在時建立）寫入；已過期（持有者中斷）時以其版本號接手。
+        其他實例持有未過期的租約，或同時有人搶先寫入時回傳 None。
+        """
+        data, generation = self.storage.read_with_generation(self.lease_name)
+        if generation:
+            try:
+                if float(json.loads(data)["expires"]) > time.time():
+                    return None
+            except (ValueError, KeyError, TypeError):
+                pass
+        token = uuid.uuid4().hex
+        expires = time.time() + self.lease_seconds
+        try:
+            self.storage.write_bytes(self.lease_name, json.dumps({"token": token, "expires": expires}).encode("utf-8"),
+                                     content_type="application/json", if_generation_match=generation)
+        except PreconditionFailed:
+            return None
+        return token, expires
+
+    def _release_lease(self, token: str) -> None:
+        data = self.storage.read_bytes(self.lease_name)
+        try:
+            owned = data is not None and json.loads(data)["token"] == token
+        except (ValueError, KeyError, TypeError):
+            owned = False
+        # 租約已過期並被其他實例接手時不刪除
+        if owned:
+            self.storage.delete([self.lease_name])
+
+    def compact(self, now: Optional[datetime] = None) -> int:
+        """
+        將已結束小時的片段合併至 compacted/<小時>.csv，回傳合併的片段數
+
+        同一時間只有持有 compact.lock 租約的實例會壓縮，其餘實例直接放棄本輪，
+        因此不會有兩個實例串接同一批片段；每次 compose 另以目的物件的版本號為條件。
+        compose 成功後、刪除來源片段前中斷時，這些片段會在下一輪再被串接一次（重複紀錄）。
+        """
+        lease = self._acquire_lease()
+        if lease is None:
+            logger.info("chat log compaction skipped: lease held by another instance")
+            return 0
+        token, expires = lease
+        deadline = expires - self.lease_seconds / 2
+        compacted = 0
+        try:
+            for hour, segments in sorted(self._closed_hours(now or taipei_now()).items()):
+                destination = f"{self.compacted_prefix}{hour}.csv"
+                for i in range(0, len(segments), COMPOSE_BATCH_SIZE):
+                    if time.time() > deadline:
+                        logger.info("chat log compaction stopped: lease about to expire")
+                        return compacted
+                    batch = segments[i:i + COMPOSE_BATCH_SIZE]
+                    generation = self.storage.generation(destination)
+                    sources = ([destination] if generation else []) + batch
+                    try:
+                        self.storage.compose(sources, destination, if_generation_match=generation)
+                    except (PreconditionFailed, FileNotFoundError) as e:
+                        logger.info(f"compaction of {hour} skipped: {e}")
+                        break
+                    self.storage.delete(batch)
+                    compacted += len(batch)
+        finally:
+            self._release_lease(token)
+            self._last_compaction = time.time()
+        return compacted
+
+    def _compact_logged(self) -> int:
+        try:
+            n = self.compact()
+            if n:
+                logger.info(f"compacted {n} chat log segments")
+            return n
+        except Exception as e:
+            logger.error(f"chat log compaction failed: {e}")
+            return 0
+
+    def maybe_compact(self, interval: int = 3600) -> Optional[threading.Thread]:
+        """
+        供沒有常駐背景執行緒的環境（如 Cloud Functions）在請求結束時呼叫
+
+        距離上次壓縮超過 interval 秒時在背景執行緒壓縮並立即返回，不佔用請求的時間；
+        同一時間最多一個壓縮執行緒。回傳啟動的執行緒，沒有啟動時回傳 None。
+        """
+        with self._compaction_lock:
+            if time.time() - self._last_compaction < interval:
+                return None
+            if self._compaction_thread is not None and self._compaction_thread.is_alive():
+                return None
+            self._last_compaction = time.time()
+            self._compaction_thread = threading.Thread(target=self._compact_logged,
+                                                       name="chat-log-compaction", daemon=True)
+            self._compaction_thread.start()
+            return self._compaction_thread
+
+    def start_compactor(self, interval: int = 600) -> threading.Thread:
+        """啟動背景壓縮執行緒（每個程序只會啟動一次）"""
+        if self._compactor is not None:
+            return self._compactor
+
+        def _run():
+            # 先等一個間隔，啟動時不與第一批請求搶資源
+            while True:
+                time.sleep(interval)
+                self._compact_logged()
+
+        self._compactor = threading.Thread(target=_run, name="chat-log-compactor", daemon=True)
+        self._compactor.start()
+        return self._compactor
@@ -0,0 +1,170 @@
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+DENSE_INDEX_SUFFIX = ".dense"
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"
+RECORDS_FILE = "records.json"
+SUPPORTED_DTYPES = ("float16", "int8")
+# 每次轉成 float32 計算的列數，限制查詢時的暫存記憶體
+BLOCK_ROWS = 2048
+
+
+def dense_index_path(path, collection_name: str) -> Path:
+    return Path(path) / f"{collection_name}{DENSE_INDEX_SUFFIX}"
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def export_dense_index(collection, output_dir, dtype: str = "float16", batch_size: int = 1000) -> Path:
+    """
+    將 Chroma 集合的 embedding 匯出為可 memory-map 的矩陣
+
+    向量先正規化（與 cosine 集合的距離定義一致），int8 時每列另存一個縮放係數；
+    ids / documents / metadatas 存在 records.json。先寫到暫存目錄再整個換上，讀取端不會看到寫到一半的檔案。
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"dtype must be one of {SUPPORTED_DTYPES}")
+    output_dir = Path(output_dir)
+    count = collection.count()
+    if count == 0:
+        raise ValueError("collection is empty")
+
+    tmp_dir = output_dir.with_name(output_dir.name + f".tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    ids: List[str] = []
+    documents: List[str] = []
+    metadatas: List[Dict] = []
+    vectors = None
+    scales = None
+    row = 0
+    for offset in range(0, count, batch_size):
+        batch = collection.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+        embeddings = _normalize(np.asarray(batch["embeddings"], dtype=np.float32))
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(tmp_dir / VECTORS_FILE, mode="w+", dtype=dtype,
+                                                shape=(count, embeddings.shape[1]))
+            if dtype == "int8":
+                scales = np.lib.format.open_memmap(tmp_dir / SCALES_FILE, mode="w+", dtype=np.float32, shape=(count,))
+        n = len(embeddings)
+        if dtype == "int8":
+            row_scales = np.abs(embeddings).max(axis=1) / 127.0
+            row_scales[row_scales == 0] = 1.0
+            vectors[row:row + n] = np.round(embeddings / row_scales[:, None]).astype(np.int8)
+            scales[row:row + n] = row_scales
+        else:
+            vectors[row:row + n] = embeddings.astype(np.float16)
+        ids.extend(batch["ids"])
+        documents.extend(batch["documents"])
+        metadatas.extend(batch["metadatas"])
+        row += n
+
+    vectors.flush()
+    if scales is not None:
+        scales.flush()
+    del vectors, scales
+
+    with open(tmp_dir / RECORDS_FILE, "w", encoding="utf-8") as f:
+        json.dump({
+            "dtype": dtype,
+            "count": row,
+            "created": time.time(),
+            "ids": ids,
+            "documents": documents,
+            "metadatas": metadatas,
+        }, f, ensure_ascii=False)
+
+    old_dir = output_dir.with_name(output_dir.name + f".old-{os.getpid()}")
+    if output_dir.exists():
+        os.replace(output_dir, old_dir)
+    os.replace(tmp_dir, output_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logger.info(f"exported {row} vectors to {output_dir} ({dtype})")
+    return output_dir
+
+
+class DenseIndex:
+    """
+    memory-mapped 的 cosine 向量索引，提供與 Chroma 集合相同的 query / count / peek
+
+    查詢時以一次矩陣乘法計算所有相似度，再以 argpartition 取出前 k 名；
+    矩陣以 mmap 開啟，只有實際讀到的頁面會載入記憶體，多個 worker 之間也能共用 page cache。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / RECORDS_FILE, encoding="utf-8") as f:
+            records = json.load(f)
+        self.dtype = records["dtype"]
+        self.ids: List[str] = records["ids"]
+        self.documents: List[str] = records["documents"]
+        self.metadatas: List[Dict] = records["metadatas"]
+        self.vectors = np.load(self.path / VECTORS_FILE, mmap_mode="r")
+        self.scales = np.load(self.path / SCALES_FILE, mmap_mode="r") if self.dtype == "int8" else None
+        if len(self.vectors) != len(self.ids):
+            raise ValueError(f"dense index {self.path} is inconsistent: "
+                             f"{len(self.vectors)} vectors, {len(self.ids)} records")
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def scores(self, query_embeddings: Sequence[Sequence[float]]) -> np.ndarray:
+        """回傳（查詢數, 文件數）的 cosine 相似度"""
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32))
+        scores = np.empty((len(queries), len(self.vectors)), dtype=np.float32)
+        for start in range(0, len(self.vectors), BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+            block_scores = queries @ block.T
+            if self.scales is not None:
+                block_scores *= self.scales[start:start + BLOCK_ROWS]
+            scores[:, start:start + BLOCK_ROWS] = block_scores
+        return scores
+
+    def query(self, query_embeddings: Sequence[Sequence[float]], n_results: int = 10,
+              include: Optional[Sequence[str]] = ("metadatas", "documents", "distances"), **kwargs) -> Dict:
+        include = set(include or ())
+        scores = self.scores(query_embeddings)
+        k = min(n_results, scores.shape[1])
+        result = {"ids": [], "documents": None, "metadatas": None, "distances": None, "embeddings": None}
+        for key in ("documents", "metadatas", "distances"):
+            if key in include:
+                result[key] = []
+        for row in scores:
+            top = np.argpartition(-row, k - 1)[:k] if k < len(row) else np.arange(len(row))
+            top = top[np.argsort(-row[top])]
+            result["ids"].append([self.ids[i] for i in top])
+            if "documents" in include:
+                result["documents"].append([self.documents[i] for i in top])
+            if "metadatas" in include:
+                result["metadatas"].append([self.metadatas[i] for i in top])
+            if "distances" in include:
+                # 與 Chroma cosine 空間相同：距離 = 1 - 相似度
+                result["distances"].append([float(1.0 - row[i]) for i in top])
+        return result
+
+    def peek(self, limit: int = 10) -> Dict:
+        vectors = np.asarray(self.vectors[:limit], dtype=np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[:limit, None]
+        return {
+            "ids": self.ids[:limit],
+            "embeddings": vectors.tolist(),
+            "documents": self.documents[:limit],
+            "metadatas": self.metadatas[:limit],
+        }
@@ -0,0 +1,229 @@
+import asyncio
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+EMBEDDING_MODEL_NAME = "BAAI/bge-m3"
+
+
+def normalize_text(text: str) -> str:
+    """全形半形統一、去除前後空白並合併連續空白，讓相同問題對應到同一個鍵值"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingCache:
+    """
+    查詢 embedding 的快取：記憶體 LRU + TTL，並可選擇以 SQLite 保存到磁碟
+
+    鍵值為（模型名稱, 正規化後的文字），磁碟層在容器重啟後仍可命中；
+    未命中時以原本的文字呼叫 API，與文件嵌入時的文字處理一致（正規化只影響是否命中）。
+    """
+
+    def __init__(self, embed_fn: Optional[Callable[[str], List[float]]], model: str = EMBEDDING_MODEL_NAME,
+                 max_entries: int = 2048, ttl: int = 7 * 24 * 3600, db_path: Optional[str] = None,
+                 async_embed_fn: Optional[Callable[[str], Awaitable[List[float]]]] = None):
+        self.embed_fn = embed_fn
+        self.async_embed_fn = async_embed_fn
+        self.model = model
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0}
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+        self._async_inflight: Dict[Tuple[str, str], "asyncio.Future"] = {}
+        # SQLite 另用一把鎖，讀寫磁碟時不阻塞只查記憶體的呼叫端（事件迴圈）
+        self._db_lock = threading.Lock()
+        self._db = None
+        if db_path:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text TEXT NOT NULL, created REAL NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text))"
+            )
+            self._db.commit()
+
+    def _get_memory(self, key) -> Optional[List[float]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        created, vector = entry
+        if time.time() - created > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return vector
+
+    def _put_memory(self, key, created: float, vector: List[float]) -> None:
+        self._entries[key] = (created, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_disk(self, key) -> Optional[Tuple[float, List[float]]]:
+        row = self._db.execute(
+            "SELECT created, vector FROM embeddings WHERE model = ? AND text = ?", key
+        ).fetchone()
+        if row is None or time.time() - row[0] > self.ttl:
+            return None
+        return row[0], array("f", row[1]).tolist()
+
+    def _put_disk(self, key, created: float, vector: List[float]) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO embeddings (model, text, created, vector) VALUES (?, ?, ?, ?)",
+            (*key, created, array("f", vector).tobytes()),
+        )
+        self._db.commit()
+
+    def _lookup(self, key, count: bool = True) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._get_memory(key)
+            if vector is not None:
+                if count:
+                    self.stats["hits"] += 1
+                return vector
+        if self._db is not None:
+            with self._db_lock:
+                entry = self._get_disk(key)
+            if entry is not None:
+                with self._lock:
+                    if count:
+                        self.stats["disk_hits"] += 1
+                    self._put_memory(key, *entry)
+                return entry[1]
+        if count:
+            with self._lock:
+                self.stats["misses"] += 1
+        return None
+
+    def _insert(self, key, vector: List[float]) -> None:
+        created = time.time()
+        with self._lock:
+            self._put_memory(key, created, vector)
+        if self._db is not None:
+            with self._db_lock:
+                self._put_disk(key, created, vector)
+
+    def get(self, text: str) -> Optional[List[float]]:
+        """只查快取，不呼叫 API"""
+        return self._lookup((self.model, normalize_text(text)), count=False)
+
+    def get_embedding(self, text: str) -> List[float]:
+        key = (self.model, normalize_text(text))
+        vector = self._lookup(key)
+        if vector is not None:
+            return vector
+        # 同一段文字已有其他執行緒在查詢時直接等待其結果（例如預先計算的 embedding）
+        with self._lock:
+            vector = self._get_memory(key)
+            if vector is not None:
+                return vector
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if not owner:
+            return future.result()
+        try:
+            # API 呼叫不持有鎖，避免阻塞其他執行緒；正規化只用於鍵值，送出使用者原本的文字
+            vector = self.embed_fn(text)
+            self._insert(key, vector)
+            future.set_result(vector)
+            return vector
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def aget_embedding(self, text: str) -> List[float]:
+        """
+        非同步版本，需在建立時提供 async_embed_fn
+
+        只有記憶體層在事件迴圈上查詢；SQLite 的讀寫在事件迴圈的預設 executor 中執行。
+        同一段文字同時有多個查詢時只呼叫一次 API，其餘等待同一個 future。
+        """
+        key = (self.model, normalize_text(text))
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            vector = self._get_memory(key)
+            if vector is not None:
+                self.stats["hits"] += 1
+                return vector
+            future = self._async_inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._async_inflight[key] = loop.create_future()
+            else:
+                self.stats["coalesced"] += 1
+        if not owner:
+            # shield：單一等待者被取消時不影響其他等待者
+            return await asyncio.shield(future)
+        try:
+            vector = await loop.run_in_executor(None, self._lookup, key)
+            if vector is None:
+                vector = await self.async_embed_fn(text)
+                await loop.run_in_executor(None, self._insert, key, vector)
+            future.set_result(vector)
+            return vector
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # 沒有其他等待者時避免 asyncio 警告 exception was never retrieved
+                future.exception()
+            raise
+        finally:
+            with self._lock:
+                self._async_inflight.pop(key, None)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_rate": (self.stats["hits"] + self.stats["disk_hits"]) / lookups if lookups else 0.0,
+            }
+
+
+def deepinfra_embed_fn(deepinfra_client, model: str = EMBEDDING_MODEL_NAME) -> Callable[[str], List[float]]:
+    """以 DeepInfra 的 OpenAI 相容 API 產生 embedding"""
+    def _embed(text: str) -> List[float]:
+        embeddings = deepinfra_client.embeddings.create(
+            model=model,
+            input=text,
+            encoding_format="float"
+        )
+        return embeddings.data[0].embedding
+    return _embed
+
+
+def deepinfra_async_embed_fn(async_deepinfra_client, model: str = EMBEDDING_MODEL_NAME) -> Callable[[str], Awaitable[List[float]]]:
+    """deepinfra_embed_fn 的非同步版本，搭配 AsyncOpenAI 使用"""
+    async def _embed(text: str) -> List[float]:
+        embeddings = await async_deepinfra_client.embeddings.create(
+            model=model,
+            input=text,
+            encoding_format="float"
+        )
+        return embeddings.data[0].embedding
+    return _embed
@@ -0,0 +1,196 @@
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .dense_index import DenseIndex, dense_index_path
+from .logger import get_logger
+from .sparse_index import (
+    ColbertStore, SparseIndex, colbert_index_path, load_optional, sparse_index_path
+)
+
+logger = get_logger(__name__)
+
+# 尚未併入索引的片段目錄
+PENDING_SEGMENTS_SUFFIX = ".hybrid-pending"
+
+# bge-m3 論文建議的 dense / sparse / colbert 權重
+DEFAULT_WEIGHTS = (0.4, 0.2, 0.4)
+
+
+def _align(ids, row_of: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """回傳（來源列, 對應的 dense 列），只保留兩邊都有的文件"""
+    pairs = [(i, row_of[doc_id]) for i, doc_id in enumerate(ids) if doc_id in row_of]
+    if not pairs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    source, target = zip(*pairs)
+    return np.asarray(source, dtype=np.int64), np.asarray(target, dtype=np.int64)
+
+
+class HybridRetriever:
+    """
+    dense + sparse（lexical weights）融合檢索，可選擇以 ColBERT 多向量重新排序候選文件
+
+    以 DenseIndex 的列為準對齊三種索引；查詢介面與 Chroma 的 query 相同，
+    另外接受 query_lexical_weights / query_colbert_vecs（由 BGEM3FlagModel.encode 產生），
+    回傳結果中的 timings 為各階段耗時（毫秒）。
+    """
+
+    def __init__(self, dense: DenseIndex, sparse: Optional[SparseIndex] = None,
+                 colbert: Optional[ColbertStore] = None, weights: Sequence[float] = DEFAULT_WEIGHTS,
+                 candidates: int = 50):
+        self.dense = dense
+        self.sparse = sparse
+        self.colbert = colbert
+        self.weights = tuple(weights)
+        self.candidates = candidates
+        row_of = {doc_id: row for row, doc_id in enumerate(dense.ids)}
+        self._sparse_rows = _align(sparse.ids, row_of) if sparse is not None else None
+        # dense 列 -> colbert 列（沒有 colbert 向量的文件為 -1）
+        self._colbert_row = np.full(len(dense.ids), -1, dtype=np.int64)
+        if colbert is not None:
+            source, target = _align(colbert.ids, row_of)
+            self._colbert_row[target] = source
+
+    @classmethod
+    def load(cls, path, collection_name: str, **kwargs) -> "HybridRetriever":
+        dense = DenseIndex(dense_index_path(path, collection_name))
+        sparse = load_optional(SparseIndex.load, sparse_index_path(path, collection_name))
+        colbert = load_optional(ColbertStore.load, colbert_index_path(path, collection_name))
+        logger.info(f"loaded hybrid retriever {collection_name}: sparse={sparse is not None}, "
+                    f"colbert={colbert is not None}")
+        return cls(dense, sparse, colbert, **kwargs)
+
+    def count(self) -> int:
+        return self.dense.count()
+
+    def peek(self, limit: int = 10) -> Dict:
+        return self.dense.peek(limit)
+
+    def _fuse(self, dense_scores: np.ndarray, query_weights: Optional[Dict], timings: Dict) -> np.ndarray:
+        w_dense, w_sparse, _ = self.weights
+        if self.sparse is None or not query_weights:
+            return w_dense * dense_scores
+        t1 = time.time()
+        sparse_scores = np.zeros(len(dense_scores), dtype=np.float32)
+        source, target = self._sparse_rows
+        sparse_scores[target] = self.sparse.scores(query_weights)[source]
+        timings["sparse"] = timings.get("sparse", 0.0) + 1000 * (time.time() - t1)
+        return w_dense * dense_scores + w_sparse * sparse_scores
+
+    def _rerank(self, fused: np.ndarray, candidates: np.ndarray, query_colbert_vecs, timings: Dict) -> np.ndarray:
+        t1 = time.time()
+        rows = self._colbert_row[candidates]
+        has_vecs = rows >= 0
+        scores = fused[candidates].copy()
+        scores[has_vecs] += self.weights[2] * self.colbert.maxsim(query_colbert_vecs, rows[has_vecs])
+        timings["colbert"] = timings.get("colbert", 0.0) + 1000 * (time.time() - t1)
+        return scores
+
+    def query(self, query_embeddings, n_results: int = 10,
+              include: Optional[Sequence[str]] = ("metadatas", "documents", "distances"),
+              query_lexical_weights: Optional[Sequence[Dict]] = None,
+              query_colbert_vecs: Optional[Sequence[np.ndarray]] = None, **kwargs) -> Dict:
+        include = set(include or ())
+        timings: Dict[str, float] = {}
+        t1 = time.time()
+        dense_scores = self.dense.scores(query_embeddings)
+        timings["dense"] = 1000 * (time.time() - t1)
+
+        result = {"ids": [], "documents": None, "metadatas": None, "distances": None, "embeddings": None}
+        for key in ("documents", "metadatas", "distances"):
+            if key in include:
+                result[key] = []
+
+        for q, row_scores in enumerate(dense_scores):
+            fused = self._fuse(row_scores, query_lexical_weights[q] if query_lexical_weights else None, timings)
+            t2 = time.time()
+            n_candidates = min(max(self.candidates, n_results), len(fused))
+            candidates = np.argpartition(-fused, n_candidates - 1)[:n_candidates] \
+                if n_candidates < len(fused) else np.arange(len(fused))
+            timings["fusion"] = timings.get("fusion", 0.0) + 1000 * (time.time() - t2)
+            scores = fused[candidates]
+            if self.colbert is not None and query_colbert_vecs is not None:
+                scores = self._rerank(fused, candidates, query_colbert_vecs[q], timings)
+            order = np.argsort(-scores)[:n_results]
+            top, top_scores = candidates[order], scores[order]
+
+            result["ids"].append([self.dense.ids[i] for i in top])
+            if "documents" in include:
+                result["documents"].append([self.dense.documents[i] for i in top])
+            if "metadatas" in include:
+                result["metadatas"].append([self.dense.metadatas[i] for i in top])
+            if "distances" in include:
+                result["distances"].append([float(1.0 - s) for s in top_scores])
+
+        result["timings"] = timings
+        return result
+
+
+def hybrid_segments_path(path, collection_name: str) -> Path:
+    return Path(path) / f"{collection_name}{PENDING_SEGMENTS_SUFFIX}"
+
+
+def append_hybrid_segment(path, collection_name: str, ids: Sequence[str], lexical_weights: Sequence[Dict],
+                          colbert_vecs: Optional[Sequence[np.ndarray]] = None, delete_ids: Sequence[str] = ()) -> None:
+    """
+    把一批文件的 lexical weights（與 colbert 向量）寫成待合併的片段，不讀取既有索引
+
+    成本只與這批文件有關；片段在 merge_hybrid_segments 之前不會被查詢到，中斷後留下的片段會在下次合併時套用。
+    """
+    segment_dir = hybrid_segments_path(path, collection_name) / f"{time.time_ns():020d}-{os.getpid()}"
+    SparseIndex.from_lexical_weights(ids, lexical_weights).save(segment_dir / "sparse")
+    if colbert_vecs is not None:
+        ColbertStore.empty().add(ids, colbert_vecs).save(segment_dir / "colbert")
+    with open(segment_dir / "delete_ids.json", "w", encoding="utf-8") as f:
+        json.dump(list(delete_ids), f, ensure_ascii=False)
+
+
+def merge_hybrid_segments(path, collection_name: str) -> int:
+    """
+    依寫入順序把所有待合併的片段一次併入既有索引（各讀寫一次），回傳合併的片段數
+    """
+    segments_dir = hybrid_segments_path(path, collection_name)
+    # 沒有 delete_ids.json 的片段還沒寫完（中斷），略過
+    segment_dirs = sorted(d for d in segments_dir.iterdir() if (d / "delete_ids.json").exists()) \
+        if segments_dir.is_dir() else []
+    if not segment_dirs:
+        return 0
+    sparse_segments, colbert_segments = [], []
+    for segment_dir in segment_dirs:
+        with open(segment_dir / "delete_ids.json", encoding="utf-8") as f:
+            delete_ids = json.load(f)
+        sparse_segments.append((SparseIndex.load(segment_dir / "sparse"), delete_ids))
+        colbert = load_optional(ColbertStore.load, segment_dir / "colbert")
+        # 沒有 colbert 向量的片段仍要套用刪除
+        colbert_segments.append((colbert or ColbertStore.empty(), delete_ids))
+
+    sparse_path = sparse_index_path(path, collection_name)
+    sparse = load_optional(lambda p: SparseIndex.load(p, mmap=False), sparse_path) or SparseIndex.empty()
+    sparse.merge(sparse_segments).save(sparse_path)
+    colbert_path = colbert_index_path(path, collection_name)
+    colbert = load_optional(lambda p: ColbertStore.load(p, mmap=False), colbert_path)
+    if colbert is not None or any(segment.ids for segment, _ in colbert_segments):
+        colbert = colbert or ColbertStore.empty()
+        colbert.merge(colbert_segments).save(colbert_path)
+
+    # 只刪除已合併的片段，合併期間其他程序新寫入的片段留到下次
+    for segment_dir in segment_dirs:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+    logger.info(f"merged {len(segment_dirs)} pending segments into the hybrid indexes of {collection_name}")
+    return len(segment_dirs)
+
+
+def save_hybrid_indexes(path, collection_name: str, ids: Sequence[str], lexical_weights: Sequence[Dict],
+                        colbert_vecs: Optional[Sequence[np.ndarray]] = None, delete_ids: Sequence[str] = ()) -> None:
+    """
+    把新文件的 lexical weights（與 colbert 向量）加入既有索引，同 id 的文件會被取代，delete_ids 會被移除
+
+    會重寫整個索引，分批寫入時改用 append_hybrid_segment，最後呼叫一次 merge_hybrid_segments。
+    """
+    append_hybrid_segment(path, collection_name, ids, lexical_weights, colbert_vecs, delete_ids)
+    merge_hybrid_segments(path, collection_name)
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# 由既有集合重建的紀錄不知道當初的切分設定，diff 會把這些影片列為 changed
+UNKNOWN_CONFIG = "unknown"
+
+
+def config_hash(config: Dict) -> str:
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class ManifestDiff:
+    """一次執行需要處理的影片：new / changed 需重新切分與嵌入，deleted 需從集合刪除"""
+
+    def __init__(self, new: List[str], changed: List[str], deleted: List[str], unchanged: List[str]):
+        self.new = new
+        self.changed = changed
+        self.deleted = deleted
+        self.unchanged = unchanged
+
+    @property
+    def to_ingest(self) -> List[str]:
+        return self.new + self.changed
+
+    def __str__(self) -> str:
+        return (f"{len(self.new)} new, {len(self.changed)} changed, "
+                f"{len(self.deleted)} deleted, {len(self.unchanged)} unchanged")
+
+
+class IngestManifest:
+    """
+    記錄每支影片寫入集合時的內容雜湊、切分設定與 chunk id
+
+    每次執行只需比對逐字稿的內容雜湊與 manifest 即可知道要新增、更新、刪除或略過哪些影片，
+    不需逐支影片查詢集合。
+    """
+
+    def __init__(self, path, config: Dict):
+        self.path = Path(path)
+        self.config = config
+        self.config_hash = config_hash(config)
+        self.videos: Dict[str, Dict] = {}
+        self._pending: Dict[str, Dict] = {}
+        self.exists = self.path.exists()
+        if self.exists:
+            with open(self.path, encoding="utf-8") as f:
+                self.videos = json.load(f).get("videos", {})
+
+    def diff(self, hashes: Dict[str, str]) -> ManifestDiff:
+        """hashes 為目前每支影片的內容雜湊 {video_id: hash}（TranscriptStore.hashes）"""
+        new, changed, unchanged = [], [], []
+        self._pending = {}
+        for video_id, content_hash in sorted(hashes.items()):
+            previous = self.videos.get(video_id)
+            self._pending[video_id] = {"hash": content_hash}
+            if previous is None:
+                new.append(video_id)
+            elif previous["hash"] != content_hash or previous.get("config") != self.config_hash:
+                changed.append(video_id)
+            else:
+                unchanged.append(video_id)
+        deleted = sorted(set(self.videos) - set(hashes))
+        return ManifestDiff(new, changed, deleted, unchanged)
+
+    def is_current(self, video_id: str, content_hash: str) -> bool:
+        """單一影片是否已以目前的內容與設定寫入集合"""
+        previous = self.videos.get(video_id)
+        return (previous is not None and previous.get("config") == self.config_hash
+                and previous["hash"] == content_hash)
+
+    def track(self, video_id: str, content_hash: str) -> None:
+        """登記單一影片目前的內容雜湊（不需對整個頻道 diff），之後可以 record"""
+        self._pending[video_id] = {"hash": content_hash}
+
+    def chunk_ids(self, video_id: str) -> List[str]:
+        return list(self.videos.get(video_id, {}).get("chunk_ids", []))
+
+    def record(self, video_id: str, chunk_ids: List[str]) -> None:
+        """影片的 chunk 已寫入集合後呼叫"""
+        self.videos[video_id] = {**self._pending[video_id], "config": self.config_hash, "chunk_ids": list(chunk_ids)}
+
+    def remove(self, video_id: str) -> None:
+        self.videos.pop(video_id, None)
+
+    def bootstrap_from_collection(self, collection, hashes: Dict[str, str]) -> int:
+        """
+        沒有 manifest 但集合已有資料時，以一次 collection.get 重建 manifest
+
+        只記錄每支影片已寫入的 chunk id；集合中的 chunk 可能是以舊的切分設定產生的，
+        因此設定記為 UNKNOWN_CONFIG，下一次 diff 會重新切分與嵌入這些影片，並以 chunk id 刪除多出來的舊 chunk。
+        """
+        records = collection.get(include=["metadatas"])
+        chunk_ids: Dict[str, List[str]] = {}
+        for doc_id, metadata in zip(records["ids"], records["metadatas"]):
+            chunk_ids.setdefault(metadata["video_id"], []).append(doc_id)
+        for video_id, ids in chunk_ids.items():
+            if video_id in hashes:
+                self.videos[video_id] = {"hash": hashes[video_id], "config": UNKNOWN_CONFIG,
+                                         "chunk_ids": sorted(ids)}
+            else:
+                # 逐字稿已不存在，留在 manifest 中讓 diff 把它列為 deleted
+                self.videos[video_id] = {"hash": "", "config": UNKNOWN_CONFIG, "chunk_ids": sorted(ids)}
+        logger.info(f"bootstrapped manifest for {len(chunk_ids)} videos from the collection")
+        return len(chunk_ids)
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + f".tmp-{os.getpid()}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"config": self.config, "videos": self.videos}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.exists = True
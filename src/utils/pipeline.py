@@ -0,0 +1,141 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class _Stage:
+    __slots__ = ("name", "fn", "deps")
+
+    def __init__(self, name: str, fn: Callable[..., Any], deps: Sequence[str]):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+
+
+class PipelineRun:
+    """一次執行的結果與各階段時間（相對於開始執行的秒數）"""
+
+    def __init__(self, results: Dict[str, Any], timings: Dict[str, Tuple[float, float]],
+                 critical_path: List[str], total: float):
+        self.results = results
+        self.timings = timings
+        self.critical_path = critical_path
+        self.total = total
+
+    def __getitem__(self, name: str) -> Any:
+        return self.results[name]
+
+    def format_timings(self) -> str:
+        parts = [f"{name}={1000 * (end - start):.0f}ms" for name, (start, end) in
+                 sorted(self.timings.items(), key=lambda item: item[1][0])]
+        return f"total={1000 * self.total:.0f}ms " + " ".join(parts) + " critical=" + ">".join(self.critical_path)
+
+
+class StagePipeline:
+    """
+    以相依關係描述的小型處理流程，互不相依的階段在執行緒池中同時執行
+
+    每個階段的函數以關鍵字參數接收其相依階段（或 run 的輸入）的結果，
+    任一階段失敗時整個流程拋出該例外。
+    """
+
+    def __init__(self, max_workers: int = 16):
+        self._stages: Dict[str, _Stage] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline")
+        self._lock = threading.Lock()
+        self.stats = {"runs": 0, "failed": 0, "total_seconds": 0.0}
+        self._stage_seconds: Dict[str, float] = {}
+        self._critical_counts: Dict[str, int] = {}
+
+    def stage(self, name: str, fn: Callable[..., Any], deps: Sequence[str] = ()) -> "StagePipeline":
+        if name in deps:
+            raise ValueError(f"stage {name} depends on itself")
+        self._stages[name] = _Stage(name, fn, deps)
+        return self
+
+    def _required(self, targets: Sequence[str]) -> List[str]:
+        required, stack = set(), list(targets)
+        while stack:
+            name = stack.pop()
+            if name in required or name not in self._stages:
+                continue
+            required.add(name)
+            stack.extend(self._stages[name].deps)
+        return [name for name in self._stages if name in required]
+
+    def run(self, targets: Optional[Sequence[str]] = None, **inputs) -> PipelineRun:
+        """執行所有階段；指定 targets 時只執行產生這些結果所需的階段"""
+        t0 = time.time()
+        results: Dict[str, Any] = dict(inputs)
+        timings: Dict[str, Tuple[float, float]] = {}
+        names = self._required(targets) if targets is not None else list(self._stages)
+        pending = {name: self._stages[name] for name in names if name not in results}
+        running: Dict[Future, str] = {}
+
+        def call(stage: _Stage):
+            start = time.time() - t0
+            try:
+                return stage.fn(**{dep: results[dep] for dep in stage.deps})
+            finally:
+                timings[stage.name] = (start, time.time() - t0)
+
+        try:
+            while pending or running:
+                for name in [name for name, stage in pending.items()
+                             if all(dep in results for dep in stage.deps)]:
+                    running[self._executor.submit(call, pending.pop(name))] = name
+                if not running:
+                    missing = {dep for stage in pending.values() for dep in stage.deps if dep not in results}
+                    raise ValueError(f"unresolved pipeline dependencies: {sorted(missing)}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        except Exception:
+            for future in running:
+                future.cancel()
+            with self._lock:
+                self.stats["failed"] += 1
+            raise
+
+        run = PipelineRun(results, timings, self._critical_path(timings), time.time() - t0)
+        self._record(run)
+        return run
+
+    def _critical_path(self, timings: Dict[str, Tuple[float, float]]) -> List[str]:
+        """由最晚結束的階段往回追溯，每一步取最晚結束的相依階段"""
+        if not timings:
+            return []
+        name = max(timings, key=lambda n: timings[n][1])
+        path = [name]
+        while True:
+            deps = [dep for dep in self._stages[name].deps if dep in timings]
+            if not deps:
+                break
+            name = max(deps, key=lambda n: timings[n][1])
+            path.append(name)
+        return path[::-1]
+
+    def _record(self, run: PipelineRun) -> None:
+        with self._lock:
+            self.stats["runs"] += 1
+            self.stats["total_seconds"] += run.total
+            for name, (start, end) in run.timings.items():
+                self._stage_seconds[name] = self._stage_seconds.get(name, 0.0) + end - start
+            for name in run.critical_path:
+                self._critical_counts[name] = self._critical_counts.get(name, 0) + 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            runs = self.stats["runs"]
+            return {
+                "runs": runs,
+                "failed": self.stats["failed"],
+                "avg_total_ms": 1000 * self.stats["total_seconds"] / runs if runs else 0.0,
+                "avg_stage_ms": {name: 1000 * seconds / runs for name, seconds in self._stage_seconds.items()} if runs else {},
+                "critical_path_share": {name: count / runs for name, count in self._critical_counts.items()} if runs else {},
+            }
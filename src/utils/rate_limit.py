@@ -0,0 +1,87 @@
+import random
+import threading
+import time
+from typing import Callable, Dict, Tuple, Type, TypeVar
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class RateLimiter:
+    """
+    token bucket：平均每秒 rate 次，最多累積 burst 次
+
+    acquire 會阻塞到取得額度為止，可在多個執行緒間共用。
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """取得一次額度，回傳等待的秒數"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class HostRateLimiter:
+    """每個主機各自一個 RateLimiter，第一次使用時建立"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host: str) -> float:
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = RateLimiter(self.rate, self.burst)
+        return limiter.acquire()
+
+
+def backoff_delay(attempt: int, base_delay: float = 1.0, max_delay: float = 30.0) -> float:
+    """指數退避加上 full jitter：在 [0, min(max_delay, base_delay * 2^attempt)] 間取亂數"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def retry_with_jitter(fn: Callable[[], T], retries: int = 3, base_delay: float = 1.0, max_delay: float = 30.0,
+                      retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+                      no_retry: Tuple[Type[BaseException], ...] = ()) -> T:
+    """
+    呼叫 fn，遇到 retry_on 的例外時以 backoff_delay 等待後重試，最多重試 retries 次
+
+    no_retry 中的例外（例如影片沒有字幕）直接拋出，不浪費重試次數。
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except no_retry:
+            raise
+        except retry_on as e:
+            if attempt >= retries:
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            logger.warning(f"attempt {attempt + 1} failed: {type(e).__name__} - {str(e)}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
@@ -0,0 +1,114 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def make_context_key(relevant_docs: List[Dict]) -> Tuple:
+    """檢索結果的識別：影片 ID 與內容雜湊，檢索到的背景資訊相同時鍵值才會相同"""
+    return tuple(
+        (doc["metadata"].get("video_id"), hashlib.sha1(doc["page_content"].encode("utf-8")).hexdigest()[:12])
+        for doc in relevant_docs
+    )
+
+
+class SemanticResponseCache:
+    """
+    語意回答快取
+
+    重用已計算的查詢 embedding，新問題與快取中某個問題的 cosine 相似度達到 threshold、
+    且檢索到的背景資訊相同時，直接回傳先前的回答而不呼叫 LLM。
+    以 LRU + TTL 淘汰，並統計命中次數與省下的生成時間。
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000, ttl: int = 24 * 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._vectors: Optional[np.ndarray] = None
+        # slot -> (context_key, answer, latency, created)
+        self._entries: "OrderedDict[int, Tuple[Tuple, str, float, float]]" = OrderedDict()
+        self._by_context: Dict[Tuple, List[int]] = {}
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "bypassed": 0, "saved_seconds": 0.0, "lookup_seconds": 0.0}
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _evict(self, slot: int) -> None:
+        context_key = self._entries.pop(slot)[0]
+        slots = self._by_context[context_key]
+        slots.remove(slot)
+        if not slots:
+            del self._by_context[context_key]
+        self._free_slots.append(slot)
+
+    def lookup(self, query_embedding, context_key: Tuple, has_history: bool = False) -> Optional[str]:
+        # 有先前對話時回答會依賴上下文，不使用快取
+        if has_history:
+            with self._lock:
+                self.stats["bypassed"] += 1
+            return None
+        t1 = time.time()
+        query = self._normalize(query_embedding)
+        with self._lock:
+            answer = None
+            slots = self._by_context.get(context_key, [])
+            now = time.time()
+            for slot in [s for s in slots if now - self._entries[s][3] > self.ttl]:
+                self._evict(slot)
+            slots = self._by_context.get(context_key, [])
+            if slots and self._vectors is not None and query.shape[0] == self._vectors.shape[1]:
+                scores = self._vectors[slots] @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    slot = slots[best]
+                    self._entries.move_to_end(slot)
+                    _, answer, latency, _ = self._entries[slot]
+                    self.stats["hits"] += 1
+                    self.stats["saved_seconds"] += latency
+            if answer is None:
+                self.stats["misses"] += 1
+            self.stats["lookup_seconds"] += time.time() - t1
+        return answer
+
+    def store(self, query_embedding, context_key: Tuple, answer: str, latency: float,
+              has_history: bool = False) -> None:
+        """latency 為此回答的生成時間，之後每次命中都計入省下的時間"""
+        # 依賴先前對話產生的回答不能提供給其他聊天室（與 lookup 相同的條件）
+        if has_history:
+            return
+        vector = self._normalize(query_embedding)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._entries.clear()
+                self._by_context.clear()
+                self._free_slots = list(range(self.max_entries - 1, -1, -1))
+            if not self._free_slots:
+                self._evict(next(iter(self._entries)))
+            slot = self._free_slots.pop()
+            self._vectors[slot] = vector
+            self._entries[slot] = (context_key, answer, latency, time.time())
+            self._by_context.setdefault(context_key, []).append(slot)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+                "avg_lookup_ms": 1000 * self.stats["lookup_seconds"] / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+from .dense_index import DenseIndex, dense_index_path
+from .hybrid_retriever import HybridRetriever
+from .logger import get_logger
+from .sparse_index import colbert_index_path, sparse_index_path
+
+logger = get_logger(__name__)
+
+
+# Chroma 在磁碟上的檔案：chroma.sqlite3 與各向量段落目錄下的 HNSW 檔案
+DB_FILE_SUFFIXES = (".sqlite3", ".bin", ".pickle")
+# DenseIndex 匯出的檔案
+DENSE_FILE_SUFFIXES = (".npy", ".json")
+RETRIEVER_BACKENDS = ("chroma", "dense", "hybrid")
+
+
+def _dir_signature(path: Path, suffixes=DB_FILE_SUFFIXES) -> int:
+    """資料庫檔案最新的修改時間，用於判斷集合是否被重新寫入"""
+    latest = 0
+    for root, _, files in os.walk(path):
+        for fname in files:
+            if not fname.endswith(suffixes):
+                continue
+            try:
+                latest = max(latest, os.stat(os.path.join(root, fname)).st_mtime_ns)
+            except FileNotFoundError:
+                continue
+    return latest
+
+
+class RetrieverCache:
+    """
+    程序內共用的 Chroma 集合
+
+    整個程序只建立一次 PersistentClient 並載入 HNSW 索引，多個執行緒共用同一個集合。
+    每隔 check_interval 秒檢查一次磁碟上的資料庫，有變動時自動重新載入；
+    也可以直接呼叫 reload() 強制重新載入。
+
+    backend="dense" 時改為載入 <path>/<collection_name>.dense 的 DenseIndex（見 export_dense_index），
+    提供相同的 query 介面，不需要 chromadb。
+    backend="hybrid" 時載入 HybridRetriever（dense 加上 .sparse / .colbert 索引），任一索引被重寫都會重新載入。
+    """
+
+    def __init__(self, path, collection_name: str, check_interval: int = 60, backend: str = "chroma"):
+        if backend not in RETRIEVER_BACKENDS:
+            raise ValueError(f"backend must be one of {RETRIEVER_BACKENDS}")
+        self.path = Path(path)
+        self.collection_name = collection_name
+        self.check_interval = check_interval
+        self.backend = backend
+        self._collection = None
+        self._signature = 0
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _signature_now(self) -> int:
+        if self.backend == "dense":
+            return _dir_signature(dense_index_path(self.path, self.collection_name), DENSE_FILE_SUFFIXES)
+        if self.backend == "hybrid":
+            # 合併後的索引以新目錄整個換上，檔案的修改時間都會更新
+            return max(_dir_signature(index_path(self.path, self.collection_name), DENSE_FILE_SUFFIXES)
+                       for index_path in (dense_index_path, sparse_index_path, colbert_index_path))
+        return _dir_signature(self.path)
+
+    def _load(self):
+        if self.backend in ("dense", "hybrid"):
+            t1 = time.time()
+            signature = self._signature_now()
+            if self.backend == "dense":
+                collection = DenseIndex(dense_index_path(self.path, self.collection_name))
+            else:
+                collection = HybridRetriever.load(self.path, self.collection_name)
+            self._collection, self._signature = collection, signature
+            self._last_check = time.time()
+            logger.info(f"loaded {self.backend} index {self.collection_name} in {time.time() - t1:.2f}s")
+            return collection
+
+        import chromadb
+        try:
+            # PersistentClient 會依路徑共用系統實例，需先清除才能真正重新載入
+            from chromadb.api.client import SharedSystemClient
+            SharedSystemClient.clear_system_cache()
+        except (ImportError, AttributeError):
+            pass
+        t1 = time.time()
+        signature = self._signature_now()
+        client = chromadb.PersistentClient(path=str(self.path))
+        collection = client.get_collection(name=self.collection_name)
+        self._collection, self._signature = collection, signature
+        self._last_check = time.time()
+        logger.info(f"loaded collection {self.collection_name} in {time.time() - t1:.2f}s")
+        return collection
+
+    def get_collection(self):
+        collection = self._collection
+        if collection is not None and time.time() - self._last_check < self.check_interval:
+            return collection
+        with self._lock:
+            if self._collection is None:
+                return self._load()
+            if time.time() - self._last_check >= self.check_interval:
+                self._reload_if_changed_locked()
+            return self._collection
+
+    def _reload_if_changed_locked(self) -> bool:
+        self._last_check = time.time()
+        if self._signature_now() == self._signature:
+            return False
+        logger.info(f"collection {self.collection_name} changed on disk, reloading")
+        self._load()
+        return True
+
+    def reload_if_changed(self) -> bool:
+        with self._lock:
+            if self._collection is None:
+                self._load()
+                return True
+            return self._reload_if_changed_locked()
+
+    def reload(self):
+        with self._lock:
+            return self._load()
+
+    def warm_up(self):
+        """載入集合並執行一次查詢，讓 HNSW 索引在第一則訊息前就載入記憶體"""
+        collection = self.get_collection()
+        sample = collection.peek(1)
+        embeddings = sample.get("embeddings")
+        if embeddings is not None and len(embeddings):
+            collection.query(query_embeddings=[list(embeddings[0])], n_results=1, include=[])
+        logger.info(f"retriever warmed up: {collection.count()} documents")
+        return collection
@@ -0,0 +1,232 @@
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+SPARSE_INDEX_SUFFIX = ".sparse"
+COLBERT_INDEX_SUFFIX = ".colbert"
+
+
+def sparse_index_path(path, collection_name: str) -> Path:
+    return Path(path) / f"{collection_name}{SPARSE_INDEX_SUFFIX}"
+
+
+def colbert_index_path(path, collection_name: str) -> Path:
+    return Path(path) / f"{collection_name}{COLBERT_INDEX_SUFFIX}"
+
+
+def _save_arrays(path: Path, arrays: Dict[str, np.ndarray], ids: List[str]) -> None:
+    """先寫到暫存目錄再整個換上"""
+    tmp_dir = path.with_name(path.name + f".tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    for name, array in arrays.items():
+        np.save(tmp_dir / f"{name}.npy", array)
+    with open(tmp_dir / "ids.json", "w", encoding="utf-8") as f:
+        json.dump(ids, f, ensure_ascii=False)
+    old_dir = path.with_name(path.name + f".old-{os.getpid()}")
+    if path.exists():
+        os.replace(path, old_dir)
+    os.replace(tmp_dir, path)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _load_ids(path: Path) -> List[str]:
+    with open(path / "ids.json", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _kept_rows(ids: List[str], replaced: set) -> np.ndarray:
+    return np.array([doc_id not in replaced for doc_id in ids], dtype=bool)
+
+
+def _resolve_segments(segments: Sequence[Tuple[Sequence[str], Sequence[str]]]) -> Tuple[Dict, set]:
+    """依序套用 (ids, delete_ids)，回傳每個 id 最後出現的位置 {id: (片段, 列)} 與被刪除的 id"""
+    latest: Dict[str, Tuple[int, int]] = {}
+    deleted = set()
+    for n, (ids, delete_ids) in enumerate(segments):
+        for doc_id in delete_ids:
+            latest.pop(doc_id, None)
+            deleted.add(doc_id)
+        for row, doc_id in enumerate(ids):
+            latest[doc_id] = (n, row)
+    return latest, deleted
+
+
+class SparseIndex:
+    """
+    bge-m3 lexical weights 的倒排索引（CSR：依 token 排序的 posting list）
+
+    分數與 BGEM3FlagModel.compute_lexical_matching_score 相同：共同 token 的權重乘積總和。
+    """
+
+    def __init__(self, ids: List[str], tokens: np.ndarray, offsets: np.ndarray,
+                 doc_rows: np.ndarray, weights: np.ndarray):
+        self.ids = ids
+        self.tokens = tokens
+        self.offsets = offsets
+        self.doc_rows = doc_rows
+        self.weights = weights
+
+    @classmethod
+    def from_lexical_weights(cls, ids: Sequence[str], lexical_weights: Sequence[Dict]) -> "SparseIndex":
+        tokens, rows, weights = [], [], []
+        for row, doc_weights in enumerate(lexical_weights):
+            for token, weight in doc_weights.items():
+                tokens.append(int(token))
+                rows.append(row)
+                weights.append(float(weight))
+        return cls._build(list(ids), np.asarray(tokens, dtype=np.int64), np.asarray(rows, dtype=np.int64),
+                          np.asarray(weights, dtype=np.float32))
+
+    @classmethod
+    def empty(cls) -> "SparseIndex":
+        return cls([], np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64),
+                   np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32))
+
+    @classmethod
+    def _build(cls, ids: List[str], tokens: np.ndarray, rows: np.ndarray, weights: np.ndarray) -> "SparseIndex":
+        """由 (token, 文件列, 權重) 建立依 token 排序的 posting list"""
+        order = np.lexsort((rows, tokens))
+        tokens, rows, weights = tokens[order], rows[order].astype(np.int32), weights[order]
+        unique_tokens, starts = np.unique(tokens, return_index=True)
+        offsets = np.append(starts, len(tokens)).astype(np.int64)
+        return cls(ids, unique_tokens.astype(np.int64), offsets, rows, weights)
+
+    def _triples(self):
+        tokens = np.repeat(self.tokens, np.diff(self.offsets))
+        return tokens, np.asarray(self.doc_rows), np.asarray(self.weights, dtype=np.float32)
+
+    def add(self, ids: Sequence[str], lexical_weights: Sequence[Dict],
+            delete_ids: Sequence[str] = ()) -> "SparseIndex":
+        """加入（或取代同 id 的）文件並移除 delete_ids，回傳新的索引"""
+        return self.merge([(SparseIndex.from_lexical_weights(ids, lexical_weights), delete_ids)])
+
+    def merge(self, segments: Sequence[Tuple["SparseIndex", Sequence[str]]]) -> "SparseIndex":
+        """
+        依序套用多個 (片段, delete_ids)，回傳新的索引：後面的片段取代前面同 id 的文件
+
+        所有片段只排序一次，成本與片段數無關。
+        """
+        latest, deleted = _resolve_segments([(segment.ids, delete_ids) for segment, delete_ids in segments])
+        tokens, rows, weights = self._triples()
+        kept = _kept_rows(self.ids, set(latest) | deleted)
+        # 移除被取代的文件並重新編號
+        new_row = np.cumsum(kept) - 1
+        mask = kept[rows] if len(rows) else np.zeros(0, dtype=bool)
+        parts = [(tokens[mask], new_row[rows[mask]], weights[mask])]
+        all_ids = [doc_id for doc_id, keep in zip(self.ids, kept) if keep]
+
+        for n, (segment, _) in enumerate(segments):
+            keep = np.array([latest.get(doc_id) == (n, row) for row, doc_id in enumerate(segment.ids)], dtype=bool)
+            if not keep.any():
+                continue
+            row_map = len(all_ids) + np.cumsum(keep) - 1
+            all_ids.extend(doc_id for doc_id, k in zip(segment.ids, keep) if k)
+            tokens, rows, weights = segment._triples()
+            mask = keep[rows] if len(rows) else np.zeros(0, dtype=bool)
+            parts.append((tokens[mask], row_map[rows[mask]], weights[mask]))
+
+        return SparseIndex._build(all_ids,
+                                  np.concatenate([part[0] for part in parts]).astype(np.int64),
+                                  np.concatenate([part[1] for part in parts]).astype(np.int64),
+                                  np.concatenate([part[2] for part in parts]).astype(np.float32))
+
+    def save(self, path) -> None:
+        _save_arrays(Path(path), {"tokens": self.tokens, "offsets": self.offsets,
+                                  "doc_rows": self.doc_rows, "weights": self.weights}, self.ids)
+        logger.info(f"saved sparse index with {len(self.ids)} documents to {path}")
+
+    @classmethod
+    def load(cls, path, mmap: bool = True) -> "SparseIndex":
+        path = Path(path)
+        mode = "r" if mmap else None
+        return cls(_load_ids(path), *(np.load(path / f"{name}.npy", mmap_mode=mode)
+                                      for name in ("tokens", "offsets", "doc_rows", "weights")))
+
+    def scores(self, query_weights: Dict) -> np.ndarray:
+        """回傳每份文件的 lexical matching 分數"""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for token, query_weight in query_weights.items():
+            i = np.searchsorted(self.tokens, int(token))
+            if i >= len(self.tokens) or self.tokens[i] != int(token):
+                continue
+            start, end = self.offsets[i], self.offsets[i + 1]
+            # 同一個 posting list 內的文件不重複，可以直接以索引相加
+            scores[self.doc_rows[start:end]] += float(query_weight) * self.weights[start:end]
+        return scores
+
+
+class ColbertStore:
+    """
+    每份文件的 ColBERT 多向量（float16，所有文件串接成一個矩陣並以 offsets 切分）
+
+    每份文件約為 token 數 x 1024 維，體積遠大於單一向量，只用於重新排序少量候選文件。
+    """
+
+    def __init__(self, ids: List[str], vectors: np.ndarray, offsets: np.ndarray):
+        self.ids = ids
+        self.vectors = vectors
+        self.offsets = offsets
+
+    @classmethod
+    def empty(cls, dim: int = 1024) -> "ColbertStore":
+        return cls([], np.zeros((0, dim), dtype=np.float16), np.zeros(1, dtype=np.int64))
+
+    def add(self, ids: Sequence[str], colbert_vecs: Sequence[np.ndarray],
+            delete_ids: Sequence[str] = ()) -> "ColbertStore":
+        vectors = [np.asarray(vecs, dtype=np.float16) for vecs in colbert_vecs]
+        lengths = [len(vecs) for vecs in vectors]
+        segment = ColbertStore(list(ids), np.concatenate(vectors) if vectors else self.vectors[:0],
+                               np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64))
+        return self.merge([(segment, delete_ids)])
+
+    def merge(self, segments: Sequence[Tuple["ColbertStore", Sequence[str]]]) -> "ColbertStore":
+        """依序套用多個 (片段, delete_ids)，只串接一次矩陣"""
+        latest, deleted = _resolve_segments([(segment.ids, delete_ids) for segment, delete_ids in segments])
+        kept = _kept_rows(self.ids, set(latest) | deleted)
+        parts = [np.asarray(self.vectors[self.offsets[row]:self.offsets[row + 1]])
+                 for row in np.flatnonzero(kept)]
+        all_ids = [doc_id for doc_id, keep in zip(self.ids, kept) if keep]
+        for n, (segment, _) in enumerate(segments):
+            for row, doc_id in enumerate(segment.ids):
+                if latest.get(doc_id) == (n, row):
+                    parts.append(np.asarray(segment.vectors[segment.offsets[row]:segment.offsets[row + 1]]))
+                    all_ids.append(doc_id)
+        lengths = [len(part) for part in parts]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        vectors = np.concatenate(parts).astype(np.float16) if parts else self.vectors[:0]
+        return ColbertStore(all_ids, vectors, offsets)
+
+    def save(self, path) -> None:
+        _save_arrays(Path(path), {"vectors": self.vectors, "offsets": self.offsets}, self.ids)
+        logger.info(f"saved colbert vectors for {len(self.ids)} documents to {path}")
+
+    @classmethod
+    def load(cls, path, mmap: bool = True) -> "ColbertStore":
+        path = Path(path)
+        mode = "r" if mmap else None
+        return cls(_load_ids(path), np.load(path / "vectors.npy", mmap_mode=mode),
+                   np.load(path / "offsets.npy", mmap_mode=mode))
+
+    def maxsim(self, query_vecs: np.ndarray, rows: Sequence[int]) -> np.ndarray:
+        """與 BGEM3FlagModel.colbert_score 相同：每個查詢 token 取最相似的文件 token 後平均"""
+        query_vecs = np.asarray(query_vecs, dtype=np.float32)
+        scores = np.zeros(len(rows), dtype=np.float32)
+        for i, row in enumerate(rows):
+            doc_vecs = np.asarray(self.vectors[self.offsets[row]:self.offsets[row + 1]], dtype=np.float32)
+            if len(doc_vecs):
+                scores[i] = (query_vecs @ doc_vecs.T).max(axis=1).mean()
+        return scores
+
+
+def load_optional(loader, path) -> Optional[object]:
+    path = Path(path)
+    return loader(path) if (path / "ids.json").exists() else None
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def dir_fingerprint(paths: Sequence[Path]) -> str:
+    """
+    以目錄內每個檔案的相對路徑、大小與修改時間計算指紋（不讀檔案內容）
+
+    路徑也可以是單一檔案；不存在的路徑視為空目錄；暫存檔（.tmp-*）不計入。
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        path = Path(path)
+        digest.update(str(path).encode("utf-8") + b"\0")
+        if not path.exists():
+            continue
+        if path.is_file():
+            stat = os.stat(path)
+            digest.update(f"{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+            continue
+        entries = []
+        for root, _, files in os.walk(path):
+            for name in files:
+                if ".tmp-" in name:
+                    continue
+                full = os.path.join(root, name)
+                stat = os.stat(full)
+                entries.append(f"{os.path.relpath(full, path)}\0{stat.st_size}\0{stat.st_mtime_ns}")
+        for entry in sorted(entries):
+            digest.update(entry.encode("utf-8") + b"\n")
+    return digest.hexdigest()
+
+
+class StageCache:
+    """
+    記錄每個（頻道, 階段）上次成功執行時的輸入指紋，輸入沒變時可略過該階段
+
+    可在多個執行緒間共用，每次 set 都立即寫回檔案。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.entries: Dict[str, str] = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self.entries.get(key)
+
+    def set(self, key: str, fingerprint: str) -> None:
+        with self._lock:
+            self.entries[key] = fingerprint
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + f".tmp-{os.getpid()}")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
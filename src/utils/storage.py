@@ -0,0 +1,235 @@
+import os
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class BlobStorage:
+    """
+    物件儲存介面，讓對話紀錄等資料可以在 GCS 與本地檔案系統之間切換
+    """
+
+    def write_bytes(self, name: str, data: bytes, content_type: str = "application/octet-stream",
+                    if_generation_match: Optional[int] = None) -> int:
+        """寫入物件並回傳新的版本號"""
+        raise NotImplementedError
+
+    def read_bytes(self, name: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def read_with_generation(self, name: str) -> Tuple[Optional[bytes], int]:
+        """讀取物件內容與其版本號，供讀取後再條件式寫回"""
+        raise NotImplementedError
+
+    def exists(self, name: str) -> bool:
+        return self.generation(name) != 0
+
+    def generation(self, name: str) -> int:
+        """物件版本號，不存在時回傳 0，用於條件式寫入"""
+        raise NotImplementedError
+
+    def list_names(self, prefix: str) -> List[str]:
+        raise NotImplementedError
+
+    def delete(self, names: List[str]) -> None:
+        raise NotImplementedError
+
+    def compose(self, sources: List[str], destination: str, content_type: str = "text/csv",
+                if_generation_match: Optional[int] = None) -> None:
+        """依序串接多個物件為一個新物件（GCS compose 一次最多 32 個來源）"""
+        raise NotImplementedError
+
+
+class PreconditionFailed(Exception):
+    """條件式寫入時物件版本已被其他程序更新"""
+
+
+class LocalStorage(BlobStorage):
+    """
+    以本地目錄模擬 GCS bucket，供本地開發與測試使用
+
+    版本號是每個物件的遞增計數器，存在同目錄的隱藏檔 .<名稱>.generation（list_names 不會列出），
+    刪除後重新建立也不會重複使用舊的版本號；只在同一個程序內以鎖互斥。
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> Path:
+        return self.root / name
+
+    def _generation_path(self, name: str) -> Path:
+        path = self._path(name)
+        return path.with_name(f".{path.name}.generation")
+
+    def _counter(self, name: str) -> int:
+        try:
+            return int(self._generation_path(name).read_text())
+        except (FileNotFoundError, ValueError):
+            # 沒有計數器的既有檔案視為版本 1
+            return 1 if self._path(name).exists() else 0
+
+    def _bump_generation(self, name: str) -> int:
+        generation = self._counter(name) + 1
+        self._atomic_write(self._generation_path(name), str(generation).encode())
+        return generation
+
+    def generation(self, name: str) -> int:
+        if not self._path(name).exists():
+            return 0
+        return self._counter(name)
+
+    def _check_generation(self, name: str, if_generation_match: Optional[int]) -> None:
+        if if_generation_match is not None and self.generation(name) != if_generation_match:
+            raise PreconditionFailed(name)
+
+    def _atomic_write(self, path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def write_bytes(self, name, data, content_type="application/octet-stream", if_generation_match=None):
+        with self._lock:
+            self._check_generation(name, if_generation_match)
+            self._atomic_write(self._path(name), data)
+            return self._bump_generation(name)
+
+    def read_bytes(self, name):
+        try:
+            with open(self._path(name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def read_with_generation(self, name):
+        with self._lock:
+            return self.read_bytes(name), self.generation(name)
+
+    def list_names(self, prefix):
+        # 與 GCS 相同，以字串前綴比對並回傳排序後的物件名稱
+        base = self._path(prefix) if prefix.endswith("/") else self._path(prefix).parent
+        if not base.exists():
+            return []
+        names = []
+        for path in base.rglob("*"):
+            if path.is_file() and not path.name.startswith("."):
+                name = path.relative_to(self.root).as_posix()
+                if name.startswith(prefix):
+                    names.append(name)
+        return sorted(names)
+
+    def delete(self, names):
+        # 保留版本號計數器，重新建立時版本號繼續遞增
+        with self._lock:
+            for name in names:
+                try:
+                    self._path(name).unlink()
+                except FileNotFoundError:
+                    pass
+
+    def compose(self, sources, destination, content_type="text/csv", if_generation_match=None):
+        with self._lock:
+            self._check_generation(destination, if_generation_match)
+            chunks = []
+            for source in sources:
+                data = self.read_bytes(source)
+                if data is None:
+                    raise FileNotFoundError(source)
+                chunks.append(data)
+            self._atomic_write(self._path(destination), b"".join(chunks))
+            self._bump_generation(destination)
+
+
+class GCSStorage(BlobStorage):
+    """
+    Google Cloud Storage 實作，client 與 bucket 只建立一次
+    """
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+        self._bucket = None
+        self._lock = threading.Lock()
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            with self._lock:
+                if self._bucket is None:
+                    from google.cloud import storage
+                    self._bucket = storage.Client().bucket(self.bucket_name)
+        return self._bucket
+
+    def generation(self, name):
+        blob = self.bucket.get_blob(name)
+        return blob.generation if blob is not None else 0
+
+    def write_bytes(self, name, data, content_type="application/octet-stream", if_generation_match=None):
+        from google.api_core.exceptions import PreconditionFailed as GCSPreconditionFailed
+        blob = self.bucket.blob(name)
+        try:
+            blob.upload_from_string(data, content_type=content_type, if_generation_match=if_generation_match)
+        except GCSPreconditionFailed as e:
+            raise PreconditionFailed(name) from e
+        return blob.generation
+
+    def read_bytes(self, name):
+        from google.api_core.exceptions import NotFound
+        try:
+            return self.bucket.blob(name).download_as_bytes()
+        except NotFound:
+            return None
+
+    def read_with_generation(self, name):
+        from google.api_core.exceptions import NotFound
+        blob = self.bucket.blob(name)
+        try:
+            data = blob.download_as_bytes()
+        except NotFound:
+            return None, 0
+        # 下載時會由回應標頭帶回 generation
+        return data, int(blob.generation or 0)
+
+    def list_names(self, prefix):
+        return sorted(blob.name for blob in self.bucket.client.list_blobs(self.bucket, prefix=prefix))
+
+    def delete(self, names):
+        from google.api_core.exceptions import NotFound
+        for name in names:
+            try:
+                self.bucket.blob(name).delete()
+            except NotFound:
+                pass
+
+    def compose(self, sources, destination, content_type="text/csv", if_generation_match=None):
+        from google.api_core.exceptions import NotFound, PreconditionFailed as GCSPreconditionFailed
+        destination_blob = self.bucket.blob(destination)
+        destination_blob.content_type = content_type
+        try:
+            destination_blob.compose(
+                [self.bucket.blob(source) for source in sources],
+                if_generation_match=if_generation_match,
+            )
+        except GCSPreconditionFailed as e:
+            raise PreconditionFailed(destination) from e
+        except NotFound as e:
+            # 來源片段已被其他程序壓縮並刪除
+            raise FileNotFoundError(destination) from e
+
+
+def get_storage(bucket_name: str) -> BlobStorage:
+    """
+    依環境變數選擇儲存後端：設定 LOCAL_STORAGE_DIR 時使用本地目錄，否則使用 GCS
+    """
+    local_dir = os.environ.get("LOCAL_STORAGE_DIR")
+    if local_dir:
+        logger.info(f"using local storage: {local_dir}")
+        return LocalStorage(local_dir)
+    return GCSStorage(bucket_name)
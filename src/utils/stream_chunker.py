@@ -0,0 +1,70 @@
+from typing import List
+
+# 可以切分訊息的句尾字元
+SENTENCE_ENDINGS = "。！？!?；;\n"
+# LINE 文字訊息上限為 5000 字
+LINE_TEXT_LIMIT = 5000
+
+
+class StreamChunker:
+    """
+    把串流的模型輸出切成可以逐則送出的訊息
+
+    第一則為第一個完整段落（空行結尾），之後累積到 min_chars 字以上時在最後一個句尾切分，
+    讓使用者盡早看到開頭，又不會把回答拆成過多則訊息。
+    """
+
+    def __init__(self, min_chars: int = 200, min_first_chars: int = 20, max_chars: int = LINE_TEXT_LIMIT):
+        self.min_chars = min_chars
+        self.min_first_chars = min_first_chars
+        self.max_chars = max_chars
+        self.first_sent = False
+        self._buffer = ""
+
+    def _cut(self, end: int) -> str:
+        chunk, self._buffer = self._buffer[:end].strip(), self._buffer[end:]
+        return chunk
+
+    def _first_paragraph_end(self) -> int:
+        start = 0
+        while True:
+            index = self._buffer.find("\n\n", start)
+            if index < 0:
+                return -1
+            if len(self._buffer[:index].strip()) >= self.min_first_chars:
+                return index + 2
+            start = index + 2
+
+    def _sentence_end(self) -> int:
+        positions = [self._buffer.rfind(c, 0, self.max_chars) for c in SENTENCE_ENDINGS]
+        return max(positions) + 1
+
+    def feed(self, delta: str) -> List[str]:
+        """加入一段輸出，回傳可以送出的訊息"""
+        self._buffer += delta
+        chunks = []
+        while True:
+            end = -1
+            if not self.first_sent:
+                end = self._first_paragraph_end()
+            elif len(self._buffer.strip()) >= self.min_chars:
+                end = self._sentence_end()
+            if end <= 0 and len(self._buffer) >= self.max_chars:
+                end = self._sentence_end() or self.max_chars
+            if end <= 0:
+                return chunks
+            chunk = self._cut(end)
+            if chunk:
+                chunks.append(chunk)
+                self.first_sent = True
+
+    def flush(self) -> List[str]:
+        """串流結束時取出剩下的內容"""
+        chunks = []
+        while self._buffer.strip():
+            end = self._sentence_end() if len(self._buffer) > self.max_chars else len(self._buffer)
+            chunks.append(self._cut(end or self.max_chars))
+        self._buffer = ""
+        if chunks:
+            self.first_sent = True
+        return [chunk for chunk in chunks if chunk]
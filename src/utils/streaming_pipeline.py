@@ -0,0 +1,179 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+_STOP = object()
+
+
+class _Envelope:
+    __slots__ = ("item", "created")
+
+    def __init__(self, item: Any, created: float):
+        self.item = item
+        self.created = created
+
+
+class StreamStage:
+    """
+    串流流程的一個階段：workers 個執行緒從有界佇列取出項目交給 fn，結果放入下一階段的佇列
+
+    batch_size > 1 時 fn 收到一個 list（拿到第一個項目後最多再等 max_wait 秒湊滿），回傳結果的 list；
+    否則 fn 收到單一項目並回傳單一結果。回傳 None（或 list 中的 None）表示該項目不再往下傳。
+    queue_size 是此階段輸入佇列的上限，上游較快時會在放入時阻塞（背壓），記憶體用量因此有上限。
+    """
+
+    def __init__(self, name: str, fn: Callable[[Any], Any], workers: int = 1, batch_size: int = 1,
+                 max_wait: float = 0.5, queue_size: int = 4):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.queue_size = queue_size
+
+
+class StreamingPipeline:
+    """
+    以有界佇列串接的多階段流程：每個項目完成一個階段就立刻進入下一個階段，不需等整批完成
+
+    單一項目（或批次）失敗時記錄錯誤並丟棄，不影響其他項目。
+    run 回傳每個階段的處理數、失敗數、忙碌秒數與佇列最大深度，以及項目從進入到離開流程的延遲。
+    """
+
+    def __init__(self, stages: List[StreamStage]):
+        if not stages:
+            raise ValueError("pipeline needs at least one stage")
+        self.stages = stages
+
+    def run(self, items: Iterable[Any], on_output: Optional[Callable[[Any, float], None]] = None) -> Dict:
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        lock = threading.Lock()
+        stats = {stage.name: {"processed": 0, "failed": 0, "busy_seconds": 0.0, "max_queue": 0}
+                 for stage in self.stages}
+        latencies: List[float] = []
+        remaining = [stage.workers for stage in self.stages]
+        t0 = time.time()
+
+        def put(index: int, envelope) -> None:
+            queues[index].put(envelope)
+            depth = queues[index].qsize()
+            with lock:
+                name = self.stages[index].name
+                stats[name]["max_queue"] = max(stats[name]["max_queue"], depth)
+
+        def take(index: int) -> List:
+            stage = self.stages[index]
+            first = queues[index].get()
+            if first is _STOP or stage.batch_size <= 1:
+                return [first]
+            batch = [first]
+            deadline = time.time() + stage.max_wait
+            while len(batch) < stage.batch_size:
+                try:
+                    envelope = queues[index].get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if envelope is _STOP:
+                    # 放回去讓這個 worker 處理完這一批後結束
+                    queues[index].put(_STOP)
+                    break
+                batch.append(envelope)
+            return batch
+
+        def emit(index: int, envelope: _Envelope) -> None:
+            if index + 1 < len(self.stages):
+                put(index + 1, envelope)
+                return
+            latency = time.time() - envelope.created
+            with lock:
+                latencies.append(latency)
+            if on_output is not None:
+                try:
+                    on_output(envelope.item, latency)
+                except Exception as e:
+                    logger.error(f"on_output failed: {type(e).__name__} - {str(e)}")
+
+        def work(index: int) -> None:
+            stage = self.stages[index]
+            try:
+                while True:
+                    batch = take(index)
+                    if batch[-1] is _STOP:
+                        batch.pop()
+                        stop = True
+                    else:
+                        stop = False
+                    if batch:
+                        t1 = time.time()
+                        try:
+                            if stage.batch_size > 1:
+                                results = stage.fn([envelope.item for envelope in batch])
+                                # 結果數量不符時無法判斷各結果對應哪個項目，整批視為失敗
+                                if len(results) != len(batch):
+                                    raise ValueError(f"returned {len(results)} results for {len(batch)} items")
+                            else:
+                                results = [stage.fn(batch[0].item)]
+                            failed = 0
+                        except Exception as e:
+                            logger.error(f"[{stage.name}] failed on {len(batch)} items: "
+                                         f"{type(e).__name__} - {str(e)}")
+                            results = [None] * len(batch)
+                            failed = len(batch)
+                        with lock:
+                            stats[stage.name]["processed"] += len(batch) - failed
+                            stats[stage.name]["failed"] += failed
+                            stats[stage.name]["busy_seconds"] += time.time() - t1
+                        for envelope, result in zip(batch, results):
+                            if result is None:
+                                continue
+                            # 單一項目往下傳失敗時只丟棄該項目，worker 繼續消化佇列，上游才不會卡在已滿的佇列
+                            try:
+                                emit(index, _Envelope(result, envelope.created))
+                            except Exception as e:
+                                logger.error(f"[{stage.name}] emit failed: {type(e).__name__} - {str(e)}")
+                    if stop:
+                        break
+            finally:
+                # 此階段最後一個結束的 worker 通知下一階段結束（即使 worker 異常結束）
+                with lock:
+                    remaining[index] -= 1
+                    last = remaining[index] == 0
+                if last and index + 1 < len(self.stages):
+                    for _ in range(self.stages[index + 1].workers):
+                        queues[index + 1].put(_STOP)
+
+        threads = []
+        for index, stage in enumerate(self.stages):
+            for i in range(stage.workers):
+                thread = threading.Thread(target=work, args=(index,), name=f"{stage.name}-{i}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        count = 0
+        for item in items:
+            put(0, _Envelope(item, time.time()))
+            count += 1
+        for _ in range(self.stages[0].workers):
+            queues[0].put(_STOP)
+        for thread in threads:
+            thread.join()
+
+        latencies.sort()
+        for stage_stats in stats.values():
+            stage_stats["busy_seconds"] = round(stage_stats["busy_seconds"], 2)
+        result = {
+            "items": count,
+            "completed": len(latencies),
+            "seconds": round(time.time() - t0, 2),
+            "stages": stats,
+            "first_latency": round(min(latencies), 2) if latencies else None,
+            "p50_latency": round(latencies[len(latencies) // 2], 2) if latencies else None,
+            "max_latency": round(latencies[-1], 2) if latencies else None,
+        }
+        logger.info(f"streaming pipeline: {result}")
+        return result
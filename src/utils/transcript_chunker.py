@@ -0,0 +1,116 @@
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 標點還原模型插入的符號（以及它會先刪掉的符號），對齊時兩邊都略過
+_IGNORED = re.compile(r"[\s.,;:!?\-。，、；：！？]")
+# 句子結尾：中文句號／問號／驚嘆號、換行，以及不在數字中的英文句點
+SENTENCE_END = re.compile(r"(?:[。！？!?\n]|\.(?!\d))+")
+# 過長的句子優先在逗號或空白處切開
+SOFT_BREAK = re.compile(r"[，,、；;：:\s]")
+# 對齊失敗時往後尋找相同字元的範圍
+ALIGN_WINDOW = 32
+
+
+def align_segments(text: str, segments: Sequence[Sequence]) -> List[Optional[int]]:
+    """
+    回傳 text 中每個字元所屬的片段 index（segments 為 [[start, end, text], ...]）
+
+    text 是片段文字合併、還原標點後的結果，只多了（或少了）標點與空白，
+    因此去掉標點與空白後逐字比對即可；比對不上的字元沿用前一個字元的片段。
+    """
+    skeleton: List[Tuple[str, int]] = []
+    for index, segment in enumerate(segments):
+        skeleton.extend((char, index) for char in segment[2] if not _IGNORED.match(char))
+
+    positions: List[Optional[int]] = []
+    pointer = 0
+    current = 0 if segments else None
+    for char in text:
+        if not _IGNORED.match(char) and pointer < len(skeleton):
+            for offset in range(pointer, min(pointer + ALIGN_WINDOW, len(skeleton))):
+                if skeleton[offset][0] == char:
+                    current = skeleton[offset][1]
+                    pointer = offset + 1
+                    break
+        positions.append(current)
+    return positions
+
+
+def split_sentences(text: str, max_chars: int) -> List[Tuple[int, int]]:
+    """以句子為單位切分，回傳 [(start, end)]；超過 max_chars 的句子在逗號或空白處再切開"""
+    spans = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        spans.append((start, match.end()))
+        start = match.end()
+    if start < len(text):
+        spans.append((start, len(text)))
+
+    result = []
+    for start, end in spans:
+        while end - start > max_chars:
+            breaks = [m.end() for m in SOFT_BREAK.finditer(text, start + max_chars // 2, start + max_chars)]
+            cut = breaks[-1] if breaks else start + max_chars
+            result.append((start, cut))
+            start = cut
+        if text[start:end].strip():
+            result.append((start, end))
+    return result
+
+
+def chunk_transcript(text: str, segments: Optional[Sequence[Sequence]] = None,
+                     chunk_size: int = 600, chunk_overlap: int = 100) -> List[Dict]:
+    """
+    將一支影片的逐字稿切成以句子為邊界、不超過 chunk_size 個字元的 chunk，回傳 [{"text", "start", "end"}]
+
+    相鄰 chunk 重疊最多 chunk_overlap 個字元的完整句子。有 segments 時每個 chunk 帶有
+    第一句開始與最後一句結束的秒數（用於連結到影片的該段落），沒有時 start / end 為 None。
+    """
+    positions = align_segments(text, segments) if segments else [None] * len(text)
+
+    def make_chunk(start: int, end: int) -> Dict:
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        first = positions[start] if start < end else None
+        last = positions[end - 1] if start < end else None
+        return {"text": text[start:end],
+                "start": float(segments[first][0]) if first is not None else None,
+                "end": float(segments[last][1]) if last is not None else None}
+
+    if len(text) <= chunk_size:
+        return [make_chunk(0, len(text)) if text.strip() else {"text": text, "start": None, "end": None}]
+
+    sentences = split_sentences(text, chunk_size)
+    chunks = []
+    current: List[Tuple[int, int]] = []
+    size = 0
+    for sentence in sentences:
+        length = sentence[1] - sentence[0]
+        if current and size + length > chunk_size:
+            chunks.append(make_chunk(current[0][0], current[-1][1]))
+            # 下一個 chunk 以前一個 chunk 結尾的幾個完整句子開頭
+            overlap = []
+            overlap_size = 0
+            for previous in reversed(current[1:]):
+                previous_length = previous[1] - previous[0]
+                if (overlap_size + previous_length > chunk_overlap
+                        or overlap_size + previous_length + length > chunk_size):
+                    break
+                overlap.insert(0, previous)
+                overlap_size += previous_length
+            current, size = overlap, overlap_size
+        current.append(sentence)
+        size += length
+    if current:
+        chunks.append(make_chunk(current[0][0], current[-1][1]))
+    return chunks
+
+
+def video_url(metadata: Dict) -> str:
+    """chunk 的 metadata 轉為 YouTube 連結，有開始時間時直接跳到該段落"""
+    url = f"https://www.youtube.com/watch?v={metadata['video_id']}"
+    if metadata.get("start") is not None:
+        url += f"&t={int(metadata['start'])}s"
+    return url
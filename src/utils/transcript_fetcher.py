@@ -0,0 +1,212 @@
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .logger import get_logger
+from .rate_limit import HostRateLimiter, retry_with_jitter
+
+logger = get_logger(__name__)
+
+
+class TranscriptUnavailable(Exception):
+    """影片沒有（指定語言的）字幕或已無法觀看，重試也不會成功"""
+
+
+# 字幕的優先順序：（來源名稱, 是否為自動產生的字幕, 語言代碼, 是否需要簡轉繁）
+# 只有全部都找不到時才需要下載音訊並以 Whisper 辨識
+DEFAULT_CHAIN = (
+    ("zh-Hant", False, ("zh-TW", "zh-Hant", "zh-HK"), False),
+    ("zh-Hans", False, ("zh-CN", "zh-Hans", "zh-SG", "zh"), True),
+    ("auto:zh-Hant", True, ("zh-TW", "zh-Hant", "zh-HK"), False),
+    ("auto:zh-Hans", True, ("zh-CN", "zh-Hans", "zh-SG", "zh"), True),
+)
+
+
+class TranscriptSource:
+    """
+    字幕來源介面
+
+    fetch 回傳 [{"text", "start", "duration"}, ...]；沒有字幕時拋出 TranscriptUnavailable，
+    其他例外視為暫時性錯誤並重試。host 用於依主機限制請求速率。
+    resolve 另外回傳實際採用的字幕來源名稱（記錄在實體檔中）。
+    """
+
+    host = "default"
+    name = "default"
+
+    def fetch(self, video_id: str) -> List[Dict]:
+        raise NotImplementedError
+
+    def resolve(self, video_id: str) -> Tuple[List[Dict], str]:
+        return self.fetch(video_id), self.name
+
+
+class YouTubeTranscriptSource(TranscriptSource):
+    """
+    youtube-transcript-api 的字幕來源，依 chain 的順序嘗試各種字幕
+
+    簡體字幕以 OpenCC s2t 轉為繁體；沒有安裝 opencc 時略過需要轉換的來源。
+    """
+
+    host = "www.youtube.com"
+
+    def __init__(self, chain: Sequence[Tuple[str, bool, Sequence[str], bool]] = DEFAULT_CHAIN):
+        from youtube_transcript_api import YouTubeTranscriptApi
+        from youtube_transcript_api._errors import NoTranscriptFound, TranscriptsDisabled, VideoUnavailable
+
+        self._api = YouTubeTranscriptApi
+        self._not_found = NoTranscriptFound
+        self._unavailable = (TranscriptsDisabled, VideoUnavailable)
+        self._converter = None
+        if any(convert for _, _, _, convert in chain):
+            try:
+                from opencc import OpenCC
+
+                self._converter = OpenCC("s2t")
+            except ImportError:
+                logger.warning("opencc is not installed, skipping simplified Chinese transcripts")
+                chain = [link for link in chain if not link[3]]
+        self.chain = list(chain)
+
+    def _list(self, video_id: str):
+        if hasattr(self._api, "list_transcripts"):
+            return self._api.list_transcripts(video_id)
+        # 1.x 版改為實例方法 list
+        return self._api().list(video_id)
+
+    def _to_traditional(self, transcript: List[Dict]) -> List[Dict]:
+        return [{**line, "text": self._converter.convert(line["text"])} for line in transcript]
+
+    def resolve(self, video_id: str) -> Tuple[List[Dict], str]:
+        try:
+            transcripts = self._list(video_id)
+        except self._unavailable as e:
+            raise TranscriptUnavailable(str(e)) from e
+        for name, generated, language_codes, convert in self.chain:
+            find = transcripts.find_generated_transcript if generated else transcripts.find_manually_created_transcript
+            try:
+                transcript = find(list(language_codes))
+            except self._not_found:
+                continue
+            data = transcript.fetch()
+            # 1.x 版的 fetch 回傳 FetchedTranscript
+            data = data.to_raw_data() if hasattr(data, "to_raw_data") else data
+            return (self._to_traditional(data) if convert else data), name
+        raise TranscriptUnavailable(f"no transcript in {[name for name, _, _, _ in self.chain]} for {video_id}")
+
+    def fetch(self, video_id: str) -> List[Dict]:
+        return self.resolve(video_id)[0]
+
+
+class FakeTranscriptSource(TranscriptSource):
+    """
+    本地測試用的字幕來源：以固定延遲模擬網路請求，可設定暫時性錯誤的比例
+
+    transcripts 中沒有的影片視為沒有字幕。
+    """
+
+    host = "fake"
+    name = "fake"
+
+    def __init__(self, transcripts: Dict[str, List[Dict]], latency: float = 0.2,
+                 failure_rate: float = 0.0, seed: int = 0):
+        self.transcripts = transcripts
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def fetch(self, video_id: str) -> List[Dict]:
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.failure_rate
+        time.sleep(self.latency)
+        if failed:
+            raise ConnectionError(f"simulated failure for {video_id}")
+        if video_id not in self.transcripts:
+            raise TranscriptUnavailable(video_id)
+        return self.transcripts[video_id]
+
+
+def write_json_atomic(path: Path, data) -> None:
+    """先寫暫存檔再改名，中斷時不會留下寫到一半、下次被當成已完成的檔案"""
+    tmp_path = path.with_name(path.name + f".tmp-{os.getpid()}-{threading.get_ident()}")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _needs_fetch(path: Path, transcript_key: str, source_key: str, retry_unresolved: bool) -> bool:
+    if not path.exists():
+        return True
+    if not retry_unresolved:
+        return False
+    # 舊版只嘗試 zh-TW 字幕：沒有字幕也沒有記錄來源的影片，以目前的來源順序重新嘗試
+    try:
+        with open(path) as f:
+            entity = json.load(f)
+    except ValueError:
+        return True
+    return not entity.get(transcript_key) and source_key not in entity
+
+
+def fetch_transcripts(source: TranscriptSource, videos: List[Dict], output_dir, video_id_key: str = "video_id",
+                      transcript_key: str = "transcript", source_key: str = "transcript_source",
+                      workers: int = 8, rate: float = 5.0, burst: int = 5, retries: int = 3, base_delay: float = 1.0,
+                      retry_unresolved: bool = True, limiter: Optional[HostRateLimiter] = None) -> Dict:
+    """
+    以有界執行緒池平行下載字幕，每支影片寫成 output_dir/{video_id}.json
+
+    已存在的檔案略過，因此中斷後重新執行會從未完成的影片繼續；
+    沒有字幕的影片寫入空的 transcript 與來源 "none"（之後由語音辨識處理），重試後仍失敗的影片不寫檔，下次執行再試。
+    實際採用的字幕來源記錄在 source_key。同一主機的請求速率以 rate（每秒次數）與 burst 限制。
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    limiter = limiter or HostRateLimiter(rate, burst)
+    pending = [video for video in videos if _needs_fetch(output_dir / f"{video[video_id_key]}.json",
+                                                         transcript_key, source_key, retry_unresolved)]
+    stats = {"videos": len(videos), "skipped": len(videos) - len(pending), "fetched": 0,
+             "unavailable": 0, "failed": 0, "seconds": 0.0, "sources": {}}
+    logger.info(f"fetching {len(pending)} transcripts ({stats['skipped']} already done) with {workers} workers")
+    if not pending:
+        return stats
+
+    def fetch_one(video: Dict) -> str:
+        video_id = video[video_id_key]
+
+        def attempt() -> Tuple[List[Dict], str]:
+            limiter.acquire(source.host)
+            return source.resolve(video_id)
+
+        try:
+            transcript, transcript_source = retry_with_jitter(attempt, retries=retries, base_delay=base_delay,
+                                                              no_retry=(TranscriptUnavailable,))
+        except TranscriptUnavailable:
+            transcript, transcript_source = [], "none"
+        write_json_atomic(output_dir / f"{video_id}.json",
+                          {**video, transcript_key: transcript, source_key: transcript_source})
+        return transcript_source
+
+    t1 = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch_one, video): video[video_id_key] for video in pending}
+        for i, future in enumerate(as_completed(futures), 1):
+            try:
+                transcript_source = future.result()
+                stats["unavailable" if transcript_source == "none" else "fetched"] += 1
+                stats["sources"][transcript_source] = stats["sources"].get(transcript_source, 0) + 1
+            except Exception as e:
+                logger.error(f"failed to fetch transcript of {futures[future]}: {type(e).__name__} - {str(e)}")
+                stats["failed"] += 1
+            if i % 100 == 0:
+                logger.info(f"{i}/{len(pending)} transcripts done")
+    stats["seconds"] = round(time.time() - t1, 2)
+    logger.info(f"transcripts: {stats}")
+    return stats
@@ -0,0 +1,243 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from .logger import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows：只有同一程序內的執行緒互斥
+    fcntl = None
+
+logger = get_logger(__name__)
+
+TRANSCRIPT_STORE_SUFFIX = ".transcripts.jsonl"
+COLUMNS = ("video_id", "text", "segments", "source")
+
+
+def transcript_store_path(path, channel_name: str) -> Path:
+    return Path(path) / f"{channel_name}{TRANSCRIPT_STORE_SUFFIX}"
+
+
+def text_hash(text: str) -> str:
+    """逐字稿內容的雜湊，與舊版以 json.dump 寫成的 .txt 檔案的 sha256 相同（既有的 manifest 不需重建）"""
+    return hashlib.sha256(json.dumps(text).encode("utf-8")).hexdigest()
+
+
+class TranscriptStore:
+    """
+    一個頻道的逐字稿：單一 JSONL 檔，每行一支影片 {"video_id", "text", "segments", "source"}
+
+    segments 為 [[start, end, text], ...]（秒）。只附加不覆寫，同一支影片以最後一行為準。
+    旁邊的 .index.json 記錄每支影片最新一行的位置（offset, length）與內容雜湊，
+    因此隨機讀取一支影片只需一次 seek，列出影片與雜湊不需讀取資料檔；
+    資料檔比索引新時（其他程序寫入、中斷）只掃描尾端補上。寫入以檔案鎖互斥，可由多個程序同時寫入。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.index_path = self.path.with_suffix(".index.json")
+        self.lock_path = self.path.with_suffix(".lock")
+        self._lock = threading.RLock()
+        self._entries: Dict[str, List] = {}
+        self._size = 0
+        self._inode = None
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, encoding="utf-8") as f:
+                    index = json.load(f)
+                self._entries = index["videos"]
+                self._size = index["size"]
+                self._inode = index["inode"]
+            except (ValueError, KeyError):
+                logger.warning(f"ignoring corrupt transcript index {self.index_path}")
+        self._refresh()
+
+    @contextlib.contextmanager
+    def _write_lock(self):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.lock_path, "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        """讓記憶體中的索引追上資料檔"""
+        with self._lock:
+            if not self.path.exists():
+                self._entries, self._size, self._inode = {}, 0, None
+                return
+            stat = os.stat(self.path)
+            if stat.st_ino != self._inode or stat.st_size < self._size:
+                # 資料檔被壓縮或替換，重建索引
+                self._entries, self._size, self._inode = {}, 0, stat.st_ino
+            if stat.st_size > self._size:
+                self._scan_tail()
+
+    def _scan_tail(self) -> None:
+        with open(self.path, "rb") as f:
+            f.seek(self._size)
+            offset = self._size
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # 寫到一半的最後一行，下次寫入前截掉
+                    break
+                try:
+                    record = json.loads(line)
+                    self._entries[record["video_id"]] = [offset, len(line), text_hash(record["text"])]
+                except (ValueError, KeyError):
+                    logger.warning(f"skipping malformed line at byte {offset} of {self.path}")
+                offset += len(line)
+            self._size = offset
+
+    def _save_index(self) -> None:
+        tmp_path = self.index_path.with_name(self.index_path.name + f".tmp-{os.getpid()}-{threading.get_ident()}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"size": self._size, "inode": self._inode, "videos": self._entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._entries)
+
+    def __contains__(self, video_id: str) -> bool:
+        self._refresh()
+        return video_id in self._entries
+
+    def video_ids(self) -> List[str]:
+        self._refresh()
+        return sorted(self._entries)
+
+    def hashes(self) -> Dict[str, str]:
+        """{video_id: 內容雜湊}，只讀索引"""
+        self._refresh()
+        return {video_id: entry[2] for video_id, entry in self._entries.items()}
+
+    def get_hash(self, video_id: str) -> Optional[str]:
+        self._refresh()
+        entry = self._entries.get(video_id)
+        return entry[2] if entry else None
+
+    def get(self, video_id: str) -> Optional[Dict]:
+        self._refresh()
+        entry = self._entries.get(video_id)
+        if entry is None:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(entry[0])
+            return json.loads(f.read(entry[1]))
+
+    def get_text(self, video_id: str) -> Optional[str]:
+        record = self.get(video_id)
+        return record["text"] if record else None
+
+    def scan(self, columns: Optional[Sequence[str]] = None,
+             video_ids: Optional[Iterable[str]] = None) -> Iterator[Dict]:
+        """
+        依檔案順序讀出每支影片的最新紀錄，只保留 columns 中的欄位（video_id 一律保留）
+
+        指定 video_ids 時只讀這些影片（依檔案位置排序後循序讀取）。
+        """
+        self._refresh()
+        if video_ids is None:
+            entries = list(self._entries.values())
+        else:
+            entries = [self._entries[video_id] for video_id in video_ids if video_id in self._entries]
+        keep = None if columns is None else {"video_id", *columns}
+        with open(self.path, "rb") if entries else contextlib.nullcontext() as f:
+            for offset, length, _ in sorted(entries):
+                f.seek(offset)
+                record = json.loads(f.read(length))
+                yield record if keep is None else {key: record.get(key) for key in keep}
+
+    def column(self, name: str) -> Dict[str, Any]:
+        """{video_id: 欄位值}"""
+        return {record["video_id"]: record[name] for record in self.scan([name])}
+
+    def put(self, video_id: str, text: str, segments: Optional[List] = None, source: Optional[str] = None) -> None:
+        self.put_many([{"video_id": video_id, "text": text, "segments": segments or [], "source": source}])
+
+    def put_many(self, records: List[Dict]) -> None:
+        """一次附加多支影片的紀錄並更新索引"""
+        if not records:
+            return
+        lines = [json.dumps({column: record.get(column) for column in COLUMNS}, ensure_ascii=False)
+                 .encode("utf-8") + b"\n" for record in records]
+        with self._write_lock():
+            self._refresh()
+            with open(self.path, "ab") as f:
+                # 先截掉上次中斷時寫到一半的行
+                if f.tell() > self._size:
+                    f.truncate(self._size)
+                    f.seek(self._size)
+                offset = self._size
+                for record, line in zip(records, lines):
+                    f.write(line)
+                    self._entries[record["video_id"]] = [offset, len(line), text_hash(record["text"])]
+                    offset += len(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._size = offset
+            self._inode = os.stat(self.path).st_ino
+            self._save_index()
+
+    def compact(self) -> int:
+        """重寫資料檔，只保留每支影片的最新紀錄，回傳減少的位元組數"""
+        with self._write_lock():
+            self._refresh()
+            if not self._entries:
+                return 0
+            before = self._size
+            tmp_path = self.path.with_name(self.path.name + f".tmp-{os.getpid()}")
+            entries: Dict[str, List] = {}
+            offset = 0
+            with open(self.path, "rb") as src, open(tmp_path, "wb") as dst:
+                for video_id, (old_offset, length, content_hash) in sorted(self._entries.items(),
+                                                                           key=lambda item: item[1][0]):
+                    src.seek(old_offset)
+                    dst.write(src.read(length))
+                    entries[video_id] = [offset, length, content_hash]
+                    offset += length
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(tmp_path, self.path)
+            self._entries, self._size, self._inode = entries, offset, os.stat(self.path).st_ino
+            self._save_index()
+            return before - offset
+
+    def import_text_files(self, text_dir, source: str = "legacy") -> int:
+        """匯入舊版每支影片一個 .txt（json.dump 的字串）的逐字稿，已在 store 中的影片略過，回傳匯入數"""
+        text_dir = Path(text_dir)
+        if not text_dir.is_dir():
+            return 0
+        self._refresh()
+        records = []
+        for name in sorted(os.listdir(text_dir)):
+            video_id = name.split(".")[0]
+            if not name.endswith(".txt") or video_id in self._entries:
+                continue
+            try:
+                with open(text_dir / name, encoding="utf8") as f:
+                    records.append({"video_id": video_id, "text": json.load(f), "segments": [], "source": source})
+            except ValueError as e:
+                logger.error(f"cannot import {name}: {e}")
+        self.put_many(records)
+        if records:
+            logger.info(f"imported {len(records)} text files from {text_dir} into {self.path.name}")
+        return len(records)
+
+
+def open_transcript_store(text_dir, channel_name: str) -> TranscriptStore:
+    """開啟頻道的逐字稿 store（text_dir/{channel}.transcripts.jsonl），並匯入舊版 text_dir/{channel}/*.txt"""
+    store = TranscriptStore(transcript_store_path(text_dir, channel_name))
+    store.import_text_files(Path(text_dir) / channel_name)
+    return store
@@ -0,0 +1,128 @@
+import queue
+import threading
+import time
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class WorkQueue:
+    """
+    工作佇列介面
+
+    工作以（名稱, 可 JSON 序列化的 payload）表示，處理函數透過 register 註冊，
+    因此可以替換成本地 broker 等跨程序的實作而不需修改呼叫端。
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, Callable[[Dict], None]] = {}
+
+    def register(self, name: str, fn: Callable[[Dict], None]) -> None:
+        self._handlers[name] = fn
+
+    def has_capacity(self, n: int = 1) -> bool:
+        raise NotImplementedError
+
+    def submit(self, name: str, payload: Dict, key: Optional[str] = None) -> bool:
+        """放入佇列，佇列已滿時回傳 False 讓呼叫端回應背壓；相同 key 的工作依序處理"""
+        return self.submit_batch(name, [(key, payload)])
+
+    def submit_batch(self, name: str, jobs: List[Tuple[Optional[str], Dict]]) -> bool:
+        """整批放入 [(key, payload)]，容量不足時整批拒絕，不會只放入一部分"""
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict:
+        raise NotImplementedError
+
+
+class InProcessWorkQueue(WorkQueue):
+    """
+    程序內有界佇列 + 固定數量的工作執行緒
+
+    每個執行緒有自己的佇列，相同 key 的工作（如同一聊天室的訊息）一律交給同一個執行緒，
+    因此依放入的順序處理、不會同時執行；沒有 key 的工作輪流分配。容量以所有佇列的總數計算。
+    執行緒在第一次 submit 時才啟動，避免在 gunicorn fork 前建立。
+    """
+
+    def __init__(self, workers: int = 4, max_size: int = 100):
+        super().__init__()
+        self.workers = workers
+        self.max_size = max_size
+        self._queues: List["queue.Queue"] = [queue.Queue() for _ in range(workers)]
+        self._pending = 0
+        self._next_worker = 0
+        self._threads = []
+        self._lock = threading.Lock()
+        self.stats = {
+            "submitted": 0, "rejected": 0, "completed": 0, "failed": 0,
+            "max_depth": 0, "wait_seconds": 0.0, "run_seconds": 0.0,
+        }
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, args=(self._queues[i],),
+                                          name=f"work-queue-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self, jobs: "queue.Queue") -> None:
+        while True:
+            name, payload, enqueued = jobs.get()
+            t1 = time.time()
+            try:
+                self._handlers[name](payload)
+                failed = False
+            except Exception as e:
+                logger.error(f"job {name} failed: {type(e).__name__} - {str(e)}")
+                failed = True
+            finally:
+                jobs.task_done()
+            with self._lock:
+                self._pending -= 1
+                self.stats["failed" if failed else "completed"] += 1
+                self.stats["wait_seconds"] += t1 - enqueued
+                self.stats["run_seconds"] += time.time() - t1
+
+    def _worker_for(self, key: Optional[str]) -> int:
+        if key is None:
+            self._next_worker = (self._next_worker + 1) % self.workers
+            return self._next_worker
+        return zlib.crc32(key.encode("utf-8")) % self.workers
+
+    def has_capacity(self, n: int = 1) -> bool:
+        with self._lock:
+            return self._pending + n <= self.max_size
+
+    def submit_batch(self, name: str, jobs: List[Tuple[Optional[str], Dict]]) -> bool:
+        if name not in self._handlers:
+            raise KeyError(f"no handler registered for {name}")
+        self._start()
+        enqueued = time.time()
+        with self._lock:
+            # 先為整批保留容量再放入
+            if self._pending + len(jobs) > self.max_size:
+                self.stats["rejected"] += len(jobs)
+                return False
+            self._pending += len(jobs)
+            for key, payload in jobs:
+                self._queues[self._worker_for(key)].put((name, payload, enqueued))
+            self.stats["submitted"] += len(jobs)
+            self.stats["max_depth"] = max(self.stats["max_depth"], self._pending)
+        return True
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            done = self.stats["completed"] + self.stats["failed"]
+            return {
+                **self.stats,
+                "depth": self._pending,
+                "workers": self.workers,
+                "avg_wait_ms": 1000 * self.stats["wait_seconds"] / done if done else 0.0,
+                "avg_run_ms": 1000 * self.stats["run_seconds"] / done if done else 0.0,
+            }
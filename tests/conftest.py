@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# 將專案根目錄加入 Python 路徑以供匯入 src.utils
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
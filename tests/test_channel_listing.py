@@ -0,0 +1,92 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from src.utils.channel_listing import (
+    BROWSE_URL, ChannelListing, extract_videos, parse_client_config, parse_initial_data
+)
+
+FIXTURE = Path(__file__).parent / "fixtures" / "channel_listing"
+
+
+def read_page():
+    return (FIXTURE / "videos_page.html").read_text(encoding="utf-8")
+
+
+def read_browse(name):
+    with open(FIXTURE / name, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class FakeHttp:
+    """回傳儲存的頁面與 continuation 回應，記錄送出的 token"""
+
+    def __init__(self):
+        self.tokens = []
+        self.urls = []
+
+    def get_text(self, url):
+        self.urls.append(url)
+        return read_page()
+
+    def post_json(self, url, payload):
+        self.urls.append(url)
+        self.tokens.append(payload["continuation"])
+        return read_browse({"4qmFsgJhEhhVQ-page2": "browse_page2.json",
+                            "4qmFsgJhEhhVQ-page3": "browse_page3.json"}[payload["continuation"]])
+
+
+def test_parse_initial_data_stops_at_end_of_object():
+    data = parse_initial_data(read_page())
+    assert data["header"]["pageHeaderRenderer"]["pageTitle"] == "Cofit211"
+
+
+def test_parse_initial_data_missing():
+    with pytest.raises(ValueError):
+        parse_initial_data("<html><body>no data</body></html>")
+
+
+def test_parse_client_config():
+    assert parse_client_config(read_page()) == {"client_version": "2.20240520.01.00", "api_key": "AIzaSyFAKEKEY"}
+
+
+def test_extract_videos_from_page():
+    videos, token = extract_videos(parse_initial_data(read_page()))
+    # 兩種版面都取出、重複的影片與播放清單略過、維持頁面順序
+    assert [video["video_id"] for video in videos] == ["vid00000001", "vid00000002", "vid00000003"]
+    assert videos[2]["title"] == "新版面的影片"
+    assert videos[0]["video_url"] == "https://www.youtube.com/watch?v=vid00000001"
+    assert token == "4qmFsgJhEhhVQ-page2"
+
+
+def test_extract_videos_from_continuation():
+    videos, token = extract_videos(read_browse("browse_page2.json"))
+    assert [video["video_id"] for video in videos] == ["vid00000004", "vid00000005"]
+    assert token == "4qmFsgJhEhhVQ-page3"
+
+    videos, token = extract_videos(read_browse("browse_page3.json"))
+    assert [video["video_id"] for video in videos] == ["vid00000006"]
+    assert token is None
+
+
+def test_list_videos_follows_continuations():
+    http = FakeHttp()
+    videos = ChannelListing(http, rate=1000).list_videos("Cofit211")
+    assert [video["video_id"] for video in videos] == [f"vid0000000{i}" for i in range(1, 7)]
+    assert http.tokens == ["4qmFsgJhEhhVQ-page2", "4qmFsgJhEhhVQ-page3"]
+    assert http.urls[1] == BROWSE_URL + "?key=AIzaSyFAKEKEY"
+
+
+def test_list_videos_incremental_stops_at_known_video():
+    http = FakeHttp()
+    videos = ChannelListing(http, rate=1000).list_videos("Cofit211", known_ids={"vid00000004"})
+    assert [video["video_id"] for video in videos] == ["vid00000001", "vid00000002", "vid00000003"]
+    # 已知的影片在第二頁，不會再請求第三頁
+    assert http.tokens == ["4qmFsgJhEhhVQ-page2"]
+
+
+def test_list_videos_max_pages():
+    http = FakeHttp()
+    videos = ChannelListing(http, rate=1000).list_videos("Cofit211", max_pages=1)
+    assert len(videos) == 3 and http.tokens == []
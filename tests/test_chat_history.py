@@ -0,0 +1,78 @@
+import pytest
+
+from src.utils.chat_history import RESET_SENTINEL, BlobHistoryBacking, ChatHistoryStore
+from src.utils.storage import LocalStorage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorage(tmp_path)
+
+
+def user_inputs(store, chat_room_id):
+    return [turn["user_input"] for turn in store.get_turns(chat_room_id)]
+
+
+def test_keeps_only_the_last_turns():
+    store = ChatHistoryStore(max_turns=3)
+    for i in range(5):
+        store.append("room", f"q{i}", f"a{i}")
+    assert user_inputs(store, "room") == ["q2", "q3", "q4"]
+    assert store.get_turns("other") == []
+
+
+def test_reset_clears_history():
+    store = ChatHistoryStore()
+    store.append("room", "q0", "a0")
+    store.reset("room")
+    assert store.get_turns("room") == []
+    store.append("room", "q1", "a1")
+    history, last_turn = store.format_history("room")
+    assert "q0" not in history and "使用者: q1" in history
+    assert last_turn == "使用者: q1\nAI: a1"
+
+
+def test_persisted_history_is_shared_between_instances(storage):
+    writer = ChatHistoryStore(backing=BlobHistoryBacking(storage, prefix="p"))
+    reader = ChatHistoryStore(backing=BlobHistoryBacking(storage, prefix="p"))
+    writer.append("room", "q0", "a0")
+    assert user_inputs(reader, "room") == ["q0"]
+    # 讀取端已快取，寫入後版本號改變需重新讀取
+    writer.append("room", "q1", "a1")
+    assert user_inputs(reader, "room") == ["q0", "q1"]
+    assert storage.exists("p/rooms/room.json")
+
+
+def test_concurrent_writers_do_not_lose_updates(storage):
+    first = ChatHistoryStore(backing=BlobHistoryBacking(storage, prefix="p"), revalidate=False)
+    second = ChatHistoryStore(backing=BlobHistoryBacking(storage, prefix="p"), revalidate=False)
+    first.append("room", "q0", "a0")
+    second.append("room", "q1", "a1")
+    # first 的快取版本已過期，條件式寫入失敗後重新讀取再套用
+    first.append("room", "q2", "a2")
+    fresh = ChatHistoryStore(backing=BlobHistoryBacking(storage, prefix="p"))
+    assert user_inputs(fresh, "room") == ["q0", "q1", "q2"]
+
+
+def test_rebuild_from_records(storage):
+    records = [
+        {"timestamp": "2026-01-01 10:00:00", "chat_room_id": "a", "user_input": "q0", "gpt_output": "a0"},
+        {"timestamp": "2026-01-01 10:01:00", "chat_room_id": "b", "user_input": "q1", "gpt_output": "a1"},
+        {"timestamp": "2026-01-01 10:02:00", "chat_room_id": "a", "user_input": RESET_SENTINEL, "gpt_output": RESET_SENTINEL},
+        {"timestamp": "2026-01-01 10:03:00", "chat_room_id": "a", "user_input": "q2", "gpt_output": "a2"},
+    ]
+    store = ChatHistoryStore(backing=BlobHistoryBacking(storage, prefix="p"))
+    assert store.rebuild_from_records(records) == 2
+    fresh = ChatHistoryStore(backing=BlobHistoryBacking(storage, prefix="p"))
+    assert user_inputs(fresh, "a") == ["q2"]
+    assert user_inputs(fresh, "b") == ["q1"]
+
+
+def test_peek_has_history_only_looks_at_the_cache(storage):
+    ChatHistoryStore(backing=BlobHistoryBacking(storage, prefix="p")).append("room", "q0", "a0")
+    store = ChatHistoryStore(backing=BlobHistoryBacking(storage, prefix="p"))
+    assert store.peek_has_history("room") is None
+    store.get_turns("room")
+    assert store.peek_has_history("room") is True
+    store.reset("room")
+    assert store.peek_has_history("room") is False
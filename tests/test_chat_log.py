@@ -0,0 +1,133 @@
+import json
+import time
+from datetime import datetime
+
+import pytest
+
+from src.utils.chat_log import SegmentedChatLog, decode_rows, encode_rows
+from src.utils.storage import LocalStorage
+
+CLOSED_HOUR = datetime(2026, 1, 1, 10, 15)
+OPEN_HOUR = datetime(2026, 1, 1, 12, 1)
+NOW = datetime(2026, 1, 1, 12, 30)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorage(tmp_path)
+
+
+def append(log, n, timestamp, room="room"):
+    for i in range(n):
+        log.append(f"q{i}", f"a{i}", room, timestamp=timestamp)
+
+
+def test_rows_round_trip_with_commas_and_newlines():
+    rows = [{"timestamp": "2026-01-01 10:00:00", "chat_room_id": "U1", "user_input": "a,b\n\"c\"", "gpt_output": "ok"}]
+    assert list(decode_rows(encode_rows(rows) + encode_rows(rows))) == rows * 2
+
+
+def test_iter_records_reads_legacy_compacted_then_segments(storage):
+    storage.write_bytes("legacy.csv", b"timestamp,chat_room_id,user_input,gpt_output\n2025-12-31 09:00:00,r,old,x\n")
+    log = SegmentedChatLog(storage, prefix="p", legacy_name="legacy.csv")
+    append(log, 2, CLOSED_HOUR)
+    log.compact(now=NOW)
+    append(log, 1, OPEN_HOUR)
+    assert [record["user_input"] for record in log.iter_records()] == ["old", "q0", "q1", "q0"]
+
+
+def test_compact_merges_only_closed_hours(storage):
+    log = SegmentedChatLog(storage, prefix="p")
+    append(log, 40, CLOSED_HOUR)  # 超過一次 compose 的來源上限
+    append(log, 2, OPEN_HOUR)
+    assert log.compact(now=NOW) == 40
+    assert storage.list_names("p/compacted/") == ["p/compacted/2026010110.csv"]
+    assert len(storage.list_names("p/segments/")) == 2
+    assert len(list(log.iter_records())) == 42
+    # 租約在結束後釋放
+    assert not storage.exists(log.lease_name)
+
+
+def test_compact_appends_to_existing_compacted_file(storage):
+    log = SegmentedChatLog(storage, prefix="p")
+    append(log, 3, CLOSED_HOUR)
+    log.compact(now=NOW)
+    append(log, 2, CLOSED_HOUR)
+    assert log.compact(now=NOW) == 2
+    assert [record["user_input"] for record in log.iter_records()] == ["q0", "q1", "q2", "q0", "q1"]
+
+
+def test_compact_skips_while_another_instance_holds_the_lease(storage):
+    log = SegmentedChatLog(storage, prefix="p")
+    other = SegmentedChatLog(storage, prefix="p")
+    append(log, 3, CLOSED_HOUR)
+    token, _ = other._acquire_lease()
+    assert log.compact(now=NOW) == 0
+    assert len(storage.list_names("p/segments/")) == 3
+    other._release_lease(token)
+    assert log.compact(now=NOW) == 3
+
+
+def test_expired_lease_is_taken_over(storage):
+    log = SegmentedChatLog(storage, prefix="p")
+    append(log, 2, CLOSED_HOUR)
+    storage.write_bytes(log.lease_name, json.dumps({"token": "crashed", "expires": time.time() - 1}).encode())
+    assert log.compact(now=NOW) == 2
+    assert not storage.exists(log.lease_name)
+
+
+def test_lease_taken_over_by_another_instance_is_not_released(storage):
+    log = SegmentedChatLog(storage, prefix="p")
+    token, _ = log._acquire_lease()
+    storage.write_bytes(log.lease_name, json.dumps({"token": "other", "expires": time.time() + 60}).encode())
+    log._release_lease(token)
+    assert storage.exists(log.lease_name)
+
+
+def test_compact_stops_before_the_lease_expires(storage):
+    log = SegmentedChatLog(storage, prefix="p", lease_seconds=0)
+    append(log, 2, CLOSED_HOUR)
+    assert log.compact(now=NOW) == 0
+    assert len(storage.list_names("p/segments/")) == 2
+
+
+class RacingStorage(LocalStorage):
+    """compose 前讓「另一個實例」先改寫目的物件或刪除來源片段"""
+
+    def __init__(self, root, race):
+        super().__init__(root)
+        self.race = race
+
+    def compose(self, sources, destination, content_type="text/csv", if_generation_match=None):
+        race, self.race = self.race, None
+        if race is not None:
+            race(self, sources, destination)
+        return super().compose(sources, destination, content_type, if_generation_match)
+
+
+def test_compose_conflict_does_not_duplicate_rows(tmp_path):
+    storage = RacingStorage(tmp_path, lambda s, sources, destination: s.compose(sources, destination))
+    log = SegmentedChatLog(storage, prefix="p")
+    append(log, 2, CLOSED_HOUR)
+    # 目的物件的版本號已改變，這一輪放棄，片段保留
+    assert log.compact(now=NOW) == 0
+    assert len(storage.list_names("p/segments/")) == 2
+
+
+def test_missing_source_segment_skips_the_hour(tmp_path):
+    storage = RacingStorage(tmp_path, lambda s, sources, destination: s.delete(sources[:1]))
+    log = SegmentedChatLog(storage, prefix="p")
+    append(log, 2, CLOSED_HOUR)
+    assert log.compact(now=NOW) == 0
+    assert not storage.exists("p/compacted/2026010110.csv")
+
+
+def test_maybe_compact_runs_in_background_and_not_on_cold_start(storage):
+    log = SegmentedChatLog(storage, prefix="p")
+    append(log, 2, CLOSED_HOUR)
+    assert log.maybe_compact() is None
+    log._last_compaction = 0.0
+    thread = log.maybe_compact()
+    assert thread is not None and log.maybe_compact() is None
+    thread.join(timeout=10)
+    assert storage.list_names("p/segments/") == []
@@ -0,0 +1,36 @@
+import numpy as np
+
+from src.utils.dense_index import dense_index_path, export_dense_index
+from src.utils.hybrid_retriever import HybridRetriever, save_hybrid_indexes
+from src.utils.retriever import RetrieverCache
+
+
+class FakeCollection:
+    """只提供 export_dense_index 需要的 count / get"""
+
+    def __init__(self, n, dim=8):
+        self.ids = [f"d{i}" for i in range(n)]
+        self.embeddings = np.random.default_rng(0).random((n, dim)).tolist()
+
+    def count(self):
+        return len(self.ids)
+
+    def get(self, include, limit, offset):
+        rows = slice(offset, offset + limit)
+        return {"ids": self.ids[rows], "embeddings": self.embeddings[rows],
+                "documents": [f"doc {doc_id}" for doc_id in self.ids[rows]],
+                "metadatas": [{"video_id": doc_id} for doc_id in self.ids[rows]]}
+
+
+def test_hybrid_backend_reloads_after_the_sparse_index_is_merged(tmp_path):
+    export_dense_index(FakeCollection(4), dense_index_path(tmp_path, "c"))
+    save_hybrid_indexes(tmp_path, "c", ["d0"], [{"1": 1.0}])
+    retriever = RetrieverCache(tmp_path, "c", check_interval=0, backend="hybrid")
+    first = retriever.get_collection()
+    assert isinstance(first, HybridRetriever) and first.sparse.ids == ["d0"]
+    assert retriever.get_collection() is first
+
+    save_hybrid_indexes(tmp_path, "c", ["d1"], [{"1": 1.0}])
+    second = retriever.get_collection()
+    assert second is not first
+    assert sorted(second.sparse.ids) == ["d0", "d1"]
@@ -0,0 +1,113 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+from src.utils.hybrid_retriever import append_hybrid_segment, hybrid_segments_path, merge_hybrid_segments
+from src.utils.sparse_index import ColbertStore, SparseIndex, colbert_index_path, sparse_index_path
+
+QUERY = {str(token): 1.0 for token in range(50)}
+
+
+def random_weights(rng, n):
+    return [{str(rng.randrange(50)): rng.random() for _ in range(rng.randrange(0, 6))} for _ in range(n)]
+
+
+def random_vectors(rng, n, dim=8):
+    return [np.random.default_rng(rng.randrange(1 << 30)).random((rng.randrange(1, 4), dim)) for _ in range(n)]
+
+
+def scores_by_id(index):
+    return dict(zip(index.ids, index.scores(QUERY)))
+
+
+def assert_same_scores(got, expected):
+    assert sorted(got.ids) == sorted(expected.ids)
+    a, b = scores_by_id(got), scores_by_id(expected)
+    assert all(a[doc_id] == pytest.approx(b[doc_id], abs=1e-5) for doc_id in a)
+
+
+def test_scores_sum_matching_token_weights():
+    index = SparseIndex.from_lexical_weights(["a", "b"], [{"1": 0.5, "2": 0.25}, {"2": 1.0}])
+    np.testing.assert_allclose(index.scores({"1": 2.0, "2": 1.0, "9": 1.0}), [1.25, 1.0], rtol=1e-3)
+    np.testing.assert_allclose(SparseIndex.empty().scores({"1": 1.0}), [])
+
+
+def test_replace_and_delete():
+    index = SparseIndex.from_lexical_weights(["a", "b", "c"], [{"1": 1.0}, {"1": 2.0}, {"1": 3.0}])
+    index = index.add(["b"], [{"2": 1.0}], delete_ids=["c", "missing"])
+    assert index.ids == ["a", "b"]
+    # b 的舊權重被整個取代
+    np.testing.assert_allclose(index.scores({"1": 1.0}), [1.0, 0.0], rtol=1e-3)
+
+
+def test_merge_equals_sequential_add():
+    rng = random.Random(1)
+    sequential = SparseIndex.empty()
+    segments = []
+    for _ in range(6):
+        ids = list(dict.fromkeys(f"d{rng.randrange(20)}" for _ in range(5)))
+        delete_ids = [f"d{rng.randrange(20)}" for _ in range(2)]
+        weights = random_weights(rng, len(ids))
+        sequential = sequential.add(ids, weights, delete_ids)
+        segments.append((SparseIndex.from_lexical_weights(ids, weights), delete_ids))
+    assert_same_scores(SparseIndex.empty().merge(segments), sequential)
+
+
+def test_later_segment_wins_over_earlier_delete():
+    first = SparseIndex.from_lexical_weights(["a"], [{"1": 1.0}])
+    second = SparseIndex.from_lexical_weights(["a"], [{"1": 2.0}])
+    merged = SparseIndex.empty().merge([(first, []), (SparseIndex.empty(), ["a"]), (second, [])])
+    assert scores_by_id(merged) == {"a": pytest.approx(2.0, rel=1e-3)}
+
+
+def test_save_and_load_round_trip(tmp_path):
+    rng = random.Random(2)
+    ids = [f"d{i}" for i in range(10)]
+    index = SparseIndex.from_lexical_weights(ids, random_weights(rng, 10))
+    index.save(tmp_path / "sparse")
+    assert_same_scores(SparseIndex.load(tmp_path / "sparse"), index)
+
+    vectors = random_vectors(rng, 10)
+    store = ColbertStore.empty(8).add(ids, vectors)
+    store.save(tmp_path / "colbert")
+    loaded = ColbertStore.load(tmp_path / "colbert")
+    query = np.random.default_rng(0).random((3, 8))
+    np.testing.assert_allclose(loaded.maxsim(query, range(10)), store.maxsim(query, range(10)))
+
+
+def test_hybrid_segments_merge_into_the_indexes(tmp_path):
+    rng = random.Random(3)
+    sparse, colbert = SparseIndex.empty(), ColbertStore.empty(8)
+    for _ in range(4):
+        ids = list(dict.fromkeys(f"d{rng.randrange(20)}" for _ in range(5)))
+        delete_ids = [f"d{rng.randrange(20)}"]
+        weights, vectors = random_weights(rng, len(ids)), random_vectors(rng, len(ids))
+        sparse, colbert = sparse.add(ids, weights, delete_ids), colbert.add(ids, vectors, delete_ids)
+        append_hybrid_segment(tmp_path, "c", ids, weights, vectors, delete_ids)
+    # 只有刪除、沒有 colbert 向量的片段
+    append_hybrid_segment(tmp_path, "c", [], [], delete_ids=[sparse.ids[0]])
+    sparse, colbert = sparse.add([], [], [sparse.ids[0]]), colbert.add([], [], [sparse.ids[0]])
+
+    assert merge_hybrid_segments(tmp_path, "c") == 5
+    assert_same_scores(SparseIndex.load(sparse_index_path(tmp_path, "c")), sparse)
+    merged_colbert = ColbertStore.load(colbert_index_path(tmp_path, "c"))
+    assert sorted(merged_colbert.ids) == sorted(colbert.ids)
+    assert list(hybrid_segments_path(tmp_path, "c").iterdir()) == []
+    assert merge_hybrid_segments(tmp_path, "c") == 0
+
+
+def test_incomplete_segments_are_left_for_the_next_merge(tmp_path):
+    append_hybrid_segment(tmp_path, "c", ["a"], [{"1": 1.0}])
+    append_hybrid_segment(tmp_path, "c", ["b"], [{"1": 1.0}])
+    incomplete = sorted(hybrid_segments_path(tmp_path, "c").iterdir())[-1]
+    (incomplete / "delete_ids.json").unlink()
+    assert merge_hybrid_segments(tmp_path, "c") == 1
+    assert SparseIndex.load(sparse_index_path(tmp_path, "c")).ids == ["a"]
+    assert list(hybrid_segments_path(tmp_path, "c").iterdir()) == [incomplete]
+    # 寫完之後在下一次合併時套用
+    with open(incomplete / "delete_ids.json", "w", encoding="utf-8") as f:
+        json.dump([], f)
+    assert merge_hybrid_segments(tmp_path, "c") == 1
+    assert sorted(SparseIndex.load(sparse_index_path(tmp_path, "c")).ids) == ["a", "b"]
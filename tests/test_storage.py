@@ -0,0 +1,60 @@
+import pytest
+
+from src.utils.storage import LocalStorage, PreconditionFailed
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorage(tmp_path)
+
+
+def test_generation_increments_on_every_write(storage):
+    assert storage.generation("a/x.json") == 0
+    first = storage.write_bytes("a/x.json", b"1", if_generation_match=0)
+    # 同一個時間粒度內的連續寫入也必須得到不同的版本號
+    second = storage.write_bytes("a/x.json", b"2", if_generation_match=first)
+    assert second == first + 1
+    assert storage.read_with_generation("a/x.json") == (b"2", second)
+
+
+def test_stale_generation_is_rejected(storage):
+    first = storage.write_bytes("a/x.json", b"1")
+    storage.write_bytes("a/x.json", b"2", if_generation_match=first)
+    with pytest.raises(PreconditionFailed):
+        storage.write_bytes("a/x.json", b"3", if_generation_match=first)
+    assert storage.read_bytes("a/x.json") == b"2"
+
+
+def test_create_only_if_absent(storage):
+    storage.write_bytes("lock", b"a", if_generation_match=0)
+    with pytest.raises(PreconditionFailed):
+        storage.write_bytes("lock", b"b", if_generation_match=0)
+
+
+def test_generation_not_reused_after_delete(storage):
+    first = storage.write_bytes("a/x.json", b"1")
+    storage.delete(["a/x.json", "a/missing.json"])
+    assert storage.generation("a/x.json") == 0 and storage.read_bytes("a/x.json") is None
+    assert storage.write_bytes("a/x.json", b"2", if_generation_match=0) > first
+
+
+def test_list_names_hides_bookkeeping_files(storage):
+    storage.write_bytes("p/segments/1.csv", b"a")
+    storage.write_bytes("p/segments/2.csv", b"b")
+    storage.write_bytes("p/other.csv", b"c")
+    assert storage.list_names("p/segments/") == ["p/segments/1.csv", "p/segments/2.csv"]
+    assert storage.list_names("p/") == ["p/other.csv", "p/segments/1.csv", "p/segments/2.csv"]
+    assert storage.list_names("missing/") == []
+
+
+def test_compose(storage):
+    storage.write_bytes("s/1", b"a,")
+    storage.write_bytes("s/2", b"b")
+    storage.compose(["s/1", "s/2"], "out", if_generation_match=0)
+    assert storage.read_bytes("out") == b"a,b"
+    generation = storage.generation("out")
+    with pytest.raises(PreconditionFailed):
+        storage.compose(["s/1"], "out", if_generation_match=0)
+    with pytest.raises(FileNotFoundError):
+        storage.compose(["out", "s/missing"], "out", if_generation_match=generation)
+    assert storage.read_bytes("out") == b"a,b"
@@ -0,0 +1,35 @@
+from src.utils.streaming_pipeline import StreamingPipeline, StreamStage
+
+
+def test_items_flow_through_all_stages():
+    outputs = []
+    pipeline = StreamingPipeline([
+        StreamStage("double", lambda x: x * 2, workers=2),
+        StreamStage("skip_odd_input", lambda batch: [x + 1 if x % 4 == 0 else None for x in batch],
+                    batch_size=3, max_wait=0.05),
+    ])
+    result = pipeline.run(range(10), on_output=lambda item, latency: outputs.append(item))
+    assert sorted(outputs) == [1, 5, 9, 13, 17]
+    assert result["items"] == 10 and result["completed"] == 5
+    assert result["stages"]["double"]["processed"] == 10
+
+
+def test_failures_are_isolated_per_item():
+    def fail_on_three(x):
+        if x == 3:
+            raise ValueError("boom")
+        return x
+
+    outputs = []
+    result = StreamingPipeline([StreamStage("check", fail_on_three)]).run(
+        range(5), on_output=lambda item, latency: outputs.append(item))
+    assert sorted(outputs) == [0, 1, 2, 4]
+    assert result["stages"]["check"]["processed"] == 4 and result["stages"]["check"]["failed"] == 1
+
+
+def test_batch_with_wrong_number_of_results_fails_as_a_whole():
+    outputs = []
+    stage = StreamStage("short", lambda batch: batch[:-1], batch_size=4, max_wait=1.0)
+    result = StreamingPipeline([stage]).run(range(4), on_output=lambda item, latency: outputs.append(item))
+    assert outputs == []
+    assert result["stages"]["short"]["failed"] == 4 and result["stages"]["short"]["processed"] == 0
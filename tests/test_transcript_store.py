@@ -0,0 +1,87 @@
+import hashlib
+import json
+
+import pytest
+
+from src.utils.transcript_store import TranscriptStore, open_transcript_store, text_hash, transcript_store_path
+
+
+@pytest.fixture
+def path(tmp_path):
+    return transcript_store_path(tmp_path, "channel")
+
+
+def test_put_get_and_scan(path):
+    store = TranscriptStore(path)
+    store.put("v1", "第一支", [[0.0, 1.5, "第一支"]], source="subtitles")
+    store.put_many([{"video_id": "v2", "text": "第二支"}, {"video_id": "v3", "text": "第三支"}])
+    assert len(store) == 3 and "v2" in store and "v9" not in store
+    assert store.get("v1") == {"video_id": "v1", "text": "第一支", "segments": [[0.0, 1.5, "第一支"]],
+                               "source": "subtitles"}
+    assert store.get("v9") is None
+    assert [record["video_id"] for record in store.scan(["text"])] == ["v1", "v2", "v3"]
+    assert list(store.scan(["source"], video_ids=["v3", "v9"])) == [{"video_id": "v3", "source": None}]
+    assert store.column("text") == {"v1": "第一支", "v2": "第二支", "v3": "第三支"}
+
+
+def test_last_write_wins_and_hash_matches_legacy_files(path):
+    store = TranscriptStore(path)
+    store.put("v1", "old")
+    store.put("v1", "new")
+    assert store.get_text("v1") == "new" and len(store) == 1
+    # 與舊版 json.dump 寫成的 .txt 的 sha256 相同
+    assert store.get_hash("v1") == text_hash("new") == hashlib.sha256(b'"new"').hexdigest()
+    assert TranscriptStore(path).hashes() == {"v1": text_hash("new")}
+
+
+def test_half_written_line_is_ignored_then_truncated(path):
+    TranscriptStore(path).put("v1", "one")
+    with open(path, "ab") as f:
+        f.write(b'{"video_id": "v2", "text": "tr')
+    store = TranscriptStore(path)
+    assert store.video_ids() == ["v1"]
+    store.put("v3", "three")
+    with open(path, "rb") as f:
+        lines = f.read().splitlines()
+    assert [json.loads(line)["video_id"] for line in lines] == ["v1", "v3"]
+    assert TranscriptStore(path).get_text("v3") == "three"
+
+
+def test_index_catches_up_with_other_writers(path):
+    store = TranscriptStore(path)
+    store.put("v1", "one")
+    TranscriptStore(path).put("v2", "two")
+    with open(path, "ab") as f:
+        f.write(json.dumps({"video_id": "v3", "text": "three"}).encode("utf-8") + b"\n")
+    assert store.video_ids() == ["v1", "v2", "v3"]
+    assert store.get_text("v3") == "three"
+
+
+def test_compact_keeps_the_latest_records(path):
+    store = TranscriptStore(path)
+    for i in range(3):
+        store.put("v1", f"version {i}")
+    store.put("v2", "two")
+    reader = TranscriptStore(path)
+    assert store.compact() > 0
+    with open(path, "rb") as f:
+        assert len(f.read().splitlines()) == 2
+    # 其他實例發現資料檔被替換後重建索引
+    assert reader.get_text("v1") == "version 2" and reader.get_text("v2") == "two"
+    assert TranscriptStore(path).video_ids() == ["v1", "v2"]
+
+
+def test_import_text_files(tmp_path):
+    legacy_dir = tmp_path / "channel"
+    legacy_dir.mkdir()
+    for video_id, text in (("v1", "one"), ("v2", "two")):
+        with open(legacy_dir / f"{video_id}.txt", "w", encoding="utf8") as f:
+            json.dump(text, f)
+    (legacy_dir / "notes.md").write_text("ignored")
+    store = open_transcript_store(tmp_path, "channel")
+    assert store.video_ids() == ["v1", "v2"]
+    assert store.get("v1")["source"] == "legacy"
+    store.put("v1", "updated")
+    # 已匯入的影片不會被舊檔覆蓋
+    assert store.import_text_files(legacy_dir) == 0
+    assert open_transcript_store(tmp_path, "channel").get_text("v1") == "updated"
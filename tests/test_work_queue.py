@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+from src.utils.work_queue import InProcessWorkQueue
+
+
+def wait_until_done(work_queue, timeout=10):
+    deadline = time.time() + timeout
+    while work_queue.get_stats()["depth"] and time.time() < deadline:
+        time.sleep(0.01)
+    assert work_queue.get_stats()["depth"] == 0
+
+
+def test_unknown_job_raises():
+    with pytest.raises(KeyError):
+        InProcessWorkQueue().submit("missing", {})
+
+
+def test_batch_is_rejected_as_a_whole_when_over_capacity():
+    release = threading.Event()
+    work_queue = InProcessWorkQueue(workers=1, max_size=3)
+    work_queue.register("job", lambda payload: release.wait(10))
+    assert work_queue.submit_batch("job", [(None, {}), (None, {})])
+    assert not work_queue.has_capacity(2)
+    assert not work_queue.submit_batch("job", [(None, {}), (None, {})])
+    stats = work_queue.get_stats()
+    assert stats["submitted"] == 2 and stats["rejected"] == 2 and stats["depth"] == 2
+    release.set()
+    wait_until_done(work_queue)
+    assert work_queue.submit_batch("job", [(None, {})] * 3)
+    wait_until_done(work_queue)
+
+
+def test_jobs_with_the_same_key_run_in_order_and_never_overlap():
+    work_queue = InProcessWorkQueue(workers=4, max_size=1000)
+    lock = threading.Lock()
+    seen, running = {}, set()
+    overlaps = []
+
+    def handle(payload):
+        key = payload["key"]
+        with lock:
+            if key in running:
+                overlaps.append(key)
+            running.add(key)
+        time.sleep(0.001)
+        with lock:
+            running.discard(key)
+            seen.setdefault(key, []).append(payload["i"])
+
+    work_queue.register("job", handle)
+    for i in range(50):
+        assert work_queue.submit_batch("job", [(key, {"key": key, "i": i}) for key in ("a", "b", "c")])
+    wait_until_done(work_queue)
+    assert overlaps == []
+    assert seen == {key: list(range(50)) for key in ("a", "b", "c")}
+
+
+def test_failed_jobs_are_counted_and_do_not_stop_the_worker():
+    work_queue = InProcessWorkQueue(workers=1, max_size=10)
+
+    def handle(payload):
+        if payload["fail"]:
+            raise ValueError("boom")
+
+    work_queue.register("job", handle)
+    work_queue.submit_batch("job", [(None, {"fail": True}), (None, {"fail": False})])
+    wait_until_done(work_queue)
+    stats = work_queue.get_stats()
+    assert stats["failed"] == 1 and stats["completed"] == 1 and stats["max_depth"] == 2